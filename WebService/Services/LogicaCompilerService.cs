@@ -1,20 +1,27 @@
+using System.Collections.Concurrent;
 using System.Diagnostics;
 using System.Text.Json;
 using WebService.Models;
 
 namespace WebService.Services;
 
-public class LogicaCompilerService
+public class LogicaCompilerService : IDisposable
 {
     private readonly string _logicaPath;
     private readonly string _pythonPath;
     private readonly string _compilerScript;
+    private readonly int _poolSize;
+    private readonly ConcurrentBag<CompilerWorker> _idleWorkers = new();
+    private readonly SemaphoreSlim _available;
+    private bool _disposed;
 
-    public LogicaCompilerService(string? logicaPath = null, string? pythonPath = null)
+    public LogicaCompilerService(string? logicaPath = null, string? pythonPath = null, int? poolSize = null)
     {
         _logicaPath = logicaPath ?? GetDefaultLogicaPath();
         _pythonPath = pythonPath ?? GetDefaultPythonPath();
         _compilerScript = Path.Combine(_logicaPath, "WebService", "compile_logica.py");
+        _poolSize = poolSize ?? GetDefaultPoolSize();
+        _available = new SemaphoreSlim(_poolSize, _poolSize);
     }
 
     private static string GetDefaultLogicaPath()
@@ -59,10 +66,30 @@ public class LogicaCompilerService
         return "python";
     }
 
+    private static int GetDefaultPoolSize()
+    {
+        // Number of long-lived compiler processes kept warm.
+        var envSize = Environment.GetEnvironmentVariable("LOGICA_COMPILER_WORKERS");
+        if (int.TryParse(envSize, out var size) && size > 0)
+        {
+            return size;
+        }
+
+        return Math.Clamp(Environment.ProcessorCount, 1, 4);
+    }
+
     public LogicaResponse CompileToSql(LogicaRequest request, string dialect)
     {
+        _available.Wait();
+        CompilerWorker? worker = null;
         try
         {
+            if (!_idleWorkers.TryTake(out worker) || !worker.IsAlive)
+            {
+                worker?.Dispose();
+                worker = new CompilerWorker(_pythonPath, _compilerScript, _logicaPath);
+            }
+
             var inputJson = JsonSerializer.Serialize(new
             {
                 program = request.Program,
@@ -70,41 +97,16 @@ public class LogicaCompilerService
                 dialect = dialect
             });
 
-            var psi = new ProcessStartInfo
-            {
-                FileName = _pythonPath,
-                Arguments = $"\"{_compilerScript}\"",
-                WorkingDirectory = _logicaPath,
-                RedirectStandardInput = true,
-                RedirectStandardOutput = true,
-                RedirectStandardError = true,
-                UseShellExecute = false,
-                CreateNoWindow = true
-            };
-
-            using var process = Process.Start(psi);
-            if (process == null)
-            {
-                return new LogicaResponse
-                {
-                    Success = false,
-                    Error = "Failed to start Python process"
-                };
-            }
-
-            process.StandardInput.Write(inputJson);
-            process.StandardInput.Close();
-
-            var output = process.StandardOutput.ReadToEnd();
-            var error = process.StandardError.ReadToEnd();
-            process.WaitForExit();
-
-            if (process.ExitCode != 0 || !string.IsNullOrEmpty(error))
+            var output = worker.Send(inputJson);
+            if (output == null)
             {
+                var error = worker.DrainErrors();
+                worker.Dispose();
+                worker = null;
                 return new LogicaResponse
                 {
                     Success = false,
-                    Error = string.IsNullOrEmpty(error) ? output : error
+                    Error = string.IsNullOrEmpty(error) ? "Compiler process exited unexpectedly" : error
                 };
             }
 
@@ -131,11 +133,120 @@ public class LogicaCompilerService
         }
         catch (Exception ex)
         {
+            // The protocol state of the worker is unknown, do not reuse it.
+            worker?.Dispose();
+            worker = null;
             return new LogicaResponse
             {
                 Success = false,
                 Error = ex.Message
             };
         }
+        finally
+        {
+            if (worker != null)
+            {
+                if (_disposed)
+                {
+                    worker.Dispose();
+                }
+                else
+                {
+                    _idleWorkers.Add(worker);
+                }
+            }
+            _available.Release();
+        }
+    }
+
+    public void Dispose()
+    {
+        _disposed = true;
+        while (_idleWorkers.TryTake(out var worker))
+        {
+            worker.Dispose();
+        }
+        GC.SuppressFinalize(this);
+    }
+
+    /// <summary>
+    /// A long-lived compile_logica.py process in --server mode, exchanging
+    /// one line of JSON per request and per response.
+    /// </summary>
+    private sealed class CompilerWorker : IDisposable
+    {
+        private readonly Process _process;
+        private readonly ConcurrentQueue<string> _errors = new();
+
+        public CompilerWorker(string pythonPath, string compilerScript, string workingDirectory)
+        {
+            var psi = new ProcessStartInfo
+            {
+                FileName = pythonPath,
+                Arguments = $"\"{compilerScript}\" --server",
+                WorkingDirectory = workingDirectory,
+                RedirectStandardInput = true,
+                RedirectStandardOutput = true,
+                RedirectStandardError = true,
+                UseShellExecute = false,
+                CreateNoWindow = true
+            };
+
+            _process = Process.Start(psi)
+                ?? throw new InvalidOperationException("Failed to start Python process");
+
+            // Stderr must be drained continuously, otherwise a chatty
+            // compiler fills the pipe and blocks.
+            _process.ErrorDataReceived += (_, e) =>
+            {
+                if (e.Data == null)
+                {
+                    return;
+                }
+                _errors.Enqueue(e.Data);
+                while (_errors.Count > 200 && _errors.TryDequeue(out _))
+                {
+                }
+            };
+            _process.BeginErrorReadLine();
+        }
+
+        public bool IsAlive => !_process.HasExited;
+
+        public string? Send(string requestJson)
+        {
+            _process.StandardInput.WriteLine(requestJson);
+            _process.StandardInput.Flush();
+            return _process.StandardOutput.ReadLine();
+        }
+
+        public string DrainErrors()
+        {
+            var lines = new List<string>();
+            while (_errors.TryDequeue(out var line))
+            {
+                lines.Add(line);
+            }
+            return string.Join(Environment.NewLine, lines);
+        }
+
+        public void Dispose()
+        {
+            try
+            {
+                if (!_process.HasExited)
+                {
+                    _process.StandardInput.Close();
+                    if (!_process.WaitForExit(2000))
+                    {
+                        _process.Kill();
+                    }
+                }
+            }
+            catch (InvalidOperationException)
+            {
+            }
+            _process.Dispose();
+        }
     }
 }
@@ -2,6 +2,10 @@ import sys
 import os
 import json
 import re
+import argparse
+import contextlib
+import signal
+import socket
 
 # Add the repository root to sys.path
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -60,12 +64,19 @@ def compile_to_sql(program_text, predicate_name, dialect='mssql'):
                 'error': f"Unsupported dialect: '{dialect}'. Supported: {', '.join(SUPPORTED_DIALECTS)}"
             }
 
+        from common import compile_cache
         from parser_py import parse
         from compiler import universe
 
         # Prepare program with dialect annotation
         prepared_program = prepare_program_with_dialect(program_text, dialect)
 
+        cache = compile_cache.GetDefaultCache()
+        if cache:
+            compiled = cache.Compile(prepared_program, predicate_name,
+                                     engine=dialect)
+            return {'success': True, 'sql': compiled.formatted_sql}
+
         parsed = parse.ParseFile(prepared_program)
         rules = parsed.get('rule', [])
 
@@ -80,7 +91,147 @@ def compile_to_sql(program_text, predicate_name, dialect='mssql'):
         return {'success': False, 'error': traceback.format_exc()}
 
 
-if __name__ == '__main__':
+def warm_up():
+    """Import the compiler modules and compile a tiny program per dialect.
+
+    Done once at server start so that the first real request does not pay
+    for imports and for parsing the dialect libraries.
+    """
+    for dialect in SUPPORTED_DIALECTS:
+        compile_to_sql('WarmUp(x: 1);', 'WarmUp', dialect)
+    from common import compile_cache
+    cache = compile_cache.GetDefaultCache()
+    if cache:
+        cache.Clear()
+
+
+def handle_request_line(line):
+    """Compiles one line-delimited JSON request and returns the response line.
+
+    The request is an object with 'program', 'predicate' and optional
+    'dialect' and 'id' fields. The 'id' is echoed back so that clients can
+    match responses to requests. A request {"command": "stats"} returns
+    counters of the compilation cache (enabled by LOGICA_COMPILE_CACHE).
+    """
+    request_id = None
+    try:
+        input_data = json.loads(line)
+        request_id = input_data.get('id')
+        if input_data.get('command') == 'stats':
+            return json.dumps(cache_stats(request_id)) + '\n'
+        dialect = input_data.get('dialect', 'mssql')
+        # Compiler may print warnings, they must not corrupt the protocol.
+        with contextlib.redirect_stdout(sys.stderr):
+            result = compile_to_sql(
+                input_data['program'],
+                input_data['predicate'],
+                dialect
+            )
+    except Exception as e:
+        result = {'success': False, 'error': f'Bad request: {e}'}
+    if request_id is not None:
+        result['id'] = request_id
+    return json.dumps(result) + '\n'
+
+
+def cache_stats(request_id=None):
+    """Returns hit/miss counters of the compilation cache, if enabled."""
+    from common import compile_cache
+    cache = compile_cache.GetDefaultCache()
+    result = {'success': True,
+              'cache': cache.Stats() if cache else None}
+    if request_id is not None:
+        result['id'] = request_id
+    return result
+
+
+def serve_stdio():
+    """Serves requests from stdin, one JSON object per line, until EOF."""
+    output = sys.stdout
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        output.write(handle_request_line(line))
+        output.flush()
+
+
+def serve_connection(connection):
+    """Serves line-delimited requests on a single socket connection."""
+    with connection, connection.makefile('rw', encoding='utf-8') as stream:
+        for line in stream:
+            if not line.strip():
+                continue
+            stream.write(handle_request_line(line))
+            stream.flush()
+
+
+def serve_socket(socket_path, workers):
+    """Serves requests on a Unix socket with a pre-forked pool of workers.
+
+    Modules are imported and warmed up before forking, so every worker
+    starts warm. Each worker accepts connections from the shared listening
+    socket and serves one connection at a time.
+    """
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(64)
+
+    def accept_loop():
+        while True:
+            connection, _ = server.accept()
+            try:
+                serve_connection(connection)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    children = []
+    for _ in range(workers - 1):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                accept_loop()
+            finally:
+                os._exit(0)
+        children.append(pid)
+    # Let the finally clause below stop the workers on termination.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        accept_loop()
+    finally:
+        for pid in children:
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+        server.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(socket_path)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Compile Logica programs to SQL.')
+    parser.add_argument(
+        '--server', action='store_true',
+        help='Run as a long-lived server reading line-delimited JSON '
+             'requests from stdin and writing responses to stdout.')
+    parser.add_argument(
+        '--socket', metavar='PATH',
+        help='Run as a long-lived server listening on a Unix socket.')
+    parser.add_argument(
+        '--workers', type=int, default=1,
+        help='Number of worker processes for --socket mode.')
+    args = parser.parse_args(argv)
+
+    if args.server or args.socket:
+        with contextlib.redirect_stdout(sys.stderr):
+            warm_up()
+        if args.socket:
+            serve_socket(args.socket, max(1, args.workers))
+        else:
+            serve_stdio()
+        return
+
     input_data = json.loads(sys.stdin.read())
     dialect = input_data.get('dialect', 'mssql')
     result = compile_to_sql(
@@ -89,3 +240,7 @@ if __name__ == '__main__':
         dialect
     )
     print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
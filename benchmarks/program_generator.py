@@ -0,0 +1,115 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Synthetic Logica programs for benchmarking the compiler.
+
+Each generator stresses one dimension of a program and returns a
+dictionary from file path to file content. The main program is in
+'main.l' and defines predicate Test. Other files are imported by
+the main program, relative to the directory where the files are written.
+"""
+
+
+def Predicates(n):
+  """Chain of n predicates, each defined by the previous one."""
+  lines = ['P0(x:, y: x * 2) :- x in Range(10);']
+  for i in range(1, n):
+    lines.append('P%d(x:, y:) :- P%d(x:, y:), x > %d;' % (i, i - 1, i % 5))
+  lines.append('Test(x:, y:) :- P%d(x:, y:);' % (n - 1))
+  return {'main.l': '\n'.join(lines)}
+
+
+def FanIn(k):
+  """Predicate with a body of k atoms, joining k predicates."""
+  lines = []
+  for i in range(k):
+    lines.append('A%d(x:, v: x + %d) :- x in Range(5);' % (i, i))
+  body = ', '.join('A%d(x:, v: v%d)' % (i, i) for i in range(k))
+  total = ' + '.join('v%d' % i for i in range(k))
+  lines.append('Test(x:, total: %s) :- %s;' % (total, body))
+  return {'main.l': '\n'.join(lines)}
+
+
+def ImportDepth(d):
+  """Chain of d files, each importing a predicate of the previous one."""
+  files = {'lib/lib0.l': 'L0(x:) :- x in Range(5);'}
+  for i in range(1, d):
+    files['lib/lib%d.l' % i] = (
+        'import lib.lib%d.L%d;\nL%d(x:) :- L%d(x:);' % (i - 1, i - 1, i, i - 1))
+  files['main.l'] = 'import lib.lib%d.L%d;\nTest(x:) :- L%d(x:);' % (
+      d - 1, d - 1, d - 1)
+  return files
+
+
+def MakeChain(n):
+  """Chain of n functor applications, each built from the previous one."""
+  lines = ['B0(x:) :- x in Range(3);',
+           'F0(x:) :- B0(x:);']
+  for i in range(1, n):
+    lines.append('B%d(x:) :- x in Range(%d);' % (i, i + 3))
+    lines.append('F%d := F%d(B%d: B%d);' % (i, i - 1, i - 1, i))
+  lines.append('Test(x:) :- F%d(x:);' % (n - 1))
+  return {'main.l': '\n'.join(lines)}
+
+
+def RecursionDepth(depth):
+  """Transitive closure, unfolded to the given depth."""
+  lines = ['@Recursive(Path, %d);' % depth,
+           'Edge(a:, b: a + 1) :- a in Range(10);',
+           'Path(a:, b:) distinct :- Edge(a:, b:);',
+           'Path(a:, b:) distinct :- Path(a:, b: c), Edge(a: c, b:);',
+           'Test(a:, b:) :- Path(a:, b:);']
+  return {'main.l': '\n'.join(lines)}
+
+
+def RecordNesting(depth):
+  """Record nested to the given depth, which is built and taken apart."""
+  record = 'x'
+  for i in range(depth):
+    record = '{f%d: %s, g%d: x + %d}' % (i, record, i, i)
+  access = 'r' + ''.join('.f%d' % i for i in reversed(range(depth)))
+  lines = ['R(r: %s) :- x in Range(5);' % record,
+           'Test(r:, x: %s) :- R(r:);' % access]
+  return {'main.l': '\n'.join(lines)}
+
+
+def Aggregations(n):
+  """Predicate with n aggregated columns."""
+  operators = ['+=', 'Max=', 'Min=', 'Count=']
+  columns = ', '.join('a%d? %s x + %d' % (i, operators[i % len(operators)], i)
+                      for i in range(n))
+  lines = ['D(g: x % 3, x:) :- x in Range(20);',
+           'Test(g:, %s) distinct :- D(g:, x:);' % columns]
+  return {'main.l': '\n'.join(lines)}
+
+
+# Benchmark cases: name, generator and its parameter.
+CASES = [
+    ('predicates_10', Predicates, 10),
+    ('predicates_100', Predicates, 100),
+    ('fan_in_5', FanIn, 5),
+    ('fan_in_30', FanIn, 30),
+    ('import_depth_3', ImportDepth, 3),
+    ('import_depth_15', ImportDepth, 15),
+    ('make_chain_3', MakeChain, 3),
+    ('make_chain_12', MakeChain, 12),
+    ('recursion_depth_5', RecursionDepth, 5),
+    ('recursion_depth_30', RecursionDepth, 30),
+    ('record_nesting_3', RecordNesting, 3),
+    ('record_nesting_12', RecordNesting, 12),
+    ('aggregations_5', Aggregations, 5),
+    ('aggregations_40', Aggregations, 40),
+]
@@ -0,0 +1,201 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks of the compiler on synthetic programs.
+
+Times the phases of compilation separately for each program and dialect:
+  parse: parse.ParseFile, including imports.
+  program: LogicaProgram construction for the Test predicate, i.e. tree
+    shaking, unfolding, functors, type inference and UDFs.
+  sql: FormattedPredicateSql of the Test predicate.
+Peak memory of the whole compilation is measured in a separate run, as
+tracing allocations slows compilation down.
+
+Results are compared against a stored baseline, and the run fails if a
+phase got slower than the threshold allows.
+
+Usage, from the repository root:
+  python benchmarks/run_benchmarks.py
+  python benchmarks/run_benchmarks.py --update_baseline
+  python benchmarks/run_benchmarks.py --dialects=psql --cases=make_chain
+
+Parsed imports are cached in memory within the process, set
+LOGICA_IMPORT_CACHE=off to parse them on each repetition.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Benchmarks are run as a script, so the repository root is added to path.
+script_dir = os.path.dirname(os.path.abspath(__file__))
+repo_root = os.path.dirname(script_dir)
+if repo_root not in sys.path:
+  sys.path.insert(0, repo_root)
+
+from benchmarks import program_generator
+from common import sqlite3_logica
+from compiler import universe
+from parser_py import parse
+
+DEFAULT_BASELINE = os.path.join(script_dir, 'baseline.json')
+DEFAULT_DIALECTS = ['sqlite', 'duckdb', 'psql', 'bigquery']
+PHASES = ['parse', 'program', 'sql']
+
+
+def WriteProgram(files, directory, dialect):
+  """Writes files of the program, returns text of the main program."""
+  for path, content in files.items():
+    full_path = os.path.join(directory, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, 'w', encoding='utf-8') as w:
+      w.write(content)
+  return '@Engine("%s");\n' % dialect + files['main.l']
+
+
+def Compile(program_text, import_root):
+  """Compiles Test predicate, returning seconds spent in each phase."""
+  seconds = {}
+  start = time.perf_counter()
+  rules = parse.ParseFile(program_text, import_root=import_root)['rule']
+  seconds['parse'] = time.perf_counter() - start
+  start = time.perf_counter()
+  program = universe.LogicaProgram(rules, required_predicates=['Test'])
+  seconds['program'] = time.perf_counter() - start
+  start = time.perf_counter()
+  program.FormattedPredicateSql('Test')
+  seconds['sql'] = time.perf_counter() - start
+  return seconds
+
+
+def RunBenchmark(files, dialect, repetitions):
+  """Returns fastest time of each phase and peak memory of compilation."""
+  with tempfile.TemporaryDirectory(prefix='logica_benchmark_') as directory:
+    program_text = WriteProgram(files, directory, dialect)
+    timings = [Compile(program_text, directory) for _ in range(repetitions)]
+    tracemalloc.start()
+    try:
+      Compile(program_text, directory)
+      _, peak = tracemalloc.get_traced_memory()
+    finally:
+      tracemalloc.stop()
+  result = {phase: min(t[phase] for t in timings) for phase in PHASES}
+  result['peak_kb'] = peak // 1024
+  return result
+
+
+def Regressions(results, baseline, threshold, min_seconds):
+  """Returns descriptions of phases that got slower than the baseline.
+
+  Phases that take less than min_seconds are too noisy to compare. A
+  benchmark that fails to compile is a regression, unless it failed in
+  the baseline too.
+  """
+  regressions = []
+  for key, result in results.items():
+    if key not in baseline:
+      continue
+    if 'error' in result:
+      if 'error' not in baseline[key]:
+        regressions.append('%s: %s' % (key, result['error']))
+      continue
+    for phase in PHASES:
+      before, now = baseline[key].get(phase), result[phase]
+      if before is None or now < min_seconds:
+        continue
+      if now > before * (1 + threshold):
+        regressions.append('%s %s: %.4fs -> %.4fs (+%d%%)' % (
+            key, phase, before, now, round(100 * (now / before - 1))))
+  return regressions
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(
+      description='Benchmark the Logica compiler on synthetic programs.')
+  parser.add_argument(
+      '--dialects', default=','.join(DEFAULT_DIALECTS),
+      help='Comma separated dialects to compile to.')
+  parser.add_argument(
+      '--cases', default='',
+      help='Comma separated substrings, only matching cases are run.')
+  parser.add_argument(
+      '--repetitions', type=int, default=5,
+      help='Compilations of each program, the fastest one is reported.')
+  parser.add_argument(
+      '--baseline', default=DEFAULT_BASELINE,
+      help='JSON file with results to compare against.')
+  parser.add_argument(
+      '--update_baseline', action='store_true',
+      help='Write results to the baseline file instead of comparing.')
+  parser.add_argument(
+      '--threshold', type=float, default=0.25,
+      help='Allowed relative slowdown of a phase.')
+  parser.add_argument(
+      '--min_seconds', type=float, default=0.02,
+      help='Phases faster than this are not compared.')
+  args = parser.parse_args(argv)
+
+  dialects = args.dialects.split(',')
+  case_filters = [c for c in args.cases.split(',') if c]
+  results = {}
+  rows = []
+  for name, generator, size in program_generator.CASES:
+    if case_filters and not any(c in name for c in case_filters):
+      continue
+    files = generator(size)
+    for dialect in dialects:
+      key = '%s/%s' % (name, dialect)
+      try:
+        result = RunBenchmark(files, dialect, args.repetitions)
+      except Exception as e:
+        result = {'error': '%s: %s' % (type(e).__name__, e)}
+        rows.append([key, 'ERROR', '', '', ''])
+      else:
+        rows.append([key] + ['%.4f' % result[p] for p in PHASES] +
+                    [result['peak_kb']])
+      results[key] = result
+  print(sqlite3_logica.ArtisticTable(
+      ['benchmark'] + ['%s, s' % p for p in PHASES] + ['peak, KB'], rows))
+
+  if args.update_baseline:
+    with open(args.baseline, 'w', encoding='utf-8') as w:
+      json.dump(results, w, indent=1, sort_keys=True)
+      w.write('\n')
+    print('Baseline written to %s.' % args.baseline)
+    return 0
+
+  if not os.path.exists(args.baseline):
+    print('No baseline at %s, run with --update_baseline.' % args.baseline)
+    return 0
+  with open(args.baseline, encoding='utf-8') as f:
+    baseline = json.load(f)
+  regressions = Regressions(results, baseline, args.threshold,
+                            args.min_seconds)
+  if regressions:
+    print('Regressions over %d%% threshold:' % round(100 * args.threshold))
+    for r in regressions:
+      print('  ' + r)
+    return 1
+  print('No regressions over %d%% threshold.' % round(100 * args.threshold))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -16,6 +16,8 @@
 
 """Library for using Logica in CoLab."""
 
+import contextlib
+import copy
 from decimal import Decimal
 import getpass
 import json
@@ -23,6 +25,7 @@ import re
 
 from .common import color
 from .common import concertina_lib
+from .common import connection_pool
 from .common import duckdb_logica
 from .common import psql_logica
 
@@ -73,6 +76,8 @@ PROJECT = None
 # TODO: Should this be renamed to PSQL_ENGINE, PSQL_CONNECTION?
 DB_ENGINE = None
 DB_CONNECTION = None
+# Pool of connections to PostgreSQL, used instead of DB_CONNECTION when set.
+DB_CONNECTION_POOL = None
 
 USER_AUTHENTICATED = False
 
@@ -91,31 +96,54 @@ DEFAULT_ENGINE = 'duckdb'
 
 CLINGO_AD_HOC_PROTECTION = True
 
+# Number of predicates to run at once, when the engine allows it.
+MAX_PARALLELISM = 1
+
 def SetPreamble(preamble):
   global PREAMBLE
   PREAMBLE = preamble
 
+def SetMaxParallelism(max_parallelism):
+  global MAX_PARALLELISM
+  MAX_PARALLELISM = max_parallelism
+
 def SetProject(project):
   global PROJECT
   PROJECT = project
 
 def SetDbConnection(connection):
   global DB_CONNECTION
+  global DB_CONNECTION_POOL
   DB_CONNECTION = connection
+  DB_CONNECTION_POOL = None
 
 REMEMBERED_PREVIOUS_MODE = None
 def ConnectToPostgres(mode='interactive'):
   global REMEMBERED_PREVIOUS_MODE
+  global DB_CONNECTION_POOL
   if mode == 'reconnect':
     mode = REMEMBERED_PREVIOUS_MODE
     print('Reconnecting to Postgres.')
   else:
     REMEMBERED_PREVIOUS_MODE = mode
-  connection = psql_logica.ConnectToPostgres(mode)
-  SetDbConnection(connection)
+  pool = psql_logica.ConnectionPool(mode)
+  # Connecting right away, so that a wrong address or password shows up now.
+  with pool.Connection():
+    pass
+  DB_CONNECTION_POOL = pool
   global DEFAULT_ENGINE
   DEFAULT_ENGINE = 'psql'
 
+
+@contextlib.contextmanager
+def PostgresConnection():
+  """Lends out connection to PostgreSQL, from the pool if there is one."""
+  if DB_CONNECTION_POOL:
+    with DB_CONNECTION_POOL.Connection() as connection:
+      yield connection
+  else:
+    yield DB_CONNECTION
+
 def EnsureAuthenticatedUser():
   global USER_AUTHENTICATED
   global PROJECT
@@ -182,12 +210,9 @@ def RunSQL(sql, engine, connection=None, is_final=False):
     return client.query(sql).to_dataframe()
   elif engine == 'psql':
     if is_final:
-      cursor = psql_logica.PostgresExecute(sql, connection)
-      rows = cursor.fetchall()
-      df = pandas.DataFrame(
-        rows, columns=[d[0] for d in cursor.description])
-      df = df.map(psql_logica.DigestPsqlType)
-      return df
+      stream = psql_logica.CursorStream(
+          psql_logica.PostgresExecute(sql, connection))
+      return pandas.DataFrame(stream.Fetchall(), columns=stream.header)
     else:
       psql_logica.PostgresExecute(sql, connection)
   elif engine == 'duckdb':
@@ -221,12 +246,12 @@ def RunSQL(sql, engine, connection=None, is_final=False):
 
 
 def Ingress(table_name, csv_file_name):
-  with open(csv_file_name) as csv_data_io:
-    cursor = DB_CONNECTION.cursor()
+  with open(csv_file_name) as csv_data_io, PostgresConnection() as connection:
+    cursor = connection.cursor()
     cursor.copy_expert(
       'COPY %s FROM STDIN WITH CSV HEADER' % table_name,
       csv_data_io)
-    DB_CONNECTION.commit()
+    connection.commit()
 
 
 class SqliteRunner(object):
@@ -265,6 +290,13 @@ class PostgresRunner(object):
   def __init__(self):
     global DB_CONNECTION
     global DB_ENGINE
+    if DB_CONNECTION_POOL:
+      # Runner holds a connection from the pool until it's closed, so that
+      # the preamble it runs applies to all of its queries.
+      self.connection_pool = DB_CONNECTION_POOL
+      self.connection = self.connection_pool.Borrow()
+      return
+    self.connection_pool = None
     if not DB_CONNECTION:
       try:
         ConnectToLocalPostgres()  
@@ -285,11 +317,30 @@ class PostgresRunner(object):
       PostgresJumpStart()
     self.connection = DB_CONNECTION
   
+  def WorkerRunner(self):
+    """Returns runner with own connection to the database, for a worker.
+
+    Returns None without a pool, or if the pool has no connection left.
+    """
+    if not self.connection_pool:
+      return None
+    worker_runner = copy.copy(self)
+    try:
+      worker_runner.connection = self.connection_pool.Borrow(timeout=0)
+    except connection_pool.ConnectionPoolTimeout:
+      return None
+    return worker_runner
+
+  def Close(self):
+    """Gives the connection of the runner back to the pool."""
+    if self.connection_pool and self.connection is not None:
+      # Pool replaces connections that got broken.
+      self.connection_pool.Return(
+          self.connection,
+          broken=not self.connection_pool.IsHealthy(self.connection))
+      self.connection = None
+
   def  __call__(self, sql, engine, is_final):
-    global DB_CONNECTION
-    if self.connection and self.connection.closed and REMEMBERED_PREVIOUS_MODE:
-      ConnectToPostgres('reconnect')
-      self.connection = DB_CONNECTION
     return RunSQL(sql, engine, self.connection, is_final)
 
 
@@ -329,7 +380,8 @@ def Logica(line, cell, run_query):
   try:
     program = universe.LogicaProgram(
         parsed_rules,
-        user_flags={'logica_default_engine': DEFAULT_ENGINE})
+        user_flags={'logica_default_engine': DEFAULT_ENGINE},
+        required_predicates=predicates)
   except functors.FunctorError as e:
     e.ShowMessage()
     return
@@ -434,10 +486,14 @@ def Logica(line, cell, run_query):
       result_map = concertina_lib.ExecuteLogicaProgram(
         executions, sql_runner=sql_runner, sql_engine=engine,
         display_mode=DISPLAY_MODE,
-        observer=observer)
+        observer=observer,
+        max_parallelism=MAX_PARALLELISM)
     except infer.TypeErrorCaughtException as e:
       e.ShowMessage()
       return
+    finally:
+      if hasattr(sql_runner, 'Close'):
+        sql_runner.Close()
 
   for idx, predicate in enumerate(predicates):
     t = result_map[predicate]
@@ -19,11 +19,16 @@
 import getpass
 import json
 import os
+import re
 from decimal import Decimal
 
 if '.' not in __package__:
+  from common import connection_pool
+  from common import result_stream
   from type_inference.research import infer
 else:
+  from ..common import connection_pool
+  from ..common import result_stream
   from ..type_inference.research import infer
 
 
@@ -41,12 +46,43 @@ def ClickHouseExecute(sql, connection):
     result = connection.execute(sql, with_column_types=True)
     return ClickHouseCursor(result)
   except Exception as e:
-    error_str = str(e)
-    if 'Unknown table' in error_str or "doesn't exist" in error_str:
-      raise infer.TypeErrorCaughtException(
-          infer.ContextualizedError.BuildNiceMessage(
-              'Running SQL.', 'Undefined table used: ' + error_str))
-    raise e
+    RaiseNiceError(e)
+
+
+def RaiseNiceError(e):
+  """Re-raises error of ClickHouse, explaining undefined tables."""
+  error_str = str(e)
+  if 'Unknown table' in error_str or "doesn't exist" in error_str:
+    raise infer.TypeErrorCaughtException(
+        infer.ContextualizedError.BuildNiceMessage(
+            'Running SQL.', 'Undefined table used: ' + error_str))
+  raise e
+
+
+def ClickHouseStream(sql, connection,
+                     batch_size=result_stream.DEFAULT_BATCH_SIZE):
+  """Execute SQL and stream its result as it arrives from the server.
+
+  Args:
+    sql: SQL query string to execute
+    connection: clickhouse_driver.Client connection
+    batch_size: Number of rows in a batch, also used as the block size
+
+  Returns:
+    result_stream.ResultStream of converted rows
+  """
+  try:
+    rows = connection.execute_iter(
+        sql, with_column_types=True,
+        settings={'max_block_size': batch_size})
+    # First row is names and types of the columns.
+    columns = next(rows, [])
+  except Exception as e:
+    RaiseNiceError(e)
+  return result_stream.FromRowIterator(
+      [c[0] for c in columns], rows, batch_size,
+      column_digests=ClickHouseColumnDigests(columns),
+      arrow_types=ClickHouseArrowTypes(columns))
 
 
 class ClickHouseCursor:
@@ -109,6 +145,67 @@ def DigestClickHouseType(x):
   return x
 
 
+def UnwrapClickHouseType(type_name):
+  """Strips Nullable and LowCardinality wrappers off the type name."""
+  for wrapper in ('Nullable(', 'LowCardinality('):
+    while type_name.startswith(wrapper):
+      type_name = type_name[len(wrapper):-1]
+  return type_name
+
+
+def ClickHouseColumnDigests(columns):
+  """Decides how to digest each column of the result.
+
+  Args:
+    columns: Names and types of the columns, as given by the driver.
+
+  Returns:
+    Column digests for result_stream
+  """
+  digests = []
+  for _, type_name in columns:
+    type_name = UnwrapClickHouseType(type_name)
+    if type_name.startswith('Decimal'):
+      digests.append(result_stream.DigestNumbers)
+    elif type_name.startswith(('Array', 'Tuple', 'Map', 'Nested', 'Object',
+                               'JSON')):
+      digests.append(result_stream.DigestEachValue(DigestClickHouseType))
+    else:
+      digests.append(None)
+  return digests
+
+
+def ClickHouseArrowTypes(columns):
+  """Decides Arrow type of each column of the result.
+
+  Args:
+    columns: Names and types of the columns, as given by the driver.
+
+  Returns:
+    Names of Arrow types of the columns, None where not known.
+  """
+  arrow_types = []
+  for _, type_name in columns:
+    type_name = UnwrapClickHouseType(type_name)
+    if type_name.startswith('Decimal'):
+      # Scale is the last parameter, e.g. Decimal(38, 2) or Decimal64(2).
+      scale = re.search(r'(\d+)\)$', type_name)
+      arrow_types.append(result_stream.DecimalArrowType(
+          int(scale.group(1)) if scale else None))
+    elif re.match(r'(U?Int(8|16|32)|Int64)$', type_name):
+      # UInt64 may not fit, its type is taken from values.
+      arrow_types.append('int64')
+    elif type_name in ('Float32', 'Float64'):
+      arrow_types.append('float64')
+    elif type_name == 'Bool':
+      arrow_types.append('bool')
+    elif type_name == 'String' or type_name.startswith('FixedString'):
+      arrow_types.append('string')
+    else:
+      arrow_types.append(None)
+  return arrow_types
+
+
 # Cache for remembered connection in interactive mode
 REMEMBERED_CONNECTION = None
 
@@ -175,6 +272,34 @@ def ConnectToClickHouse(mode, annotation_params=None):
     assert False, 'Unknown connection mode: ' + mode
 
 
+def PingClickHouse(connection):
+  connection.execute('SELECT 1')
+  return True
+
+
+def ConnectionPool(mode='environment', annotation_params=None):
+  """Returns shared pool of connections to the server of the mode.
+
+  Args:
+    mode: Connection mode - 'environment' or 'annotation'
+    annotation_params: Dict of parameters from @Engine annotation
+
+  Returns:
+    connection_pool.ConnectionPool of clickhouse_driver.Client connections
+  """
+  if mode == 'environment':
+    connection_key = os.environ.get('LOGICA_CLICKHOUSE_CONNECTION')
+  elif mode == 'annotation':
+    connection_key = json.dumps(annotation_params or {}, sort_keys=True)
+  else:
+    assert False, 'Connection mode can not be pooled: ' + mode
+  return connection_pool.GetPool(
+      'clickhouse', connection_key,
+      lambda: ConnectToClickHouse(mode, annotation_params=annotation_params),
+      is_healthy=PingClickHouse,
+      close=lambda connection: connection.disconnect())
+
+
 def FetchResults(cursor):
   """Fetch all results and convert to Python types.
 
@@ -187,4 +312,7 @@ def FetchResults(cursor):
   if cursor.description is None:
     return []
   rows = cursor.fetchall()
-  return [[DigestClickHouseType(cell) for cell in row] for row in rows]
+  if not rows:
+    return []
+  digests = ClickHouseColumnDigests([d[:2] for d in cursor.description])
+  return result_stream.DigestColumns(rows, digests)
@@ -0,0 +1,375 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Content-addressed cache of compiled SQL.
+
+Compilation of a predicate is a pure function of the program text, the
+imported files, the predicate, the engine, the user flags and the compiler
+itself. This module keys compilation results on a hash of all of these and
+keeps them in an in-memory LRU tier and, optionally, in an on-disk tier.
+
+The cache is opt-in. Set LOGICA_COMPILE_CACHE environment variable to
+'memory' to use the in-memory tier only, or to a directory path to also
+persist compiled predicates on disk.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import pickle
+import re
+import tempfile
+import threading
+
+if '.' not in __package__:
+  from common import profiling
+  from compiler import tree_shaking
+  from compiler import universe
+  from parser_py import parse
+else:
+  from ..common import profiling
+  from ..compiler import tree_shaking
+  from ..compiler import universe
+  from ..parser_py import parse
+
+
+# Bump when the layout of CompiledPredicate changes.
+CACHE_FORMAT_VERSION = 1
+
+# Directories with the code that affects compilation output.
+COMPILER_SOURCE_DIRECTORIES = [
+    'compiler', 'parser_py', os.path.join('type_inference', 'research')]
+
+
+class CachedExecution(object):
+  """Execution artifacts of a compiled predicate.
+
+  Provides the subset of universe.Logica interface that is used by runners
+  and by concertina_lib.ExecuteLogicaProgram.
+  """
+
+  def __init__(self, execution):
+    self.main_predicate = execution.main_predicate
+    self.preamble = execution.preamble
+    self.defines_and_exports = list(execution.defines_and_exports)
+    self.main_predicate_sql = execution.main_predicate_sql
+    self.table_to_export_map = dict(execution.table_to_export_map)
+    self.dependency_edges = list(execution.dependency_edges)
+    self.data_dependency_edges = list(execution.data_dependency_edges)
+    self.iterations = execution.iterations
+    self.engine = execution.annotations.Engine()
+    self.engine_settings = (
+        execution.annotations.annotations.get('@Engine', {}).get(
+            self.engine, {}))
+    self.predicate_specific_preamble = execution.PredicateSpecificPreamble(
+        execution.main_predicate)
+
+  def PredicateSpecificPreamble(self, predicate_name):
+    assert predicate_name == self.main_predicate, (
+        'Cached execution only knows preamble of %s, asked for %s.' % (
+            self.main_predicate, predicate_name))
+    return self.predicate_specific_preamble
+
+
+class CompiledPredicate(object):
+  """Formatted SQL of a predicate with its execution artifacts."""
+
+  def __init__(self, formatted_sql, execution):
+    self.formatted_sql = formatted_sql
+    self.execution = execution
+
+  @property
+  def engine(self):
+    return self.execution.engine
+
+
+def NormalizeProgramText(program_text):
+  return program_text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def ImportedFileStrings(program_text):
+  """Returns file import strings of the program, e.g. 'lib.graph'.
+
+  This is a textual scan, so it may over-approximate (e.g. an import in a
+  comment), which only makes the key more specific.
+  """
+  result = []
+  for m in re.finditer(r'(?:^|;)\s*import\s+([\w.]+)', program_text,
+                       flags=re.MULTILINE):
+    parts = m.group(1).split('.')
+    if len(parts) > 1:
+      result.append('.'.join(parts[:-1]))
+  return result
+
+
+def ResolveImportPath(file_import_str, import_root):
+  """Finds file of the import the same way parse.ParseImport does."""
+  relative_path = '/'.join(file_import_str.split('.')) + '.l'
+  roots = import_root if isinstance(import_root, list) else [import_root or '']
+  for root in roots:
+    file_path = os.path.join(root, relative_path)
+    if os.path.exists(file_path):
+      return file_path
+  return None
+
+
+def ImportsFingerprint(program_text, import_root):
+  """Hashes contents of all transitively imported files."""
+  h = hashlib.sha256()
+  seen = set()
+  queue = collections.deque(ImportedFileStrings(program_text))
+  while queue:
+    file_import_str = queue.popleft()
+    if file_import_str in seen:
+      continue
+    seen.add(file_import_str)
+    file_path = ResolveImportPath(file_import_str, import_root)
+    h.update(file_import_str.encode() + b'\0')
+    if file_path is None:
+      h.update(b'<missing>\0')
+      continue
+    with open(file_path, encoding='utf-8') as f:
+      content = NormalizeProgramText(f.read())
+    h.update(file_path.encode() + b'\0' + content.encode() + b'\0')
+    queue.extend(ImportedFileStrings(content))
+  return h.hexdigest()
+
+
+_COMPILER_FINGERPRINT = None
+
+
+def CompilerFingerprint():
+  """Hash of the compiler sources, so that upgrades invalidate disk entries."""
+  global _COMPILER_FINGERPRINT
+  if _COMPILER_FINGERPRINT is None:
+    logica_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    h = hashlib.sha256(str(CACHE_FORMAT_VERSION).encode())
+    for directory in COMPILER_SOURCE_DIRECTORIES:
+      for dirpath, dirnames, filenames in os.walk(
+          os.path.join(logica_root, directory)):
+        dirnames.sort()
+        for filename in sorted(filenames):
+          if filename.endswith('.py') or filename.endswith('.l'):
+            with open(os.path.join(dirpath, filename), 'rb') as f:
+              h.update(filename.encode() + b'\0' + f.read())
+    _COMPILER_FINGERPRINT = h.hexdigest()
+  return _COMPILER_FINGERPRINT
+
+
+def CacheKey(program_text, predicate_name, import_root=None,
+             user_flags=None, engine=None, flag_args=None,
+             required_predicates=None):
+  """Content hash identifying result of compilation.
+
+  Compilations requested from the command line are keyed on the raw flag
+  arguments in flag_args, as their values are not known before parsing,
+  and on all the predicates requested with the predicate, as rules that
+  are not reachable from them are dropped from the program. Whether rules
+  are dropped at all is part of the key too.
+  """
+  program_text = NormalizeProgramText(program_text)
+  key_data = {
+      'compiler': CompilerFingerprint(),
+      'program': hashlib.sha256(program_text.encode()).hexdigest(),
+      'imports': ImportsFingerprint(program_text, import_root),
+      'predicate': predicate_name,
+      'engine': engine,
+      'user_flags': sorted((user_flags or {}).items()),
+      'flag_args': flag_args,
+      'required_predicates': required_predicates,
+      'tree_shaking': tree_shaking.Enabled()
+  }
+  return hashlib.sha256(
+      json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+
+
+def CompileUncached(program_text, predicate_name, import_root=None,
+                    user_flags=None):
+  """Parses and compiles the predicate, returns CompiledPredicate."""
+  rules = parse.ParseFile(NormalizeProgramText(program_text),
+                          import_root=import_root)['rule']
+  program = universe.LogicaProgram(rules, user_flags=user_flags,
+                                   required_predicates=[predicate_name])
+  formatted_sql = program.FormattedPredicateSql(predicate_name)
+  return CompiledPredicate(formatted_sql, CachedExecution(program.execution))
+
+
+def CompileRules(rules, predicate_names, user_flags=None,
+                 required_predicates=None):
+  """Compiles predicates of parsed rules together.
+
+  Program is built for required_predicates, which default to the compiled
+  ones.
+
+  Returns:
+    OrderedDict mapping predicate name to CompiledPredicate.
+  """
+  program = universe.LogicaProgram(
+      rules, user_flags=user_flags,
+      required_predicates=required_predicates or predicate_names)
+  return collections.OrderedDict(
+      (name, CompiledPredicate(formatted_sql, CachedExecution(execution)))
+      for name, (formatted_sql, execution) in
+      program.FormattedPredicatesSql(predicate_names).items())
+
+
+class CompilationCache(object):
+  """Two-tier cache of CompiledPredicate objects.
+
+  Compilation errors are not cached, they propagate to the caller as usual.
+  """
+
+  def __init__(self, max_entries=256, directory=None):
+    self.max_entries = max_entries
+    self.directory = directory
+    self.entries = collections.OrderedDict()
+    self.lock = threading.Lock()
+    self.hits = 0
+    self.disk_hits = 0
+    self.misses = 0
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+
+  def Compile(self, program_text, predicate_name, import_root=None,
+              user_flags=None, engine=None):
+    """Returns CompiledPredicate, compiling only if not in the cache."""
+    key = CacheKey(program_text, predicate_name, import_root=import_root,
+                   user_flags=user_flags, engine=engine)
+    result = self.Lookup(key)
+    if result is not None:
+      return result
+    result = CompileUncached(program_text, predicate_name,
+                             import_root=import_root, user_flags=user_flags)
+    self.Store(key, result)
+    return result
+
+  def CompileCommandLine(self, program_text, predicate_names, flag_args,
+                         read_user_flags, import_root=None):
+    """Compiles predicates requested from command line.
+
+    If all predicates are in the cache, neither the program is parsed nor
+    flags are read. Otherwise the program is parsed, read_user_flags(rules)
+    is called to get values of the flags, which may need the @DefineFlag
+    defaults, and the missing predicates are compiled together, with the
+    same SQL as compiling all the requested predicates together.
+
+    Returns:
+      OrderedDict mapping predicate name to CompiledPredicate.
+    """
+    required_predicates = sorted(set(predicate_names))
+    keys = collections.OrderedDict(
+        (name, CacheKey(program_text, name, import_root=import_root,
+                        flag_args=list(flag_args),
+                        required_predicates=required_predicates))
+        for name in predicate_names)
+    result = collections.OrderedDict(
+        (name, self.Lookup(key)) for name, key in keys.items())
+    missing = [name for name, compiled in result.items() if compiled is None]
+    if missing:
+      with profiling.Phase('parse'):
+        rules = parse.ParseFile(NormalizeProgramText(program_text),
+                                import_root=import_root)['rule']
+      compiled = CompileRules(rules, missing,
+                              user_flags=read_user_flags(rules),
+                              required_predicates=list(keys))
+      for name in missing:
+        self.Store(keys[name], compiled[name])
+        result[name] = compiled[name]
+    return result
+
+  def Lookup(self, key):
+    with self.lock:
+      if key in self.entries:
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return self.entries[key]
+    result = self.ReadFromDisk(key)
+    with self.lock:
+      if result is not None:
+        self.disk_hits += 1
+        self.RememberInMemory(key, result)
+      else:
+        self.misses += 1
+    return result
+
+  def Store(self, key, compiled_predicate):
+    with self.lock:
+      self.RememberInMemory(key, compiled_predicate)
+    self.WriteToDisk(key, compiled_predicate)
+
+  def RememberInMemory(self, key, compiled_predicate):
+    self.entries[key] = compiled_predicate
+    self.entries.move_to_end(key)
+    while len(self.entries) > self.max_entries:
+      self.entries.popitem(last=False)
+
+  def DiskPath(self, key):
+    return os.path.join(self.directory, key[:2], key + '.pickle')
+
+  def ReadFromDisk(self, key):
+    if not self.directory:
+      return None
+    try:
+      with open(self.DiskPath(key), 'rb') as f:
+        return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+      return None
+
+  def WriteToDisk(self, key, compiled_predicate):
+    if not self.directory:
+      return
+    path = self.DiskPath(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Writing to a temporary file and renaming, so that concurrent readers
+    # never observe a partially written entry.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        pickle.dump(compiled_predicate, f)
+      os.replace(tmp_path, path)
+    except OSError:
+      if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+  def Stats(self):
+    with self.lock:
+      return {'hits': self.hits,
+              'disk_hits': self.disk_hits,
+              'misses': self.misses,
+              'entries': len(self.entries)}
+
+  def Clear(self):
+    with self.lock:
+      self.entries.clear()
+      self.hits = self.disk_hits = self.misses = 0
+
+
+_DEFAULT_CACHE = None
+_DEFAULT_CACHE_LOCK = threading.Lock()
+
+
+def GetDefaultCache():
+  """Returns process-wide cache if enabled by LOGICA_COMPILE_CACHE, or None."""
+  global _DEFAULT_CACHE
+  setting = os.environ.get('LOGICA_COMPILE_CACHE')
+  if not setting:
+    return None
+  with _DEFAULT_CACHE_LOCK:
+    if _DEFAULT_CACHE is None:
+      directory = None if setting == 'memory' else setting
+      _DEFAULT_CACHE = CompilationCache(directory=directory)
+  return _DEFAULT_CACHE
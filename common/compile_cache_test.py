@@ -0,0 +1,127 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unitests for compile_cache.py."""
+
+import os
+import tempfile
+import unittest
+
+from common import compile_cache
+from compiler import universe
+from parser_py import parse
+
+
+PROGRAM = """
+@Engine("duckdb");
+Parent(parent: "A", child: "B");
+Parent(parent: "B", child: "C");
+Grandparent(a:, c:) :- Parent(parent: a, child: b), Parent(parent: b, child: c);
+"""
+
+
+class CompileCacheTest(unittest.TestCase):
+  def test_HitReturnsSameSql(self):
+    cache = compile_cache.CompilationCache()
+    expected = compile_cache.CompileUncached(PROGRAM, 'Grandparent')
+    first = cache.Compile(PROGRAM, 'Grandparent')
+    second = cache.Compile(PROGRAM, 'Grandparent')
+    self.assertEqual(first.formatted_sql, expected.formatted_sql)
+    self.assertIs(first, second)
+    self.assertEqual(cache.Stats()['hits'], 1)
+    self.assertEqual(cache.Stats()['misses'], 1)
+    self.assertEqual(second.engine, 'duckdb')
+    self.assertEqual(second.execution.main_predicate, 'Grandparent')
+
+  def test_KeyDependsOnPredicateAndFlags(self):
+    k = compile_cache.CacheKey(PROGRAM, 'Grandparent')
+    self.assertEqual(k, compile_cache.CacheKey(
+        PROGRAM.replace('\n', '\r\n'), 'Grandparent'))
+    self.assertNotEqual(k, compile_cache.CacheKey(PROGRAM, 'Parent'))
+    self.assertNotEqual(k, compile_cache.CacheKey(
+        PROGRAM, 'Grandparent', user_flags={'f': '1'}))
+
+  def test_KeyDependsOnTreeShaking(self):
+    k = compile_cache.CacheKey(PROGRAM, 'Grandparent')
+    os.environ['LOGICA_TREE_SHAKING'] = 'off'
+    try:
+      self.assertNotEqual(k, compile_cache.CacheKey(PROGRAM, 'Grandparent'))
+    finally:
+      del os.environ['LOGICA_TREE_SHAKING']
+    self.assertEqual(k, compile_cache.CacheKey(PROGRAM, 'Grandparent'))
+
+  def test_CommandLineHitReadsNoFlags(self):
+    cache = compile_cache.CompilationCache()
+    read = []
+    def ReadUserFlags(rules):
+      read.append(len(rules))
+      return {}
+    names = ['Grandparent', 'Parent']
+    first = cache.CompileCommandLine(PROGRAM, names, [], ReadUserFlags)
+    second = cache.CompileCommandLine(PROGRAM, names, [], ReadUserFlags)
+    self.assertEqual(list(first), names)
+    self.assertIs(first['Parent'], second['Parent'])
+    self.assertEqual(len(read), 1)
+    cache.CompileCommandLine(PROGRAM, names, ['--f=1'], ReadUserFlags)
+    self.assertEqual(len(read), 2)
+
+  def test_CommandLineSqlIsSqlOfBatch(self):
+    cache = compile_cache.CompilationCache()
+    names = ['Grandparent', 'Parent']
+    cache.CompileCommandLine(PROGRAM, ['Parent'], [], lambda _: {})
+    compiled = cache.CompileCommandLine(PROGRAM, names, [], lambda _: {})
+    rules = parse.ParseFile(PROGRAM)['rule']
+    batch = universe.LogicaProgram(
+        rules, required_predicates=names).FormattedPredicatesSql(names)
+    for name in names:
+      self.assertEqual(compiled[name].formatted_sql, batch[name][0])
+
+  def test_KeyDependsOnImportedFiles(self):
+    with tempfile.TemporaryDirectory() as root:
+      os.makedirs(os.path.join(root, 'lib'))
+      library = os.path.join(root, 'lib', 'family.l')
+      with open(library, 'w') as f:
+        f.write('Parent(parent: "A", child: "B");')
+      program = 'import lib.family.Parent;\nP(x:) :- Parent(parent: x);'
+      k1 = compile_cache.CacheKey(program, 'P', import_root=root)
+      with open(library, 'w') as f:
+        f.write('Parent(parent: "X", child: "Y");')
+      k2 = compile_cache.CacheKey(program, 'P', import_root=root)
+      self.assertNotEqual(k1, k2)
+
+  def test_DiskTier(self):
+    with tempfile.TemporaryDirectory() as directory:
+      compiled = compile_cache.CompilationCache(directory=directory).Compile(
+          PROGRAM, 'Grandparent')
+      cache = compile_cache.CompilationCache(directory=directory)
+      restored = cache.Compile(PROGRAM, 'Grandparent')
+      self.assertEqual(restored.formatted_sql, compiled.formatted_sql)
+      self.assertEqual(restored.execution.table_to_export_map,
+                       compiled.execution.table_to_export_map)
+      self.assertEqual(cache.Stats()['disk_hits'], 1)
+      self.assertEqual(cache.Stats()['misses'], 0)
+
+  def test_LruEviction(self):
+    cache = compile_cache.CompilationCache(max_entries=1)
+    cache.Compile(PROGRAM, 'Grandparent')
+    cache.Compile(PROGRAM, 'Parent')
+    cache.Compile(PROGRAM, 'Grandparent')
+    self.assertEqual(cache.Stats()['misses'], 3)
+    self.assertEqual(cache.Stats()['entries'], 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,7 +1,9 @@
 """Concertina: small Python Workflow execution handler."""
 
+import concurrent.futures
 import datetime
 import os
+import queue
 
 try:
   import graphviz
@@ -23,40 +25,84 @@ if '.' not in __package__:
 else:
   from ..common import graph_art
 
+def ResultRows(result):
+  """Rows of SQL runner result, which is header and rows, or a dataframe."""
+  if isinstance(result, tuple):
+    return [tuple(row) for row in result[1]]
+  return [tuple(row) for row in result.itertuples(index=False)]
+
+
 class ConcertinaQueryEngine(object):
   def __init__(self, final_predicates, sql_runner,
                print_running_predicate=True,
-               observer=None):
+               observer=None,
+               worker_sql_runners=None):
     self.final_predicates = final_predicates
     self.final_result = {}
     self.sql_runner = sql_runner
     self.print_running_predicate = print_running_predicate
     self.completion_time = {}
     self.observer = observer
+    # When actions run concurrently each of them borrows a runner, i.e. a
+    # connection, of its own.
+    self.worker_sql_runners = None
+    if worker_sql_runners:
+      self.worker_sql_runners = queue.Queue()
+      for r in worker_sql_runners:
+        self.worker_sql_runners.put(r)
 
   def Run(self, action):
     assert action['launcher'] in ('query', 'none')
     if action['launcher'] == 'query':
       predicate = action['predicate']
-      if self.print_running_predicate:
+      concurrent_run = self.worker_sql_runners is not None
+      if self.print_running_predicate and not concurrent_run:
         print('Running predicate:', predicate, end='')
-      start = datetime.datetime.now()
-      result = self.sql_runner(action['sql'], action['engine'],
-                               is_final=(predicate in self.final_predicates))
-      end = datetime.datetime.now()
+      if concurrent_run:
+        sql_runner = self.worker_sql_runners.get()
+      else:
+        sql_runner = self.sql_runner
+      try:
+        start = datetime.datetime.now()
+        result = sql_runner(action['sql'], action['engine'],
+                            is_final=(predicate in self.final_predicates))
+        end = datetime.datetime.now()
+      finally:
+        if concurrent_run:
+          self.worker_sql_runners.put(sql_runner)
       self.completion_time[predicate] = int((end - start).total_seconds() * 1000)
       if self.print_running_predicate:
-        print(' (%d ms)' % self.completion_time[predicate])
+        if concurrent_run:
+          print('Running predicate: %s (%d ms)' % (
+              predicate, self.completion_time[predicate]))
+        else:
+          print(' (%d ms)' % self.completion_time[predicate])
       if predicate in self.final_predicates:
         self.final_result[predicate] = result
         if self.observer:
           self.observer.ObserveTable(predicate, result)
 
+  def IsTableEmpty(self, table, engine):
+    return not ResultRows(self.sql_runner(
+        'SELECT 1 AS nonempty FROM %s LIMIT 1' % table,
+        engine, is_final=True))
+
+  def TableFingerprint(self, fingerprint_sql, engine):
+    [fingerprint] = ResultRows(self.sql_runner(fingerprint_sql, engine,
+                                               is_final=True))
+    return fingerprint
+
 
 class ConcertinaDryRunEngine(object):
   def Run(self, action):
     print(action)
 
+  def IsTableEmpty(self, table, engine):
+    return False
+
+  def TableFingerprint(self, fingerprint_sql, engine):
+    return None
+
 
 class Concertina(object):
   DISPLAY_COUNT = 0
@@ -130,6 +176,14 @@ class Concertina(object):
       iteration: self.iterations[iteration]['stop_signal']
       for iteration in self.iterations
     }
+    self.iteration_stop_when_empty = {
+      iteration: self.iterations[iteration].get('stop_when_empty', {})
+      for iteration in self.iterations
+    }
+    self.iteration_fingerprint_sql = {
+      iteration: self.iterations[iteration].get('fingerprint_sql', {})
+      for iteration in self.iterations
+    }
     self.half_iteration_actions = {}
     for iteration in self.iterations:
       predicates = self.iterations[iteration]['predicates']
@@ -155,7 +209,8 @@ class Concertina(object):
           self.action_requires[predicate] |= (half_iteration_requires[iteration] -
                                               self.half_iteration_actions[iteration])
 
-  def __init__(self, config, engine, display_mode='colab', iterations=None):
+  def __init__(self, config, engine, display_mode='colab', iterations=None,
+               max_parallelism=1):
     self.config = config
     self.recent_display_update_seconds = 0
     self.display_update_period = 0.0000000001
@@ -166,12 +221,18 @@ class Concertina(object):
     # Once signal requests a stop, we have to stop whole iteration as some
     # process are already down.
     self.wrench_in_gears = set()
+    # Iterations that stopped deriving new facts.
+    self.converged_iterations = set()
+    # Action -> fingerprints of its table after the two last repetitions.
+    self.action_fingerprints = {}
     self.action_requires = {}
     self.action = {a["name"]: a for a in self.config}
     self.action_stopped = set()
     self.UnderstandIterations()
     self.actions_to_run = self.SortActions()
     self.engine = engine
+    # Number of actions that are allowed to run at the same time.
+    self.max_parallelism = max_parallelism
     assert len(self.action) == len(self.config)
     self.all_actions = {a["name"] for a in self.config}
     self.complete_actions = set()
@@ -200,6 +261,53 @@ class Concertina(object):
         return True
       return False
 
+  def ActionIterationConverged(self, action):
+    iteration = self.action_iteration[action]
+    if iteration in self.converged_iterations:
+      return True
+    if (self.ActionTableIsEmpty(action) or
+        self.ActionIterationReachedFixpoint(action)):
+      self.converged_iterations |= {iteration}
+      return True
+    return False
+
+  def ActionTableIsEmpty(self, action):
+    iteration = self.action_iteration[action]
+    table = self.iteration_stop_when_empty[iteration].get(action)
+    if table is None:
+      return False
+    return self.engine.IsTableEmpty(table,
+                                    self.action[action]['action']['engine'])
+
+  def ActionIterationReachedFixpoint(self, action):
+    """Fingerprints action table, checking if the iteration changes nothing.
+
+    Iteration reached fixpoint if after a complete repetition tables of all
+    its actions are the same as after the previous repetition.
+    """
+    iteration = self.action_iteration[action]
+    fingerprint_sql = self.iteration_fingerprint_sql[iteration]
+    if action not in fingerprint_sql:
+      return False
+    fingerprint = self.engine.TableFingerprint(
+        fingerprint_sql[action], self.action[action]['action']['engine'])
+    if fingerprint is None:
+      return False
+    previous = self.action_fingerprints.get(action, (None, None))[1]
+    self.action_fingerprints[action] = (previous, fingerprint)
+    actions = [a for a in self.iteration_actions[iteration]
+               if a in self.action]
+    if len({self.action_iterations_complete[a] for a in actions}) > 1:
+      # Repetition is not complete.
+      return False
+    for a in actions:
+      if a not in self.action_fingerprints:
+        return False
+      previous, current = self.action_fingerprints[a]
+      if previous != current:
+        return False
+    return True
+
   def UpdateStateForIterativeAction(self, one_action):
     # Marking action as complete, or incrementing its repetion count.
     # When incrementing repetion then cycling the iteration actions.
@@ -207,36 +315,118 @@ class Concertina(object):
     if (self.action_iterations_complete[one_action] >=
         self.iteration_repetitions[self.action_iteration[one_action]]):
       self.complete_actions |= {one_action}
-    elif self.ActionIterationWantsToStopBySignal(one_action):
+    elif (self.ActionIterationWantsToStopBySignal(one_action) or
+          self.ActionIterationConverged(one_action)):
       self.complete_actions |= {one_action}
       self.action_stopped |= {one_action}
     else:
+      # Placing the action after the other queued actions of its iteration.
+      # When running sequentially they are in the front of the queue, when
+      # running concurrently not yet ready actions may precede them.
+      iteration = self.action_iteration[one_action]
       i = 0
-      while (i < len(self.actions_to_run) and 
-              self.actions_to_run[i] in self.action_iteration and
-              self.action_iteration[self.actions_to_run[i]] ==
-              self.action_iteration[one_action]):
+      while (i < len(self.actions_to_run) and
+             self.action_iteration.get(self.actions_to_run[i]) != iteration):
+        i += 1
+      if i == len(self.actions_to_run):
+        i = 0
+      while (i < len(self.actions_to_run) and
+             self.action_iteration.get(self.actions_to_run[i]) == iteration):
         i += 1
       self.actions_to_run[i:i] = [one_action]
 
+  def SkipActionOfConvergedIteration(self, one_action):
+    if (one_action in self.action_iteration and
+        self.action_iteration[one_action] in self.converged_iterations):
+      # Running converged iteration further would not change anything.
+      self.complete_actions |= {one_action}
+      self.action_stopped |= {one_action}
+      return True
+    return False
+
+  def FinishAction(self, one_action):
+    self.running_actions -= {one_action}
+    if one_action not in self.action_iterations_complete:
+      self.complete_actions |= {one_action}
+    else:
+      self.UpdateStateForIterativeAction(one_action)
+
   def RunOneAction(self):
     # Probably updating display too often is only confusing.
     # self.UpdateDisplay()
     one_action = self.actions_to_run[0]
     del self.actions_to_run[0]
+    if self.SkipActionOfConvergedIteration(one_action):
+      return
     self.running_actions |= {one_action}
     self.UpdateDisplay()
     self.engine.Run(self.action[one_action].get('action', {}))
-    self.running_actions -= {one_action}
-    if one_action not in self.action_iterations_complete:
-      self.complete_actions |= {one_action}
-    else:
-      self.UpdateStateForIterativeAction(one_action)
+    self.FinishAction(one_action)
     # self.UpdateDisplay()
 
+  def PopReadyActions(self, limit):
+    """Takes up to limit actions that can start now off the queue.
+
+    Action is ready when the actions it requires are complete. Actions of an
+    iteration run one at a time and in the order of the queue, which cycles
+    them, so only the first queued action of an idle iteration can be ready.
+    Requirements within the iteration are then satisfied by this order,
+    same as when running sequentially.
+    """
+    busy_iterations = {self.action_iteration[a] for a in self.running_actions
+                       if a in self.action_iteration}
+    ready = []
+    remaining = []
+    for a in self.actions_to_run:
+      iteration = self.action_iteration.get(a)
+      if self.SkipActionOfConvergedIteration(a):
+        continue
+      if iteration is not None:
+        requires = self.action_requires[a] - self.iteration_actions[iteration]
+      else:
+        requires = self.action_requires[a]
+      if (len(ready) < limit and
+          iteration not in busy_iterations and
+          requires <= self.complete_actions):
+        ready.append(a)
+      else:
+        remaining.append(a)
+      if iteration is not None:
+        busy_iterations |= {iteration}
+    self.actions_to_run = remaining
+    return ready
+
+  def RunConcurrently(self):
+    """Runs actions in threads, starting every action as soon as it's ready."""
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=self.max_parallelism) as executor:
+      running = {}
+      while self.actions_to_run or running:
+        for one_action in self.PopReadyActions(
+            self.max_parallelism - len(running)):
+          self.running_actions |= {one_action}
+          future = executor.submit(self.engine.Run,
+                                   self.action[one_action].get('action', {}))
+          running[future] = one_action
+        if not running:
+          assert not self.actions_to_run, (
+              'Could not schedule: %s' % self.actions_to_run)
+          break
+        self.UpdateDisplay()
+        done, _ = concurrent.futures.wait(
+            running, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+          one_action = running.pop(future)
+          # Re-raising error of the action, if any.
+          future.result()
+          self.FinishAction(one_action)
+
   def Run(self):
-    while self.actions_to_run:
-      self.RunOneAction()
+    if self.max_parallelism > 1:
+      self.RunConcurrently()
+    else:
+      while self.actions_to_run:
+        self.RunOneAction()
     self.UpdateDisplay(final=True)
 
   def ActionColor(self, a):
@@ -447,8 +637,35 @@ def RenamePredicate(table_to_export_map, dependency_edges,
   return new_table_to_export_map, new_dependency_edges, new_data_dependency_edges
 
 
+def WorkerSqlRunners(sql_runner, max_parallelism):
+  """Runners for concurrent workers, or None if runner can't run concurrently.
+
+  Runner supports concurrency by providing WorkerRunner method, which returns
+  a runner with a connection of its own to the same database, or None if
+  the database can not be shared across connections or no more connections
+  are available. In the latter case fewer workers are used. Worker runners
+  may provide Close method, giving back the connection after the run.
+  """
+  if max_parallelism <= 1 or not hasattr(sql_runner, 'WorkerRunner'):
+    return None
+  result = []
+  for _ in range(max_parallelism):
+    worker_runner = sql_runner.WorkerRunner()
+    if worker_runner is None:
+      break
+    result.append(worker_runner)
+  return result or None
+
+
+def CloseWorkerSqlRunners(worker_sql_runners):
+  for worker_runner in worker_sql_runners or []:
+    if hasattr(worker_runner, 'Close'):
+      worker_runner.Close()
+
+
 def ExecuteLogicaProgram(logica_executions, sql_runner, sql_engine,
-                         display_mode='colab', observer=None):
+                         display_mode='colab', observer=None,
+                         max_parallelism=1):
   def ConcertinaConfig(table_to_export_map, dependency_edges,
                        data_dependency_edges, final_predicates):
     depends_on = {}
@@ -514,23 +731,35 @@ def ExecuteLogicaProgram(logica_executions, sql_runner, sql_engine,
                             data_dependency_edges,
                             final_predicates)
  
-  engine = ConcertinaQueryEngine(
-      final_predicates=final_predicates, sql_runner=sql_runner,
-      print_running_predicate=(display_mode == 'colab'),
-      observer=observer)
-
-  preambles = set(e.preamble for e in logica_executions)
-  # Due to change of types from predicate to predicate preables are not
-  # consistent. However we expect preambles to be idempotent.
-  # So we simply run all of them.
-  # assert len(preambles) == 1, 'Inconsistent preambles: %s' % preambles
-  # [preamble] = list(preambles)
-  for preamble in preambles:
-    if preamble:
-      sql_runner(preamble, sql_engine, is_final=False)
-
-  concertina = Concertina(config, engine,
-                          iterations=iterations,
-                          display_mode=display_mode)
-  concertina.Run()
+  worker_sql_runners = WorkerSqlRunners(sql_runner, max_parallelism)
+  if worker_sql_runners is None:
+    max_parallelism = 1
+  else:
+    max_parallelism = len(worker_sql_runners)
+  try:
+    engine = ConcertinaQueryEngine(
+        final_predicates=final_predicates, sql_runner=sql_runner,
+        print_running_predicate=(display_mode == 'colab'),
+        observer=observer,
+        worker_sql_runners=worker_sql_runners)
+
+    preambles = set(e.preamble for e in logica_executions)
+    # Due to change of types from predicate to predicate preables are not
+    # consistent. However we expect preambles to be idempotent.
+    # So we simply run all of them.
+    # assert len(preambles) == 1, 'Inconsistent preambles: %s' % preambles
+    # [preamble] = list(preambles)
+    # Preambles may set up state of the connection, so workers run them too.
+    for runner in [sql_runner] + (worker_sql_runners or []):
+      for preamble in preambles:
+        if preamble:
+          runner(preamble, sql_engine, is_final=False)
+
+    concertina = Concertina(config, engine,
+                            iterations=iterations,
+                            display_mode=display_mode,
+                            max_parallelism=max_parallelism)
+    concertina.Run()
+  finally:
+    CloseWorkerSqlRunners(worker_sql_runners)
   return engine.final_result
@@ -0,0 +1,132 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unitests for concertina_lib.py."""
+
+import threading
+import time
+import unittest
+
+from common import concertina_lib
+from common import connection_pool
+
+
+class RecordingEngine(object):
+  """Engine recording the order and overlap of actions that it runs."""
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.log = []
+    self.running = 0
+    self.max_running = 0
+    self.completion_time = {}
+
+  def Run(self, action):
+    with self.lock:
+      self.running += 1
+      self.max_running = max(self.max_running, self.running)
+      self.log.append(action['predicate'])
+    time.sleep(0.02)
+    with self.lock:
+      self.running -= 1
+
+  def IsTableEmpty(self, table, engine):
+    return False
+
+  def TableFingerprint(self, fingerprint_sql, engine):
+    return None
+
+
+class PooledRunner(object):
+  """Runner holding a connection from the pool, like the one of PostgreSQL."""
+
+  def __init__(self, pool, connection):
+    self.pool = pool
+    self.connection = connection
+
+  def WorkerRunner(self):
+    try:
+      return PooledRunner(self.pool, self.pool.Borrow(timeout=0))
+    except connection_pool.ConnectionPoolTimeout:
+      return None
+
+  def Close(self):
+    self.pool.Return(self.connection)
+    self.connection = None
+
+
+def Action(name, requires):
+  return {'name': name, 'requires': requires,
+          'action': {'predicate': name, 'launcher': 'query'}}
+
+
+class ConcertinaTest(unittest.TestCase):
+  def RunConcertina(self, config, iterations, max_parallelism):
+    engine = RecordingEngine()
+    concertina = concertina_lib.Concertina(
+        config, engine, display_mode='silent', iterations=iterations,
+        max_parallelism=max_parallelism)
+    concertina.Run()
+    self.assertEqual(concertina.complete_actions, concertina.all_actions)
+    return engine
+
+  def test_ConcurrentRunStartsIndependentActionsTogether(self):
+    config = [Action('A', []), Action('B', []), Action('C', []),
+              Action('D', ['A', 'B', 'C'])]
+    engine = self.RunConcertina(config, {}, max_parallelism=3)
+    self.assertEqual(engine.max_running, 3)
+    self.assertEqual(engine.log[-1], 'D')
+
+  def test_ConcurrentRunKeepsIterationOrder(self):
+    config = [Action('P0', []), Action('Q0', []),
+              Action('P1', ['P0', 'Q0']), Action('Q1', ['P0', 'Q0']),
+              Action('P2', ['P1', 'Q1']), Action('Q2', ['P1', 'Q1']),
+              Action('R', ['P2', 'Q2']), Action('S', [])]
+    iterations = {'I': {'predicates': ['P1', 'Q1', 'P2', 'Q2'],
+                        'repetitions': 3, 'stop_signal': ''}}
+    sequential = self.RunConcertina(config, iterations, max_parallelism=1)
+    concurrent = self.RunConcertina(config, iterations, max_parallelism=4)
+    def IterationLog(engine):
+      return [p for p in engine.log if p in ('P1', 'Q1', 'P2', 'Q2')]
+    self.assertEqual(IterationLog(concurrent), IterationLog(sequential))
+    self.assertEqual(len(IterationLog(concurrent)), 12)
+    self.assertEqual(concurrent.log[-1], 'R')
+    self.assertLess(concurrent.log.index('S'), concurrent.log.index('P1'))
+
+
+
+class WorkerSqlRunnersTest(unittest.TestCase):
+  def test_WorkersHoldConnectionsUntilClosed(self):
+    pool = connection_pool.ConnectionPool(object, max_size=4)
+    sql_runner = PooledRunner(pool, pool.Borrow())
+    workers = concertina_lib.WorkerSqlRunners(sql_runner, max_parallelism=8)
+    # Only connections left in the pool go to the workers.
+    self.assertEqual(len(workers), 3)
+    connections = {w.connection for w in workers} | {sql_runner.connection}
+    self.assertEqual(len(connections), 4)
+    self.assertEqual(pool.Stats()['idle'], 0)
+    concertina_lib.CloseWorkerSqlRunners(workers)
+    self.assertEqual(pool.Stats(), {'open': 4, 'idle': 3, 'opened': 4})
+
+  def test_RunnerWithoutWorkersRunsAlone(self):
+    pool = connection_pool.ConnectionPool(object, max_size=1)
+    sql_runner = PooledRunner(pool, pool.Borrow())
+    self.assertIsNone(
+        concertina_lib.WorkerSqlRunners(sql_runner, max_parallelism=4))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,243 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Process-wide pools of connections to database servers.
+
+Opening a connection to a server, especially over TLS, can cost more than
+running a query. Runners of PostgreSQL, SQL Server and ClickHouse borrow
+connections from pools, which are shared within the process and keyed by
+engine and connection parameters.
+
+Idle connections are checked to be alive before they are lent out and
+closed after being idle for long. Connections that broke while in use are
+dropped, so that the next borrower gets a new one.
+"""
+
+import contextlib
+import threading
+import time
+
+
+class ConnectionPoolTimeout(Exception):
+  """Raised when no connection became available in time."""
+
+
+class ConnectionPool(object):
+  """Thread-safe pool of connections to one database.
+
+  Attributes:
+    connect: Function without arguments returning a new connection.
+    is_healthy: Function checking that a connection is alive.
+    close: Function closing a connection.
+    min_size: Number of connections to keep open, even when idle.
+    max_size: Maximal number of connections open at the same time.
+    max_idle_seconds: Connections idle for longer are closed.
+    health_check_seconds: Connections idle for longer are checked before
+      they are lent out.
+  """
+
+  def __init__(self, connect, is_healthy=None, close=None,
+               min_size=0, max_size=8, max_idle_seconds=300,
+               health_check_seconds=10):
+    assert 0 <= min_size <= max_size and max_size > 0, (min_size, max_size)
+    self.connect = connect
+    self.is_healthy = is_healthy or (lambda connection: True)
+    self.close = close or (lambda connection: connection.close())
+    self.min_size = min_size
+    self.max_size = max_size
+    self.max_idle_seconds = max_idle_seconds
+    self.health_check_seconds = health_check_seconds
+    self.condition = threading.Condition()
+    # Idle connections with the time they were returned, most recent last.
+    self.idle = []
+    # Number of open connections, idle and lent out.
+    self.size = 0
+    self.connections_opened = 0
+    for _ in range(min_size):
+      self.idle.append((self.Connect(), time.monotonic()))
+      self.size += 1
+
+  def Connect(self):
+    connection = self.connect()
+    self.connections_opened += 1
+    return connection
+
+  def IsHealthy(self, connection):
+    try:
+      return self.is_healthy(connection)
+    except Exception:
+      return False
+
+  def CloseQuietly(self, connection):
+    try:
+      self.close(connection)
+    except Exception:
+      pass  # Connection is being dropped anyway.
+
+  def Borrow(self, timeout=None):
+    """Returns a connection, waiting for one if all of them are lent out.
+
+    Args:
+      timeout: Seconds to wait for a connection, or None to wait forever.
+    Returns:
+      Connection, which has to be given back with Return.
+    Raises:
+      ConnectionPoolTimeout: If no connection became available in time.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+      with self.condition:
+        evicted = self.TakeExpiredLocked()
+        while not self.idle and self.size >= self.max_size:
+          remaining = (None if deadline is None else
+                       deadline - time.monotonic())
+          if remaining is not None and remaining <= 0:
+            raise ConnectionPoolTimeout(
+                'No connection available after %.1f seconds, all %d are '
+                'in use.' % (timeout, self.max_size))
+          self.condition.wait(remaining)
+        if self.idle:
+          connection, returned_at = self.idle.pop()
+        else:
+          connection, returned_at = None, None
+          self.size += 1
+      for c in evicted:
+        self.CloseQuietly(c)
+      if connection is None:
+        try:
+          return self.Connect()
+        except Exception:
+          self.Forget()
+          raise
+      if (time.monotonic() - returned_at < self.health_check_seconds or
+          self.IsHealthy(connection)):
+        return connection
+      # Connection broke while idle, reconnecting.
+      self.CloseQuietly(connection)
+      self.Forget()
+
+  def Return(self, connection, broken=False):
+    """Gives back a borrowed connection, dropping it if it's broken."""
+    if broken:
+      self.CloseQuietly(connection)
+      self.Forget()
+      return
+    with self.condition:
+      self.idle.append((connection, time.monotonic()))
+      self.condition.notify()
+
+  def Forget(self):
+    """Accounts for a lent out connection that was closed."""
+    with self.condition:
+      self.size -= 1
+      self.condition.notify()
+
+  @contextlib.contextmanager
+  def Connection(self, timeout=None):
+    """Context manager lending out a connection for the duration of block.
+
+    If the block fails and the connection doesn't look healthy anymore, the
+    connection is dropped.
+    """
+    connection = self.Borrow(timeout=timeout)
+    try:
+      yield connection
+    except BaseException:
+      self.Return(connection, broken=not self.IsHealthy(connection))
+      raise
+    self.Return(connection)
+
+  def TakeExpiredLocked(self):
+    """Removes connections idle for too long, keeping min_size open."""
+    if self.max_idle_seconds is None:
+      return []
+    now = time.monotonic()
+    expired = []
+    # The least recently returned connections are in the front.
+    while (self.idle and self.size > self.min_size and
+           now - self.idle[0][1] > self.max_idle_seconds):
+      expired.append(self.idle.pop(0)[0])
+      self.size -= 1
+    return expired
+
+  def EvictIdle(self):
+    """Closes connections that were idle for too long."""
+    with self.condition:
+      expired = self.TakeExpiredLocked()
+    for connection in expired:
+      self.CloseQuietly(connection)
+
+  def CloseIdle(self):
+    """Closes all idle connections."""
+    with self.condition:
+      idle = [connection for connection, _ in self.idle]
+      self.idle = []
+      self.size -= len(idle)
+      self.condition.notify_all()
+    for connection in idle:
+      self.CloseQuietly(connection)
+
+  def Stats(self):
+    with self.condition:
+      return {'open': self.size,
+              'idle': len(self.idle),
+              'opened': self.connections_opened}
+
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def GetPool(engine, connection_key, connect, **options):
+  """Returns process-wide pool for the engine and connection parameters.
+
+  Args:
+    engine: Name of the engine, e.g. 'psql'.
+    connection_key: String identifying the database and the credentials,
+      usually the connection string.
+    connect: Function without arguments opening a new connection. It's used
+      only when the pool is created.
+    **options: Options of ConnectionPool, used when it's created.
+  Returns:
+    ConnectionPool.
+  """
+  key = (engine, connection_key)
+  with _POOLS_LOCK:
+    if key not in _POOLS:
+      _POOLS[key] = ConnectionPool(connect, **options)
+    return _POOLS[key]
+
+
+def CloseAllPools():
+  """Closes idle connections of all pools and forgets the pools."""
+  with _POOLS_LOCK:
+    pools = list(_POOLS.values())
+    _POOLS.clear()
+  for pool in pools:
+    pool.CloseIdle()
+
+
+def PingWithCursor(connection):
+  """Health check for DB-API connections."""
+  if getattr(connection, 'closed', False):
+    return False
+  cursor = connection.cursor()
+  try:
+    cursor.execute('SELECT 1')
+    cursor.fetchall()
+  finally:
+    cursor.close()
+  return True
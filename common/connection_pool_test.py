@@ -0,0 +1,136 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unitests for connection_pool.py."""
+
+import threading
+import unittest
+
+from common import connection_pool
+
+
+class FakeConnection(object):
+  def __init__(self, number):
+    self.number = number
+    self.closed = False
+
+  def close(self):
+    self.closed = True
+
+
+class FakeDatabase(object):
+  def __init__(self):
+    self.connections = []
+
+  def Connect(self):
+    self.connections.append(FakeConnection(len(self.connections)))
+    return self.connections[-1]
+
+
+def IsHealthy(connection):
+  return not connection.closed
+
+
+class ConnectionPoolTest(unittest.TestCase):
+  def test_ConnectionIsReused(self):
+    db = FakeDatabase()
+    pool = connection_pool.ConnectionPool(db.Connect, min_size=1)
+    self.assertEqual(len(db.connections), 1)
+    with pool.Connection() as c1:
+      pass
+    with pool.Connection() as c2:
+      pass
+    self.assertIs(c1, c2)
+    self.assertEqual(pool.Stats(), {'open': 1, 'idle': 1, 'opened': 1})
+
+  def test_BorrowWaitsForReturnAtMaxSize(self):
+    db = FakeDatabase()
+    pool = connection_pool.ConnectionPool(db.Connect, max_size=2)
+    c1 = pool.Borrow()
+    c2 = pool.Borrow()
+    self.assertIsNot(c1, c2)
+    with self.assertRaises(connection_pool.ConnectionPoolTimeout):
+      pool.Borrow(timeout=0.01)
+    threading.Timer(0.05, lambda: pool.Return(c1)).start()
+    self.assertIs(pool.Borrow(timeout=5), c1)
+    self.assertEqual(len(db.connections), 2)
+
+  def test_BrokenConnectionIsReplaced(self):
+    db = FakeDatabase()
+    pool = connection_pool.ConnectionPool(db.Connect, is_healthy=IsHealthy,
+                                          max_size=1,
+                                          health_check_seconds=0)
+    with self.assertRaises(ValueError):
+      with pool.Connection() as c:
+        c.close()
+        raise ValueError('Connection lost.')
+    self.assertEqual(pool.Stats()['open'], 0)
+    with pool.Connection() as c:
+      self.assertEqual(c.number, 1)
+    # Connection that broke while idle is replaced too.
+    c.closed = True
+    with pool.Connection() as c:
+      self.assertEqual(c.number, 2)
+
+  def test_IdleConnectionsAreEvicted(self):
+    db = FakeDatabase()
+    pool = connection_pool.ConnectionPool(db.Connect, min_size=1,
+                                          max_idle_seconds=0)
+    c1 = pool.Borrow()
+    c2 = pool.Borrow()
+    pool.Return(c1)
+    pool.Return(c2)
+    pool.EvictIdle()
+    self.assertEqual(pool.Stats()['open'], 1)
+    self.assertEqual(len([c for c in db.connections if c.closed]), 1)
+
+  def test_PoolIsSharedPerEngineAndKey(self):
+    db = FakeDatabase()
+    p1 = connection_pool.GetPool('fake', 'db1', db.Connect)
+    p2 = connection_pool.GetPool('fake', 'db1', db.Connect)
+    p3 = connection_pool.GetPool('fake', 'db2', db.Connect)
+    self.assertIs(p1, p2)
+    self.assertIsNot(p1, p3)
+    connection_pool.CloseAllPools()
+    self.assertIsNot(connection_pool.GetPool('fake', 'db1', db.Connect), p1)
+    connection_pool.CloseAllPools()
+
+  def test_ConcurrentBorrowersNeverShareConnection(self):
+    db = FakeDatabase()
+    pool = connection_pool.ConnectionPool(db.Connect, max_size=3)
+    in_use = set()
+    lock = threading.Lock()
+    errors = []
+    def Work():
+      for _ in range(200):
+        with pool.Connection() as c:
+          with lock:
+            if c.number in in_use:
+              errors.append(c.number)
+            in_use.add(c.number)
+          with lock:
+            in_use.remove(c.number)
+    threads = [threading.Thread(target=Work) for _ in range(6)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+    self.assertEqual(errors, [])
+    self.assertLessEqual(len(db.connections), 3)
+
+
+if __name__ == '__main__':
+  unittest.main()
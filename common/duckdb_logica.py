@@ -22,9 +22,11 @@ import json
 if '.' not in __package__:
   from compiler.dialect_libraries import duckdb_library
   from common import clingo_logica
+  from common import result_stream
 else:
   from ..compiler.dialect_libraries import duckdb_library
   from ..common import clingo_logica
+  from ..common import result_stream
 
 
 display_style = ';'.join([
@@ -57,6 +59,30 @@ def GetConnection(logica_program=None):
   return connection
 
 
+def DuckdbStream(sql, connection,
+                 batch_size=result_stream.DEFAULT_BATCH_SIZE):
+  """Runs SQL, streaming result of its last statement in batches."""
+  return result_stream.FromCursor(connection.sql(sql), batch_size)
+
+
+def DuckdbArrow(sql, connection, as_reader=False,
+                batch_size=result_stream.DEFAULT_BATCH_SIZE):
+  """Runs SQL, returning result of its last statement as Arrow.
+
+  DuckDB produces Arrow data itself, so the result is handed over without
+  copying values through Python.
+  """
+  relation = connection.sql(sql)
+  # Newer versions of DuckDB renamed the methods.
+  if as_reader:
+    to_reader = (getattr(relation, 'to_arrow_reader', None) or
+                 relation.fetch_record_batch)
+    return to_reader(batch_size)
+  to_table = (getattr(relation, 'to_arrow_table', None) or
+              relation.fetch_arrow_table)
+  return to_table()
+
+
 def ConnectClingo(connection,
                   display_code=False,
                   default_num_models=0,
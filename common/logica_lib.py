@@ -22,18 +22,26 @@ import subprocess
 import sys
 
 if '.' not in __package__:
+  from common import clickhouse_logica
+  from common import compile_cache
   from common import duckdb_logica
+  from common import mssql_logica
   from common import sqlite3_logica
   from common import psql_logica
+  from common import result_stream
   from compiler import functors
   from compiler import rule_translate
   from compiler import universe
   from parser_py import parse
   from type_inference.research import infer
 else:
+  from ..common import clickhouse_logica
+  from ..common import compile_cache
   from ..common import duckdb_logica
+  from ..common import mssql_logica
   from ..common import sqlite3_logica
   from ..common import psql_logica
+  from ..common import result_stream
   from ..compiler import functors
   from ..compiler import rule_translate
   from ..compiler import universe
@@ -56,11 +64,13 @@ def ParseOrExit(filename, import_root=None):
   return parsed_rules
 
 
-def GetProgramOrExit(filename, user_flags=None, import_root=None):
+def GetProgramOrExit(filename, user_flags=None, import_root=None,
+                     required_predicates=None):
   """Get program object from a file."""
   parsed_rules = ParseOrExit(filename, import_root=import_root)
   try:
-    p = universe.LogicaProgram(parsed_rules, user_flags=user_flags)
+    p = universe.LogicaProgram(parsed_rules, user_flags=user_flags,
+                               required_predicates=required_predicates)
   except rule_translate.RuleCompileException as rule_compilation_exception:
     rule_compilation_exception.ShowMessage()
     sys.exit(1)
@@ -77,16 +87,11 @@ def RunQuery(sql,
   """Run a SQL query on BigQuery."""
   settings = settings or {}
   if engine == 'psql' and os.environ.get('LOGICA_PSQL_CONNECTION'):
-    connection_str = os.environ.get('LOGICA_PSQL_CONNECTION')
-    import psycopg2
-    from common import psql_logica
-    connection = psycopg2.connect(connection_str)
-    cursor = psql_logica.PostgresExecute(sql, connection)
-    rows = [list(map(psql_logica.DigestPsqlType, row))
-        
-            for row in cursor.fetchall()]
-    return sqlite3_logica.ArtisticTable([d[0] for d in cursor.description],
-                                        rows)
+    with psql_logica.ConnectionPool().Connection() as connection:
+      stream = psql_logica.CursorStream(
+          psql_logica.PostgresExecute(sql, connection))
+      rows = stream.Fetchall()
+    return sqlite3_logica.ArtisticTable(stream.header, rows)
   if engine == 'bigquery':
     p = subprocess.Popen(['bq', 'query',
                           '--use_legacy_sql=false',
@@ -133,7 +138,8 @@ def RunPredicate(filename, predicate,
                  import_root=None):
   """Run a predicate on BigQuery."""
   p = GetProgramOrExit(filename, user_flags=user_flags,
-                       import_root=import_root)
+                       import_root=import_root,
+                       required_predicates=[predicate])
   sql = p.FormattedPredicateSql(predicate)
   engine = p.annotations.Engine()
   if ('@Engine' in p.annotations.annotations and
@@ -154,6 +160,10 @@ def RunQueryPandas(sql, engine, connection=None):
   if connection is None and engine == 'duckdb':
     import duckdb
     connection = duckdb.connect()
+  if (connection is None and engine == 'psql' and
+      os.environ.get('LOGICA_PSQL_CONNECTION')):
+    with psql_logica.ConnectionPool().Connection() as pooled_connection:
+      return RunQueryPandas(sql, engine, connection=pooled_connection)
   if connection is None:
     assert False, 'Connection is required for engines other than SQLite.'
   if engine == 'bigquery':
@@ -161,11 +171,8 @@ def RunQueryPandas(sql, engine, connection=None):
   elif engine == 'psql':
     cursor = connection.cursor()
     cursor.execute(sql)
-    rows = cursor.fetchall()
-    df = pandas.DataFrame(
-      rows, columns=[d[0] for d in cursor.description])
-    df = df.applymap(psql_logica.DigestPsqlType)
-    return df
+    stream = psql_logica.CursorStream(cursor)
+    return pandas.DataFrame(stream.Fetchall(), columns=stream.header)
   elif engine == 'duckdb':
     import duckdb
     return connection.sql(sql).df()
@@ -179,10 +186,91 @@ def RunQueryPandas(sql, engine, connection=None):
                     'for now.')
 
 
+def RunQueryArrow(sql, engine, connection=None, as_reader=False,
+                  batch_size=result_stream.DEFAULT_BATCH_SIZE,
+                  column_types=None):
+  """Running SQL query on the engine, returning pyarrow.Table.
+
+  With as_reader the result is pyarrow.RecordBatchReader instead, reading
+  the result a batch at a time. DuckDB and BigQuery produce Arrow data
+  themselves, results of other engines are converted from batches of rows,
+  column by column. Inferred column_types tell which columns hold records
+  and lists.
+  """
+  import pyarrow  # Arrow results require pyarrow.
+  if connection is None and engine == 'sqlite':
+    connection = sqlite3_logica.SqliteConnect()
+  if connection is None and engine == 'duckdb':
+    import duckdb
+    connection = duckdb.connect()
+  if (connection is None and engine == 'psql' and
+      os.environ.get('LOGICA_PSQL_CONNECTION')):
+    with psql_logica.ConnectionPool().Connection() as pooled_connection:
+      # Connection goes back to the pool, so the result is read right away.
+      table = RunQueryArrow(sql, engine, connection=pooled_connection,
+                            batch_size=batch_size, column_types=column_types)
+    return table.to_reader() if as_reader else table
+  if connection is None:
+    assert False, 'Connection is required for engines other than SQLite.'
+  if engine == 'duckdb':
+    return duckdb_logica.DuckdbArrow(sql, connection, as_reader=as_reader,
+                                     batch_size=batch_size)
+  if engine == 'bigquery':
+    table = connection.query(sql).to_arrow()
+    return table.to_reader() if as_reader else table
+  if engine == 'psql':
+    stream = psql_logica.CursorStream(
+        psql_logica.PostgresExecute(sql, connection), batch_size,
+        column_types=column_types)
+  elif engine == 'sqlite':
+    statements = parse.SplitRaw(sql, ';')
+    if not statements[-1].strip():
+      statements = statements[:-1]
+    if len(statements) > 1:
+      connection.executescript(';\n'.join(statements[:-1]))
+    # SQLite columns have no types, so their Arrow types are inferred ones.
+    stream = result_stream.FromCursor(
+        connection.execute(statements[-1]), batch_size,
+        arrow_types_for_columns=lambda d: result_stream.InferredArrowTypes(
+            [c[0] for c in d], column_types))
+  elif engine == 'mssql':
+    stream = mssql_logica.MSSQLStream(sql, connection, batch_size,
+                                      column_types=column_types)
+  elif engine == 'clickhouse':
+    stream = clickhouse_logica.ClickHouseStream(sql, connection, batch_size)
+  else:
+    raise Exception('Arrow results are not supported for %s.' % engine)
+  if as_reader:
+    return result_stream.ToArrowReader(stream)
+  return result_stream.ToArrowTable(stream)
+
+
+def RunPredicateToArrow(filename, predicate,
+                        user_flags=None, import_root=None, connection=None,
+                        as_reader=False):
+  p = GetProgramOrExit(filename, user_flags=user_flags,
+                       import_root=import_root,
+                       required_predicates=[predicate])
+  sql = p.FormattedPredicateSql(predicate)
+  engine = p.annotations.Engine()
+  return RunQueryArrow(sql, engine, connection=connection,
+                       as_reader=as_reader,
+                       column_types=p.PredicateColumnTypes(predicate))
+
+
+def RunPredicateToPolars(filename, predicate,
+                         user_flags=None, import_root=None, connection=None):
+  import polars
+  return polars.from_arrow(RunPredicateToArrow(
+      filename, predicate, user_flags=user_flags, import_root=import_root,
+      connection=connection))
+
+
 def RunPredicateToPandas(filename, predicate,
                          user_flags=None, import_root=None, connection=None):
   p = GetProgramOrExit(filename, user_flags=user_flags,
-                       import_root=import_root)
+                       import_root=import_root,
+                       required_predicates=[predicate])
   sql = p.FormattedPredicateSql(predicate)
   engine = p.annotations.Engine()
   return RunQueryPandas(sql, engine, connection=connection)
@@ -200,6 +288,25 @@ def HandleException(exception):
 def CompilePredicateFromString(logica_string,
                                predicate_name,
                                user_flags=None):
+  cache = compile_cache.GetDefaultCache()
+  if cache:
+    try:
+      compiled = cache.Compile(logica_string, predicate_name,
+                               user_flags=user_flags)
+    except rule_translate.RuleCompileException as rule_compilation_exception:
+      rule_compilation_exception.ShowMessage()
+      return HandleException(rule_compilation_exception)
+    except functors.FunctorError as functor_exception:
+      functor_exception.ShowMessage()
+      return HandleException(functor_exception)
+    except infer.TypeErrorCaughtException as type_error_exception:
+      type_error_exception.ShowMessage()
+      return HandleException(type_error_exception)
+    except parse.ParsingException as parsing_exception:
+      parsing_exception.ShowMessage()
+      return HandleException(parsing_exception)
+    return compiled.formatted_sql, compiled.engine
+
   try:
     rules = parse.ParseFile(logica_string)['rule']
   except parse.ParsingException as parsing_exception:
@@ -207,7 +314,8 @@ def CompilePredicateFromString(logica_string,
     return HandleException(parsing_exception)
 
   try:
-    program = universe.LogicaProgram(rules, user_flags=user_flags)
+    program = universe.LogicaProgram(rules, user_flags=user_flags,
+                                     required_predicates=[predicate_name])
     sql = program.FormattedPredicateSql(predicate_name)
     engine = program.execution.annotations.Engine()
   except rule_translate.RuleCompileException as rule_compilation_exception:
@@ -17,11 +17,17 @@
 # Lint as: python3
 """Utilities for YotaQL tests."""
 
+import concurrent.futures
+import contextlib
 import difflib
+import io
 import os
 import subprocess
 import json
 import tempfile
+import time
+import traceback
+from xml.etree import ElementTree
 
 
 def PrintDiff(result, golden_result):
@@ -52,6 +58,12 @@ class TestManager(object):
   GOLDEN_RUN = False
   ANNOUNCE_TESTS = False
   RUN_ONLY = []
+  # Number of tests to run at the same time, each in its own process.
+  PARALLELISM = 1
+  # Tests waiting for RunScheduledTests, in order of registration.
+  SCHEDULED_TESTS = []
+  # Outcomes of tests that ran, with their timing.
+  RESULTS = []
 
   @classmethod
   def SetGoldenRun(cls, value):
@@ -65,26 +77,156 @@ class TestManager(object):
   def SetRunOnlyTests(cls, value):
     cls.RUN_ONLY = value
 
+  @classmethod
+  def SetParallelism(cls, value):
+    cls.PARALLELISM = value
+
   @classmethod
   def RunTest(cls, name, src, predicate, golden, user_flags,
               import_root=None, use_concertina=False,
               duckify_psql=False):
     if cls.RUN_ONLY and name not in cls.RUN_ONLY:
       return
-    RunTest(name, src, predicate, golden, user_flags,
-            cls.GOLDEN_RUN, cls.ANNOUNCE_TESTS,
-            import_root, use_concertina, duckify_psql)
+    cls.Schedule(name, RunTest,
+                 dict(name=name, src=src, predicate=predicate, golden=golden,
+                      user_flags=user_flags, overwrite=cls.GOLDEN_RUN,
+                      announce=cls.ANNOUNCE_TESTS, import_root=import_root,
+                      use_concertina=use_concertina,
+                      duckify_psql=duckify_psql))
 
   @classmethod
   def RunTypesTest(cls, name, src=None, golden=None):
     if cls.RUN_ONLY and name not in cls.RUN_ONLY:
       return
-    RunTypesTest(name, src, golden,
-                 overwrite=cls.GOLDEN_RUN)
+    cls.Schedule(name, RunTypesTest,
+                 dict(name=name, src=src, golden=golden,
+                      overwrite=cls.GOLDEN_RUN))
+
+  @classmethod
+  def Schedule(cls, name, test_function, kwargs):
+    """Runs the test right away, or schedules it when running in parallel."""
+    if cls.PARALLELISM > 1:
+      cls.SCHEDULED_TESTS.append((name, test_function, kwargs))
+    else:
+      cls.RESULTS.append(RunTimedTest(name, test_function, kwargs))
+
+  @classmethod
+  def RunScheduledTests(cls):
+    """Runs scheduled tests in a pool of processes.
+
+    Output of each test is printed once it's done, in the order in which the
+    tests were registered.
+    """
+    scheduled, cls.SCHEDULED_TESTS = cls.SCHEDULED_TESTS, []
+    if not scheduled:
+      return
+    with concurrent.futures.ProcessPoolExecutor(cls.PARALLELISM) as executor:
+      futures = [
+          executor.submit(RunTimedTest, name, test_function, kwargs,
+                          capture_output=True)
+          for name, test_function, kwargs in scheduled]
+      for future in futures:
+        result = future.result()
+        print(result.pop('output'), end='', flush=True)
+        cls.RESULTS.append(result)
+
+  @classmethod
+  def WriteReport(cls, filename, slowest=10):
+    """Writes timing report, JUnit XML if filename ends with .xml else JSON.
+
+    The slowest tests are printed too.
+    """
+    results = cls.RESULTS
+    slowest_results = sorted(results, key=lambda r: -r['seconds'])[:slowest]
+    if filename.endswith('.xml'):
+      WriteJUnitReport(results, filename)
+    else:
+      with open(filename, 'w', encoding='utf-8') as w:
+        json.dump({'total_seconds': sum(r['seconds'] for r in results),
+                   'tests': results,
+                   'slowest': slowest_results}, w, indent=1)
+    print('Slowest tests:')
+    for r in slowest_results:
+      print('% 50s   %.2fs' % (r['name'], r['seconds']))
+
+
+@contextlib.contextmanager
+def TestTempDirectory():
+  """Makes tempfile use a fresh directory, which is removed after the test.
+
+  Sources made by duckify_psql and files that programs write to temporary
+  directory then don't clash between tests running at the same time.
+  """
+  saved_tempdir = tempfile.tempdir
+  with tempfile.TemporaryDirectory(prefix='logica_test_') as temp_dir:
+    tempfile.tempdir = temp_dir
+    try:
+      yield temp_dir
+    finally:
+      tempfile.tempdir = saved_tempdir
+
+
+def RunTimedTest(name, test_function, kwargs, capture_output=False):
+  """Runs the test, returning its outcome and duration.
+
+  Args:
+    name: Name of the test.
+    test_function: RunTest or RunTypesTest.
+    kwargs: Arguments of test_function.
+    capture_output: Whether to return what the test printed instead of
+      printing it. Errors of the test are reported as its outcome then.
+  Returns:
+    Dictionary with name, status and seconds of the test, and its output if
+    it was captured.
+  """
+  output = io.StringIO()
+  start = time.perf_counter()
+  with contextlib.ExitStack() as stack:
+    stack.enter_context(TestTempDirectory())
+    if capture_output:
+      stack.enter_context(contextlib.redirect_stdout(output))
+      stack.enter_context(contextlib.redirect_stderr(output))
+    try:
+      status = test_function(**kwargs)
+    except Exception:
+      if not capture_output:
+        raise
+      traceback.print_exc()
+      status = 'ERROR'
+      print(color.Format('% 50s   %s' % (name, '{error}ERROR{end}')))
+  result = {'name': name, 'status': status,
+            'seconds': time.perf_counter() - start}
+  if capture_output:
+    result['output'] = output.getvalue()
+  return result
+
+
+def WriteJUnitReport(results, filename):
+  """Writes results of tests in JUnit XML format."""
+  suite = ElementTree.Element(
+      'testsuite', name='logica',
+      tests=str(len(results)),
+      failures=str(sum(r['status'] == 'FAILED' for r in results)),
+      errors=str(sum(r['status'] == 'ERROR' for r in results)),
+      skipped=str(sum(r['status'] == 'SKIPPED' for r in results)),
+      time='%.3f' % sum(r['seconds'] for r in results))
+  for r in results:
+    case = ElementTree.SubElement(suite, 'testcase', name=r['name'],
+                                  classname='logica',
+                                  time='%.3f' % r['seconds'])
+    if r['status'] == 'FAILED':
+      ElementTree.SubElement(case, 'failure', message='Golden mismatch.')
+    elif r['status'] == 'ERROR':
+      ElementTree.SubElement(case, 'error', message='Test raised.')
+    elif r['status'] == 'SKIPPED':
+      ElementTree.SubElement(case, 'skipped')
+  ElementTree.ElementTree(suite).write(filename, encoding='utf-8',
+                                       xml_declaration=True)
 
 
 def RunTypesTest(name, src=None, golden=None,
                  overwrite=False):
+  """Run one types test, returning PASSED or FAILED."""
   src = src or (name + '.l')
   golden = golden or (name + '.txt')
 
@@ -112,12 +254,15 @@ def RunTypesTest(name, src=None, golden=None,
   golden_result = golden_result.replace('\r\n', '\n').rstrip()
 
   if result == golden_result:
+    status = 'PASSED'
     test_result = '{ok}PASSED{end}'
   else:
     PrintDiff(result, golden_result)
+    status = 'FAILED'
     test_result = '{error}FAILED{end}'
 
   print('\033[F\033[K' + color.Format('% 50s   %s' % (name, test_result)))
+  return status
 
 
 def RunTest(name, src, predicate, golden,
@@ -125,7 +270,7 @@ def RunTest(name, src, predicate, golden,
             overwrite=False, announce=False,
             import_root=None, use_concertina=False,
             duckify_psql=False):
-  """Run one test."""
+  """Run one test, returning PASSED, FAILED or SKIPPED."""
   if announce:
     print('Running test:', name)
   test_result = '{warning}RUNNING{end}'
@@ -146,7 +291,7 @@ def RunTest(name, src, predicate, golden,
     # External tool or module not installed - skip test.
     test_result = '{warning}SKIPPED{end}'
     print('\033[F\033[K' + color.Format('% 50s   %s' % (name, test_result)))
-    return
+    return 'SKIPPED'
   # Hacky way to remove query that BQ prints.
   if '+---' in result[200:]:
     result = result[result.index('+---'):]
@@ -164,15 +309,18 @@ def RunTest(name, src, predicate, golden,
   golden_result = golden_result.replace('\r\n', '\n').rstrip()
 
   if result == golden_result:
+    status = 'PASSED'
     test_result = '{ok}PASSED{end}'
   else:
     PrintDiff(result, golden_result)
     if golden_result == 'This file does not exist. (<_<)':
       print('\x1B[3mGolden file is missing.\x1B[0m\n')
 
+    status = 'FAILED'
     test_result = '{error}FAILED{end}'
 
   print('\033[F\033[K' + color.Format('% 50s   %s' % (name, test_result)))
+  return status
 
 
 def PrintHeader():
@@ -22,8 +22,12 @@ import os
 from decimal import Decimal
 
 if '.' not in __package__:
+  from common import connection_pool
+  from common import result_stream
   from type_inference.research import infer
 else:
+  from ..common import connection_pool
+  from ..common import result_stream
   from ..type_inference.research import infer
 
 
@@ -71,38 +75,16 @@ def DigestMSSQLType(x):
   return x
 
 
-def MSSQLTypeAsDictionary(row, description):
-  """Convert a pyodbc row to a dictionary."""
-  result = {}
-  for i, col in enumerate(description):
-    col_name = col[0]
-    result[col_name] = DigestMSSQLType(row[i])
-  return result
-
-
-def MSSQLTypeAsList(rows, description):
-  """Convert pyodbc rows to a list of dictionaries."""
-  return [MSSQLTypeAsDictionary(row, description) for row in rows]
-
-
 REMEMBERED_CONNECTION_STR = None
 
 
-def ConnectToMSSQL(mode):
-  """Connect to Microsoft SQL Server.
+def MSSQLConnectionString(mode):
+  """Returns connection string of the mode.
 
   Args:
     mode: Either 'interactive' (prompt for credentials) or 'environment'
           (use LOGICA_MSSQL_CONNECTION environment variable).
-
-  Returns:
-    A pyodbc connection object.
-
-  The connection string can be in one of these formats:
-  - ODBC connection string: "DRIVER={ODBC Driver 17 for SQL Server};SERVER=...;DATABASE=...;UID=...;PWD=..."
-  - JSON config: {"server": "...", "database": "...", "user": "...", "password": "...", "driver": "..."}
   """
-  import pyodbc
   global REMEMBERED_CONNECTION_STR
 
   if mode == 'interactive':
@@ -121,7 +103,23 @@ def ConnectToMSSQL(mode):
         'in LOGICA_MSSQL_CONNECTION environment variable.')
   else:
     assert False, 'Unknown mode: ' + mode
+  return connection_str
+
+
+def ConnectWithString(connection_str):
+  """Connect to Microsoft SQL Server.
 
+  Args:
+    connection_str: Connection string.
+
+  Returns:
+    A pyodbc connection object.
+
+  The connection string can be in one of these formats:
+  - ODBC connection string: "DRIVER={ODBC Driver 17 for SQL Server};SERVER=...;DATABASE=...;UID=...;PWD=..."
+  - JSON config: {"server": "...", "database": "...", "user": "...", "password": "...", "driver": "..."}
+  """
+  import pyodbc
   if connection_str.startswith('{') and connection_str.endswith('}'):
     # JSON format
     config = json.loads(connection_str)
@@ -147,10 +145,120 @@ def ConnectToMSSQL(mode):
   return connection
 
 
-def FetchResults(cursor):
+def ConnectToMSSQL(mode):
+  """Connect to Microsoft SQL Server.
+
+  Args:
+    mode: Either 'interactive' (prompt for credentials) or 'environment'
+          (use LOGICA_MSSQL_CONNECTION environment variable).
+
+  Returns:
+    A pyodbc connection object.
+  """
+  return ConnectWithString(MSSQLConnectionString(mode))
+
+
+def ConnectionPool(mode='environment'):
+  """Returns shared pool of connections to the server of the mode."""
+  connection_str = MSSQLConnectionString(mode)
+  return connection_pool.GetPool(
+      'mssql', connection_str,
+      lambda: ConnectWithString(connection_str),
+      is_healthy=connection_pool.PingWithCursor)
+
+
+def FetchResults(cursor, column_types=None):
   """Fetch all results from a cursor and convert to Python types."""
   if cursor.description is None:
     return []
 
-  rows = cursor.fetchall()
-  return MSSQLTypeAsList(rows, cursor.description)
+  stream = CursorStream(cursor, column_types=column_types)
+  return [dict(zip(stream.header, row)) for row in stream.Rows()]
+
+
+def MSSQLColumnDigests(description, column_types=None):
+  """Decides how to digest each column of the result.
+
+  Strings are parsed as JSON only in columns that are inferred to be records
+  or lists. If the type of the column is unknown, the strings that look like
+  JSON are parsed.
+
+  Args:
+    description: Description of the cursor, with Python type of each column.
+    column_types: Inferred types of the columns by name, if known.
+  Returns:
+    Column digests for result_stream.
+  """
+  column_types = column_types or {}
+  digests = []
+  for column in description:
+    name, python_type = column[0], column[1]
+    column_type = column_types.get(name, 'Any')
+    if python_type is Decimal:
+      digests.append(result_stream.DigestNumbers)
+    elif python_type is not str:
+      digests.append(None)
+    elif result_stream.IsNestedType(column_type):
+      digests.append(result_stream.DigestEachValue(
+          result_stream.ParseJsonValue))
+    elif column_type == 'Any':
+      digests.append(result_stream.DigestEachValue(DigestMSSQLType))
+    else:
+      digests.append(None)
+  return digests
+
+
+def MSSQLArrowTypes(description, column_types=None):
+  """Decides Arrow type of each column of the result.
+
+  Args:
+    description: Description of the cursor, with Python type of each column.
+    column_types: Inferred types of the columns by name, if known.
+  Returns:
+    Names of Arrow types of the columns, None where not known.
+  """
+  column_types = column_types or {}
+  arrow_types = []
+  for column in description:
+    name, python_type = column[0], column[1]
+    if python_type is Decimal:
+      arrow_types.append(result_stream.DecimalArrowType(column[5]))
+    elif python_type is bool:
+      arrow_types.append('bool')
+    elif python_type is int:
+      arrow_types.append('int64')
+    elif python_type is float:
+      arrow_types.append('float64')
+    else:
+      arrow_types.append(
+          result_stream.ArrowTypeOfInferredType(column_types.get(name)))
+  return arrow_types
+
+
+def CursorStream(cursor, batch_size=result_stream.DEFAULT_BATCH_SIZE,
+                 column_types=None):
+  """Returns stream of result of the executed cursor."""
+  return result_stream.FromCursor(
+      cursor, batch_size,
+      digests_for_columns=lambda d: MSSQLColumnDigests(d, column_types),
+      arrow_types_for_columns=lambda d: MSSQLArrowTypes(d, column_types),
+      close=cursor.close)
+
+
+def MSSQLStream(sql, connection,
+                batch_size=result_stream.DEFAULT_BATCH_SIZE,
+                column_types=None):
+  """Execute SQL and stream its result in batches of rows.
+
+  Args:
+    sql: The SQL to execute.
+    connection: A pyodbc connection object.
+    batch_size: Number of rows to fetch at a time.
+    column_types: Inferred types of the columns, see
+      LogicaProgram.PredicateColumnTypes.
+
+  Returns:
+    result_stream.ResultStream of converted rows.
+  """
+  return CursorStream(MSSQLExecute(sql, connection), batch_size,
+                      column_types=column_types)
@@ -0,0 +1,162 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Profiling of phases of compilation.
+
+The compiler marks its phases with Phase, e.g.
+
+  with profiling.Phase('type inference'):
+    ...
+
+which records wall time and allocations of the phase when a Profiler is
+active in the thread, and does nothing otherwise. Phases nest, e.g. SQL of a
+predicate includes SQL of the predicates it uses.
+
+  profiler = profiling.Profiler()
+  with profiler.Active():
+    rules = parse.ParseFile(program_text)['rule']
+    program = universe.LogicaProgram(rules)
+    program.FormattedPredicateSql('Test')
+  print(sqlite3_logica.ArtisticTable(*profiler.Summary()))
+
+LogicaProgram also takes a profiler, which it activates while it's being
+built and while it compiles predicates.
+"""
+
+import collections
+import contextlib
+import threading
+import time
+import tracemalloc
+
+_ACTIVE = threading.local()
+
+
+class Profiler(object):
+  """Records phases that run while the profiler is active.
+
+  Attributes:
+    spans: Finished phases, in order of finishing. Each is a dictionary with
+      name, start and seconds since the profiler was created, seconds spent
+      in the phase itself and not in nested phases, net bytes allocated,
+      nesting depth and whether it's nested in a phase of the same name.
+    trace_allocations: Whether allocations are measured with tracemalloc,
+      which slows compilation down.
+  """
+
+  def __init__(self, trace_allocations=True):
+    self.spans = []
+    self.trace_allocations = trace_allocations
+    self.origin = time.perf_counter()
+    # Open phases, with the time spent in their finished nested phases.
+    self.stack = []
+
+  @contextlib.contextmanager
+  def Active(self):
+    """Context in which phases of the thread are recorded."""
+    previous = getattr(_ACTIVE, 'profiler', None)
+    if previous is self:
+      yield self
+      return
+    started_tracing = False
+    if self.trace_allocations and not tracemalloc.is_tracing():
+      tracemalloc.start()
+      started_tracing = True
+    _ACTIVE.profiler = self
+    try:
+      yield self
+    finally:
+      _ACTIVE.profiler = previous
+      if started_tracing:
+        tracemalloc.stop()
+
+  def AllocatedBytes(self):
+    if self.trace_allocations and tracemalloc.is_tracing():
+      return tracemalloc.get_traced_memory()[0]
+    return 0
+
+  @contextlib.contextmanager
+  def Span(self, name):
+    recursive = any(f['name'] == name for f in self.stack)
+    frame = {'name': name, 'nested_seconds': 0.0}
+    self.stack.append(frame)
+    allocated_before = self.AllocatedBytes()
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      seconds = time.perf_counter() - start
+      self.stack.pop()
+      if self.stack:
+        self.stack[-1]['nested_seconds'] += seconds
+      self.spans.append({
+          'name': name,
+          'start': start - self.origin,
+          'seconds': seconds,
+          'self_seconds': seconds - frame['nested_seconds'],
+          'allocated': self.AllocatedBytes() - allocated_before,
+          'depth': len(self.stack),
+          'recursive': recursive})
+
+  def Summary(self):
+    """Returns header and rows of a table of phases.
+
+    Phases of the same name are summed up and listed in the order in which
+    they first started. Time of nested phases is counted in the phase total,
+    but not in its self time.
+    """
+    totals = collections.OrderedDict()
+    for span in sorted(self.spans, key=lambda s: s['start']):
+      total = totals.setdefault(
+          span['name'], {'calls': 0, 'seconds': 0.0, 'self_seconds': 0.0,
+                         'allocated': 0, 'depth': span['depth']})
+      total['calls'] += 1
+      total['self_seconds'] += span['self_seconds']
+      # Phases nested in a phase of the same name are counted once.
+      if not span['recursive']:
+        total['seconds'] += span['seconds']
+        total['allocated'] += span['allocated']
+    header = ['phase', 'calls', 'total, ms', 'self, ms', 'allocated, KB']
+    rows = [['  ' * t['depth'] + name, t['calls'],
+             '%.1f' % (1000 * t['seconds']),
+             '%.1f' % (1000 * t['self_seconds']),
+             t['allocated'] // 1024]
+            for name, t in totals.items()]
+    return header, rows
+
+  def ChromeTrace(self):
+    """Returns phases in Chrome trace format, for chrome://tracing."""
+    events = [{'name': span['name'], 'ph': 'X', 'pid': 1, 'tid': 1,
+               'ts': round(span['start'] * 1e6),
+               'dur': round(span['seconds'] * 1e6),
+               'args': {'allocated_kb': span['allocated'] // 1024}}
+              for span in sorted(self.spans, key=lambda s: s['start'])]
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def Activated(profiler):
+  """Context activating the profiler, or doing nothing if it's None."""
+  if profiler is None:
+    return contextlib.nullcontext()
+  return profiler.Active()
+
+
+def Phase(name):
+  """Context recording the phase if a profiler is active in the thread."""
+  profiler = getattr(_ACTIVE, 'profiler', None)
+  if profiler is None:
+    return contextlib.nullcontext()
+  return profiler.Span(name)
@@ -0,0 +1,55 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unitests for profiling.py."""
+
+import unittest
+
+from common import profiling
+from compiler import universe
+from parser_py import parse
+
+
+class ProfilingTest(unittest.TestCase):
+  def test_PhasesAreRecordedOnlyWhenActive(self):
+    with profiling.Phase('ignored'):
+      pass
+    profiler = profiling.Profiler(trace_allocations=False)
+    with profiler.Active():
+      with profiling.Phase('outer'):
+        with profiling.Phase('inner'):
+          pass
+        with profiling.Phase('inner'):
+          pass
+    header, rows = profiler.Summary()
+    self.assertEqual(header[:2], ['phase', 'calls'])
+    self.assertEqual([r[:2] for r in rows], [['outer', 1], ['  inner', 2]])
+    trace = profiler.ChromeTrace()
+    self.assertEqual([e['name'] for e in trace['traceEvents']],
+                     ['outer', 'inner', 'inner'])
+
+  def test_LogicaProgramRecordsCompilationPhases(self):
+    rules = parse.ParseFile(
+        '@Engine("sqlite");\nT(x:) :- x in Range(3);')['rule']
+    profiler = profiling.Profiler(trace_allocations=False)
+    program = universe.LogicaProgram(rules, profiler=profiler)
+    program.FormattedPredicateSql('T')
+    names = {span['name'] for span in profiler.spans}
+    self.assertTrue({'make', 'formatted sql T', 'sql T'} <= names)
+
+
+if __name__ == '__main__':
+  unittest.main()
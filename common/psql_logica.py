@@ -15,14 +15,19 @@
 # limitations under the License.
 
 import getpass
+import itertools
 import json
 import os
 import re
 from decimal import Decimal
 
 if '.' not in __package__:
+  from common import connection_pool
+  from common import result_stream
   from type_inference.research import infer
 else:
+  from ..common import connection_pool
+  from ..common import result_stream
   from ..type_inference.research import infer
 
 
@@ -32,11 +37,7 @@ def PostgresExecute(sql, connection):
   cursor = connection.cursor()
   try:
     cursor.execute(sql)
-    # Make connection aware of the used types.
-    types = re.findall(r'-- Logica type: (\w*)', sql)
-    for t in types:
-      if t != 'logicarecord893574736':  # Empty record.
-        psycopg2.extras.register_composite(t, cursor, globally=True)
+    RegisterLogicaTypes(sql, cursor)
   except psycopg2.errors.UndefinedTable  as e:
     raise infer.TypeErrorCaughtException(
       infer.ContextualizedError.BuildNiceMessage(
@@ -47,6 +48,54 @@ def PostgresExecute(sql, connection):
   return cursor
 
 
+def RegisterLogicaTypes(sql, cursor):
+  """Makes connection aware of the types used by the SQL."""
+  import psycopg2.extras
+  types = re.findall(r'-- Logica type: (\w*)', sql)
+  for t in types:
+    if t != 'logicarecord893574736':  # Empty record.
+      psycopg2.extras.register_composite(t, cursor, globally=True)
+
+
+STREAM_CURSOR_COUNTER = itertools.count()
+
+
+def PostgresStream(query, connection, script=None,
+                   batch_size=result_stream.DEFAULT_BATCH_SIZE,
+                   column_types=None):
+  """Runs the script and streams result of the query.
+
+  The query is read with a server-side cursor, so the rows are transferred
+  a batch at a time.
+
+  Args:
+    query: Single SELECT statement.
+    connection: Connection to the database.
+    script: Statements to run before the query, e.g. its preamble.
+    batch_size: Number of rows to fetch at a time.
+    column_types: Inferred types of the columns, see
+      LogicaProgram.PredicateColumnTypes.
+  Returns:
+    result_stream.ResultStream of digested rows.
+  """
+  import psycopg2
+  if script and script.strip():
+    PostgresExecute(script, connection)
+  RegisterLogicaTypes(query, connection.cursor())
+  # Connections are in autocommit mode, so the cursor has to be WITH HOLD.
+  cursor = connection.cursor(
+      name='logica_stream_%d' % next(STREAM_CURSOR_COUNTER), withhold=True)
+  try:
+    cursor.execute(query)
+    stream = CursorStream(cursor, batch_size, column_types=column_types,
+                          close=cursor.close)
+  except psycopg2.errors.UndefinedTable as e:
+    raise infer.TypeErrorCaughtException(
+      infer.ContextualizedError.BuildNiceMessage(
+        'Running SQL.', 'Undefined table used: ' + str(e)))
+  return stream
+
+
 def DigestPsqlType(x):
   if isinstance(x, tuple):
     return PsqlTypeAsDictionary(x)
@@ -71,9 +120,79 @@ def PsqlTypeAsDictionary(record):
 def PsqlTypeAsList(a):
   return list(map(DigestPsqlType, a))
 
+
+# Types that psycopg2 reads as plain Python values, by their OIDs: bool,
+# bytea, char, name, int8, int2, int4, text, oid, json, float4, float8,
+# bpchar, varchar, date, time, timestamp, timestamptz, interval, uuid, jsonb.
+PLAIN_TYPE_OIDS = frozenset([16, 17, 18, 19, 20, 21, 23, 25, 26, 114, 700,
+                             701, 1042, 1043, 1082, 1083, 1114, 1184, 1186,
+                             2950, 3802])
+NUMERIC_OID = 1700
+# Arrow types of columns of plain types, by their OIDs.
+ARROW_TYPE_OF_OID = {16: 'bool', 20: 'int64', 21: 'int64', 23: 'int64',
+                     25: 'string', 700: 'float64', 701: 'float64',
+                     1042: 'string', 1043: 'string'}
+
+
+def PsqlColumnDigests(description, column_types=None):
+  """Decides how to digest each column of the result.
+
+  Args:
+    description: Description of the cursor.
+    column_types: Inferred types of the columns by name, if known.
+  Returns:
+    Column digests for result_stream.
+  """
+  column_types = column_types or {}
+  digests = []
+  for column in description:
+    name, type_oid = column[0], column[1]
+    if type_oid == NUMERIC_OID:
+      digests.append(result_stream.DigestNumbers)
+    elif (type_oid in PLAIN_TYPE_OIDS or
+          column_types.get(name) in ('Str', 'Bool')):
+      digests.append(None)
+    else:
+      # Records, arrays and types we don't know.
+      digests.append(result_stream.DigestEachValue(DigestPsqlType))
+  return digests
+
+
+def PsqlArrowTypes(description, column_types=None):
+  """Decides Arrow type of each column of the result.
+
+  Args:
+    description: Description of the cursor.
+    column_types: Inferred types of the columns by name, if known.
+  Returns:
+    Names of Arrow types of the columns, None where not known.
+  """
+  column_types = column_types or {}
+  arrow_types = []
+  for column in description:
+    name, type_oid = column[0], column[1]
+    if type_oid == NUMERIC_OID:
+      # Scale of numeric without type modifier is unknown.
+      arrow_types.append(result_stream.DecimalArrowType(column[5]))
+    elif type_oid in ARROW_TYPE_OF_OID:
+      arrow_types.append(ARROW_TYPE_OF_OID[type_oid])
+    else:
+      arrow_types.append(
+          result_stream.ArrowTypeOfInferredType(column_types.get(name)))
+  return arrow_types
+
+
+def CursorStream(cursor, batch_size=result_stream.DEFAULT_BATCH_SIZE,
+                 column_types=None, close=None):
+  """Returns stream of result of the executed cursor."""
+  return result_stream.FromCursor(
+      cursor, batch_size,
+      digests_for_columns=lambda d: PsqlColumnDigests(d, column_types),
+      arrow_types_for_columns=lambda d: PsqlArrowTypes(d, column_types),
+      close=close)
+
 REMEMBERED_CONNECTION_STR = None
-def ConnectToPostgres(mode):
-  import psycopg2
+def PostgresConnectionString(mode):
   global REMEMBERED_CONNECTION_STR
   if mode == 'interactive':
     if REMEMBERED_CONNECTION_STR:
@@ -89,6 +208,11 @@ def ConnectToPostgres(mode):
         'in LOGICA_PSQL_CONNECTION.')
   else:
     assert False, 'Unknown mode:' + mode
+  return connection_str
+
+
+def ConnectWithString(connection_str):
+  import psycopg2
   if connection_str.startswith('postgres'):
     connection = psycopg2.connect(connection_str)
   else:
@@ -96,4 +220,18 @@ def ConnectToPostgres(mode):
     connection = psycopg2.connect(**connection_json)
 
   connection.autocommit = True
-  return connection
\ No newline at end of file
+  return connection
+
+
+def ConnectToPostgres(mode):
+  return ConnectWithString(PostgresConnectionString(mode))
+
+
+def ConnectionPool(mode='environment'):
+  """Returns shared pool of connections to the database of the mode."""
+  import psycopg2  # Failing early if the driver is not installed.
+  connection_str = PostgresConnectionString(mode)
+  return connection_pool.GetPool(
+      'psql', connection_str,
+      lambda: ConnectWithString(connection_str),
+      is_healthy=connection_pool.PingWithCursor)
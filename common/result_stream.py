@@ -0,0 +1,344 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Streaming of query results in batches of rows.
+
+Results are read from the database a batch at a time and are written out
+batch by batch, so that exporting a large predicate runs in memory bounded
+by the batch size. Engine modules build streams from their cursors, e.g.
+psql_logica.PostgresStream reads with a server-side cursor.
+
+Values that drivers return are digested into plain Python values column
+by column. Engine modules decide how to digest each column once, from the
+description of the result and the inferred types of the predicate, so that
+columns of plain values are passed through untouched and JSON is parsed
+only in columns of records and lists.
+
+Streams also convert to Arrow, where decimals are converted by Arrow
+compute kernels instead. Schema of an Arrow reader is fixed before the
+batches are read, so engine modules also decide Arrow type of each column
+from the description of the result and the inferred types.
+"""
+
+import csv
+from decimal import Decimal
+import itertools
+import json
+
+DEFAULT_BATCH_SIZE = 10000
+
+# Arrow type of columns that have no declared type and no values in the
+# first batch. Values of any other scalar type can be cast to it.
+DEFAULT_ARROW_TYPE = 'string'
+
+
+class ResultStream(object):
+  """Header and rows of a query result, which are read in batches.
+
+  Rows can be read only once.
+
+  Attributes:
+    header: List of column names.
+  """
+
+  def __init__(self, header, batches, close=None,
+               digest_row=None, column_digests=None, arrow_types=None):
+    """Initializes the stream.
+
+    Args:
+      header: List of column names.
+      batches: Iterable of lists of rows, as returned by the driver.
+      close: Function without arguments called once the rows are read, or
+        reading them stopped.
+      digest_row: Function converting a row of the driver to a list of
+        plain Python values.
+      column_digests: List with a function per column, converting list of
+        values of the column to plain Python values, or None for columns
+        that need no conversion. Used instead of digest_row.
+      arrow_types: List with name of Arrow type of each column, e.g.
+        'int64', or None for columns whose type is not known up front.
+    """
+    self.header = list(header)
+    self.batches = batches
+    self.close = close
+    self.digest_row = digest_row
+    self.column_digests = column_digests
+    self.arrow_types = arrow_types
+
+  def RawBatches(self):
+    """Yields batches of rows as returned by the driver."""
+    try:
+      for batch in self.batches:
+        if batch:
+          yield batch
+    finally:
+      self.Close()
+
+  def Batches(self):
+    """Yields batches of digested rows."""
+    digest_row = self.digest_row
+    column_digests = self.column_digests
+    if column_digests is not None and not any(column_digests):
+      column_digests = None
+    for batch in self.RawBatches():
+      if column_digests:
+        batch = DigestColumns(batch, column_digests)
+      elif digest_row:
+        batch = [digest_row(row) for row in batch]
+      yield batch
+
+  def Rows(self):
+    for batch in self.Batches():
+      yield from batch
+
+  def Fetchall(self):
+    return list(self.Rows())
+
+  def Close(self):
+    if self.close:
+      close, self.close = self.close, None
+      close()
+
+
+def DigestColumns(rows, column_digests):
+  """Digests batch of rows column by column, returning list of lists."""
+  columns = list(zip(*rows))
+  for i, digest in enumerate(column_digests):
+    if digest:
+      columns[i] = digest(columns[i])
+  return [list(row) for row in zip(*columns)]
+
+
+def DecimalAsNumber(x):
+  if x.as_integer_ratio()[1] == 1:
+    return int(x)
+  return float(x)
+
+
+def DigestNumbers(values):
+  """Column digest converting decimals to integers if integral, else floats.
+
+  Arrow converts decimals itself, so this digest is skipped for Arrow.
+  """
+  return [DecimalAsNumber(v) if isinstance(v, Decimal) else v
+          for v in values]
+
+
+def DigestEachValue(digest):
+  """Returns column digest applying digest to each value that's not null."""
+  def DigestValues(values):
+    return [None if v is None else digest(v) for v in values]
+  return DigestValues
+
+
+def ParseJsonValue(x):
+  if isinstance(x, str):
+    try:
+      return json.loads(x)
+    except json.JSONDecodeError:
+      pass
+  return x
+
+
+def IsNestedType(t):
+  """Tells whether inferred type is of records or lists."""
+  return isinstance(t, (list, dict))
+
+
+def ArrowTypeOfInferredType(t):
+  """Returns name of Arrow type of a column of inferred type, or None.
+
+  Numbers are floats, as inferred type does not tell integers apart.
+  """
+  if not isinstance(t, str):
+    return None
+  return {'Num': 'float64', 'Str': 'string', 'Bool': 'bool'}.get(t)
+
+
+def InferredArrowTypes(header, column_types=None):
+  """Returns names of Arrow types of columns by their inferred types."""
+  column_types = column_types or {}
+  return [ArrowTypeOfInferredType(column_types.get(name)) for name in header]
+
+
+def DecimalArrowType(scale):
+  """Returns name of Arrow type of a decimal column of the given scale.
+
+  Decimals with fractional digits, or of unknown scale, are floats.
+  """
+  return 'int64' if scale == 0 else 'float64'
+
+
+def CursorBatches(cursor, batch_size, first_batch=None):
+  """Yields batches of rows of a DB-API cursor."""
+  if first_batch is not None:
+    yield first_batch
+  while True:
+    batch = cursor.fetchmany(batch_size)
+    if not batch:
+      return
+    yield batch
+
+
+def FromCursor(cursor, batch_size=DEFAULT_BATCH_SIZE, digest_row=None,
+               digests_for_columns=None, arrow_types_for_columns=None,
+               close=None):
+  """Returns stream of rows of a DB-API cursor with executed query.
+
+  Args:
+    cursor: Cursor, which supports fetchmany.
+    batch_size: Number of rows to fetch at a time.
+    digest_row: Function converting a row as returned by the driver.
+    digests_for_columns: Function from cursor.description to column
+      digests of the stream.
+    arrow_types_for_columns: Function from cursor.description to names of
+      Arrow types of the columns.
+    close: Function called when the stream is read.
+  """
+  first_batch = None
+  if cursor.description is None:
+    # Server-side cursors learn about columns from the first fetch.
+    first_batch = cursor.fetchmany(batch_size)
+  description = cursor.description or []
+  header = [d[0] for d in description]
+  column_digests = None
+  if digests_for_columns:
+    column_digests = digests_for_columns(description)
+  arrow_types = None
+  if arrow_types_for_columns:
+    arrow_types = arrow_types_for_columns(description)
+  return ResultStream(header, CursorBatches(cursor, batch_size, first_batch),
+                      close=close, digest_row=digest_row,
+                      column_digests=column_digests, arrow_types=arrow_types)
+
+
+def FromRowIterator(header, rows, batch_size=DEFAULT_BATCH_SIZE,
+                    digest_row=None, column_digests=None, arrow_types=None,
+                    close=None):
+  """Returns stream of rows of an iterator, e.g. ClickHouse execute_iter."""
+  def Batches():
+    while True:
+      batch = list(itertools.islice(rows, batch_size))
+      if not batch:
+        return
+      yield batch
+  return ResultStream(header, Batches(), close=close, digest_row=digest_row,
+                      column_digests=column_digests, arrow_types=arrow_types)
+
+
+def WriteCsv(stream, output):
+  """Writes the stream to a text file object as CSV with header."""
+  writer = csv.writer(output)
+  writer.writerow(stream.header)
+  for batch in stream.Batches():
+    writer.writerows(batch)
+
+
+def WriteJsonLines(stream, output):
+  """Writes the stream to a text file object, a JSON object per row."""
+  header = stream.header
+  for batch in stream.Batches():
+    output.write(''.join(
+        json.dumps(dict(zip(header, row)), default=str) + '\n'
+        for row in batch))
+
+
+def DecimalsAsNumbers(array):
+  """Converts decimal array to integers if all are integral, else floats.
+
+  This is what digestion of decimal values does, done for whole column.
+  """
+  import pyarrow
+  import pyarrow.compute
+  if not pyarrow.types.is_decimal(array.type):
+    return array
+  as_float = pyarrow.compute.cast(array, pyarrow.float64())
+  integral = (array.type.scale == 0 or
+              pyarrow.compute.all(pyarrow.compute.equal(
+                  pyarrow.compute.floor(as_float), as_float)).as_py()
+              is not False)
+  if integral:
+    try:
+      return pyarrow.compute.cast(array, pyarrow.int64())
+    except pyarrow.ArrowInvalid:
+      pass  # Does not fit 64 bits.
+  return as_float
+
+
+def ArrowBatch(header, rows, column_digests=None):
+  """Converts batch of rows of the driver to pyarrow.RecordBatch."""
+  import pyarrow
+  columns = list(zip(*rows)) if rows else [[] for _ in header]
+  arrays = []
+  for i, values in enumerate(columns):
+    digest = column_digests[i] if column_digests else None
+    if digest and digest is not DigestNumbers:
+      values = digest(values)
+    arrays.append(DecimalsAsNumbers(pyarrow.array(values)))
+  return pyarrow.RecordBatch.from_arrays(arrays, names=header)
+
+
+def ArrowBatches(stream):
+  """Yields batches of the stream as pyarrow.RecordBatch."""
+  for rows in stream.RawBatches():
+    yield ArrowBatch(stream.header, rows, stream.column_digests)
+
+
+def WidenedArrowType(t):
+  """Type of a column guessed from its first values, for its later values."""
+  import pyarrow
+  if pyarrow.types.is_integer(t):
+    return pyarrow.float64()
+  return t
+
+
+def ToArrowReader(stream):
+  """Returns pyarrow.RecordBatchReader reading the stream batch by batch.
+
+  Schema of the reader is decided after reading at most one batch. Types
+  of columns come from arrow_types of the stream. Other columns get the
+  type of their values in the first batch, with integers widened to floats,
+  as later values may have fractions, or DEFAULT_ARROW_TYPE if the first
+  batch has none.
+  """
+  import pyarrow
+  batches = ArrowBatches(stream)
+  types = [None if t is None else pyarrow.type_for_alias(t)
+           for t in stream.arrow_types or [None] * len(stream.header)]
+  read_ahead = []
+  if None in types:
+    batch = next(batches, None)
+    if batch is not None:
+      read_ahead.append(batch)
+      for i, column in enumerate(batch.columns):
+        if types[i] is None and column.null_count < len(column):
+          types[i] = WidenedArrowType(column.type)
+  schema = pyarrow.schema([
+      pyarrow.field(name,
+                    pyarrow.type_for_alias(DEFAULT_ARROW_TYPE) if t is None
+                    else t)
+      for name, t in zip(stream.header, types)])
+  def AllBatches():
+    for batch in itertools.chain(read_ahead, batches):
+      if batch.schema != schema:
+        batch = batch.cast(schema)
+      yield batch
+  return pyarrow.RecordBatchReader.from_batches(schema, AllBatches())
+
+
+def ToArrowTable(stream):
+  """Reads the stream into pyarrow.Table, with schema of ToArrowReader."""
+  return ToArrowReader(stream).read_all()
@@ -0,0 +1,157 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unitests for result_stream.py."""
+
+from decimal import Decimal
+import importlib.util
+import io
+import unittest
+
+from common import logica_lib
+from common import mssql_logica
+from common import psql_logica
+from common import result_stream
+from common import sqlite3_logica
+
+
+class ResultStreamTest(unittest.TestCase):
+  def test_SqliteStreamIsReadInBatches(self):
+    stream = sqlite3_logica.SqliteStream(
+        ['CREATE TABLE T AS SELECT 1 AS a UNION ALL SELECT 2 UNION ALL '
+         'SELECT 3', 'SELECT a, a * 10 AS b FROM T ORDER BY a'],
+        batch_size=2)
+    self.assertEqual(stream.header, ['a', 'b'])
+    self.assertEqual([len(b) for b in stream.Batches()], [2, 1])
+
+  def test_WriteCsvMatchesCsvFormatter(self):
+    header = ['x', 'y']
+    rows = [(1, 'a,b'), (2, 'line\nbreak')]
+    output = io.StringIO()
+    result_stream.WriteCsv(
+        result_stream.FromRowIterator(header, iter(rows), batch_size=1),
+        output)
+    self.assertEqual(output.getvalue(), sqlite3_logica.Csv(header, rows))
+
+  def test_WriteJsonLinesDigestsRows(self):
+    closed = []
+    stream = result_stream.FromRowIterator(
+        ['x', 'y'], iter([(1, 2), (3, 4)]),
+        digest_row=lambda row: [v * 2 for v in row],
+        close=lambda: closed.append(True))
+    output = io.StringIO()
+    result_stream.WriteJsonLines(stream, output)
+    self.assertEqual(output.getvalue(),
+                     '{"x": 2, "y": 4}\n{"x": 6, "y": 8}\n')
+    self.assertEqual(closed, [True])
+
+  def test_OnlyColumnsWithDigestsAreDigested(self):
+    digested = []
+    def Digest(x):
+      digested.append(x)
+      return -x
+    stream = result_stream.FromRowIterator(
+        ['a', 'b', 'c'],
+        iter([(Decimal('1'), 1, 'x'), (Decimal('1.5'), None, 'y')]),
+        column_digests=[result_stream.DigestNumbers,
+                        result_stream.DigestEachValue(Digest), None])
+    self.assertEqual(stream.Fetchall(), [[1, -1, 'x'], [1.5, None, 'y']])
+    self.assertEqual(digested, [1])
+
+  def test_MSSQLParsesJsonOnlyInColumnsOfRecordsAndLists(self):
+    description = [('l', str), ('s', str), ('u', str), ('n', Decimal),
+                   ('i', int)]
+    digests = mssql_logica.MSSQLColumnDigests(
+        description, {'l': ['Num'], 's': 'Str', 'n': 'Num', 'i': 'Num'})
+    self.assertIsNone(digests[1])
+    self.assertIs(digests[3], result_stream.DigestNumbers)
+    self.assertIsNone(digests[4])
+    rows = [('[1, 2]', '[1, 2]', '{"a": 1}', Decimal('2'), 3)]
+    self.assertEqual(result_stream.DigestColumns(rows, digests),
+                     [[[1, 2], '[1, 2]', {'a': 1}, 2, 3]])
+
+  @unittest.skipUnless(importlib.util.find_spec('pyarrow'),
+                       'pyarrow is not installed.')
+  def test_ToArrowTableDigestsDecimalColumns(self):
+    stream = result_stream.FromRowIterator(
+        ['a', 'b', 'c'],
+        iter([(Decimal('1'), Decimal('2.5'), None),
+              (Decimal('3'), Decimal('4'), 5)]),
+        batch_size=1,
+        arrow_types=[result_stream.DecimalArrowType(0),
+                     result_stream.DecimalArrowType(1), 'int64'])
+    table = result_stream.ToArrowTable(stream)
+    self.assertEqual(table.to_pydict(),
+                     {'a': [1, 3], 'b': [2.5, 4.0], 'c': [None, 5]})
+    self.assertEqual(str(table.schema.field('a').type), 'int64')
+
+  @unittest.skipUnless(importlib.util.find_spec('pyarrow'),
+                       'pyarrow is not installed.')
+  def test_ToArrowReaderDigestsDecimalColumns(self):
+    stream = result_stream.FromRowIterator(
+        ['a', 'b', 'c'],
+        iter([(Decimal('1'), Decimal('2'), None),
+              (Decimal('3'), Decimal('4.5'), 5)]),
+        batch_size=1,
+        arrow_types=[result_stream.DecimalArrowType(0),
+                     result_stream.DecimalArrowType(2), 'float64'])
+    table = result_stream.ToArrowReader(stream).read_all()
+    self.assertEqual(table.to_pydict(),
+                     {'a': [1, 3], 'b': [2.0, 4.5], 'c': [None, 5.0]})
+    self.assertEqual([str(t) for t in table.schema.types],
+                     ['int64', 'double', 'double'])
+
+  @unittest.skipUnless(importlib.util.find_spec('pyarrow'),
+                       'pyarrow is not installed.')
+  def test_ToArrowReaderTypesUnknownColumnsByFirstBatch(self):
+    read = []
+    def Rows():
+      for row in [(1, None, None), (2.5, None, 'a'), (3, 4, None)]:
+        read.append(row)
+        yield row
+    stream = result_stream.FromRowIterator(['n', 'x', 's'], Rows(),
+                                           batch_size=1)
+    reader = result_stream.ToArrowReader(stream)
+    self.assertEqual(len(read), 1)
+    self.assertEqual([str(t) for t in reader.schema.types],
+                     ['double', 'string', 'string'])
+    self.assertEqual(reader.read_all().to_pydict(),
+                     {'n': [1.0, 2.5, 3.0], 'x': [None, None, '4'],
+                      's': [None, 'a', None]})
+
+  @unittest.skipUnless(importlib.util.find_spec('pyarrow'),
+                       'pyarrow is not installed.')
+  def test_ArrowTableAndReaderHaveSameSchema(self):
+    for sql in ['SELECT 1 AS x, NULL AS y', 'SELECT 1 AS x, NULL AS y;']:
+      table = logica_lib.RunQueryArrow(sql, 'sqlite')
+      reader = logica_lib.RunQueryArrow(sql, 'sqlite', as_reader=True)
+      self.assertEqual(table.schema, reader.schema)
+      self.assertEqual(table.to_pydict(), {'x': [1.0], 'y': [None]})
+
+  def test_PsqlArrowTypesComeFromDescription(self):
+    # Name, type OID and scale, as in psycopg2 description.
+    description = [('i', 20, None, None, None, None),
+                   ('d', 1700, None, None, None, None),
+                   ('k', 1700, None, None, 10, 0),
+                   ('r', 2249, None, None, None, None),
+                   ('t', 1114, None, None, None, None)]
+    self.assertEqual(
+        psql_logica.PsqlArrowTypes(description, {'r': {'a': 'Num'}}),
+        ['int64', 'float64', 'int64', None, None])
+
+
+if __name__ == '__main__':
+  unittest.main()
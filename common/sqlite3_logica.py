@@ -3,6 +3,7 @@
 import csv
 import hashlib
 import io
+import itertools
 import math
 import sys
 import sqlite3
@@ -14,9 +15,11 @@ import re
 if '.' not in __package__:
   from common import intelligence
   from common import callclingo
+  from common import result_stream
 else:
   from ..common import intelligence
   from ..common import callclingo
+  from ..common import result_stream
 
 
 def DeFactoType(value):
@@ -126,6 +129,19 @@ class ArrayConcatAgg:
     return json.dumps(self.result)
   
 
+class ContentHash:
+  """Hash of a multiset of values, which does not depend on their order."""
+  def __init__(self):
+    self.result = 0
+
+  def step(self, value):
+    digest = hashlib.sha256(str(value).encode()).digest()
+    self.result = (self.result + int.from_bytes(digest, 'big')) % (1 << 256)
+
+  def finalize(self):
+    return '%064x' % self.result
+
+
 def ArrayConcat(a, b):
   if a is None or b is None:
     return None
@@ -171,46 +187,101 @@ def DataframeAsArtisticTable(df):
 
 def ArtisticTable(header, rows):
   """ASCII art table for query output with multiline strings."""
-  def Pad(s, w):
-    return str(s) + ' ' * (w - len(str(s)))
-
-  def RowLines(row, width):
-      row_columns = [str(x).split('\n') for x in row]
-      height = max(len(x) for x in row_columns)
-      result = []
-      for i in range(height):
-          next_row = []
-          for j in range(len(row)):
-              if len(row_columns[j]) > i:
-                  next_row.append(row_columns[j][i])
-              else:
-                  next_row.append('')
-          result.append(next_row)
-      return [
-          '| ' + ' | '.join(Pad(r, w) for r, w in zip(rr, width)) + ' |'
-          for rr in result
-      ]
+  return '\n'.join(ArtisticTableLines(header, rows))
+
+
+# Number of rows that widths of columns of printed tables are computed from.
+ARTISTIC_TABLE_SAMPLE_SIZE = 10000
+# Cells of printed tables are cut to this width.
+ARTISTIC_TABLE_MAX_CELL_WIDTH = 1000
+
+
+def ArtisticTableLines(header, rows, sample_size=None, max_cell_width=None,
+                       max_rows=None):
+  """Yields lines of ASCII art table with multiline strings.
+
+  Args:
+    header: List of column names.
+    rows: Iterable of rows, which is read once.
+    sample_size: Widths of columns are computed from this many first rows,
+      or from all rows if None. Cells of later rows that don't fit the
+      width stick out of the column.
+    max_cell_width: Maximal width of a column, wider cells are cut.
+    max_rows: Only this many rows are rendered, the rest are counted.
+  """
+  def CellWidth(s):
+    if '\n' in s:
+      return max(len(x) for x in s.split('\n'))
+    return len(s)
+
+  def Fit(s, w):
+    if max_cell_width is not None and len(s) > max(w, max_cell_width):
+      return s[:w - 1] + '…' if w > 0 else ''
+    return s + ' ' * (w - len(s))
+
+  def RowLines(row_columns, width):
+    height = max(len(x) for x in row_columns)
+    for i in range(height):
+      yield '| ' + ' | '.join(
+          Fit(c[i] if len(c) > i else '', w)
+          for c, w in zip(row_columns, width)) + ' |'
+
+  rows = iter(rows)
+  if sample_size is None:
+    sample = [[str(x) for x in r] for r in rows]
+  else:
+    sample = [[str(x) for x in r] for r in itertools.islice(rows, sample_size)]
   width = [0] * len(header)
-  for r in [header] + rows:
+  for r in [[str(h) for h in header]] + sample:
     for i in range(len(r)):
-      width[i] = max(width[i],
-                     max(len(x) for x in str(r[i]).split('\n')))
-  result = []
+      width[i] = max(width[i], CellWidth(r[i]))
+  if max_cell_width is not None:
+    width = [max(min(w, max_cell_width), len(str(h)))
+             for w, h in zip(width, header)]
+
   top_line = '+-' + '-+-'.join('-' * w for w in width) + '-+'
-  header_line = '| ' + ' | '.join(Pad(h, w) for h, w in zip(header, width)) + ' |'
-  result = [top_line, header_line, top_line]
-  for row in rows:
-    line = '| ' + ' | '.join(Pad(r, w) for r, w in zip(row, width)) + ' |'
-    if '\n' in line:
-      sep_up = '/˙' + '˙|˙'.join('˙' * w for r, w in zip(row, width)) + '˙\\'
-      sep_down = '\\.' + '.|.'.join('.' * w for r, w in zip(row, width)) + './'
-      result.append(sep_up)
-      result += RowLines(row, width)
-      result.append(sep_down)
+  yield top_line
+  yield '| ' + ' | '.join(
+      str(h) + ' ' * (w - len(str(h))) for h, w in zip(header, width)) + ' |'
+  yield top_line
+  sep_up = '/˙' + '˙|˙'.join('˙' * w for w in width) + '˙\\'
+  sep_down = '\\.' + '.|.'.join('.' * w for w in width) + './'
+  all_rows = itertools.chain(
+      sample, ([str(x) for x in r] for r in rows))
+  for row in itertools.islice(all_rows, max_rows):
+    row = row[:len(width)]
+    if any('\n' in c for c in row):
+      yield sep_up
+      yield from RowLines([c.split('\n') for c in row], width)
+      yield sep_down
     else:
-      result.append(line)
-  result.append(top_line)
-  return '\n'.join(result)
+      yield '| ' + ' | '.join(Fit(c, w) for c, w in zip(row, width)) + ' |'
+  yield top_line
+  if max_rows is not None:
+    # Remaining rows are read, but not rendered.
+    more_rows = sum(1 for _ in itertools.islice(sample, max_rows, None))
+    more_rows += sum(1 for _ in rows)
+    if more_rows:
+      yield '... %d more row%s' % (more_rows, '' if more_rows == 1 else 's')
+
+
+def WriteArtisticTable(header, rows, output, max_rows=None,
+                       sample_size=ARTISTIC_TABLE_SAMPLE_SIZE,
+                       max_cell_width=ARTISTIC_TABLE_MAX_CELL_WIDTH):
+  """Writes ASCII art table to the output as rows are read.
+
+  Memory used is bounded by the sample of rows that widths are computed
+  from, so that large results can be printed.
+  """
+  lines = ArtisticTableLines(header, rows, sample_size=sample_size,
+                             max_cell_width=max_cell_width,
+                             max_rows=max_rows)
+  while True:
+    chunk = list(itertools.islice(lines, 1000))
+    if not chunk:
+      break
+    output.write('\n'.join(chunk) + '\n')
+  output.flush()
 
 
 def ArtisticTableMinimal(header, rows):
@@ -280,6 +351,7 @@ def ExtendConnectionWithLogicaFunctions(con):
   con.create_aggregate('DistinctListAgg', 1, DistinctListAgg)
   con.create_aggregate('ARRAY_CONCAT_AGG', 1, ArrayConcatAgg)
   con.create_aggregate('ANY_VALUE', 1, TakeFirst)
+  con.create_aggregate('ContentHash', 1, ContentHash)
   con.create_function('PrintToConsole', 1, PrintToConsole)
   con.create_function('ARRAY_CONCAT', 2, ArrayConcat)
   con.create_function('JOIN_STRINGS', 2, Join)
@@ -333,6 +405,17 @@ def RunSqlScript(statements, output_format):
   return result
 
 
+def SqliteStream(statements, batch_size=result_stream.DEFAULT_BATCH_SIZE):
+  """Runs a sequence of statements, streaming result of final."""
+  assert statements, 'SqliteStream requires non-empty statements list.'
+  connect = SqliteConnect()
+  cursor = connect.cursor()
+  for s in statements[:-1]:
+    cursor.executescript(s)
+  cursor.execute(statements[-1])
+  return result_stream.FromCursor(cursor, batch_size, close=connect.close)
+
+
 def RunSQL(sql, output_format='artistictable'):
   """Running SQL with artistictable or csv output."""
   connect = SqliteConnect()
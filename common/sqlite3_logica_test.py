@@ -0,0 +1,86 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unitests for sqlite3_logica.py."""
+
+import io
+import unittest
+
+from common import sqlite3_logica
+
+
+class ArtisticTableTest(unittest.TestCase):
+  def test_MultilineCells(self):
+    self.assertEqual(
+        sqlite3_logica.ArtisticTable(['a', 'b'], [(1, 'x\nyz'), (None, 2)]),
+        '+------+----+\n'
+        '| a    | b  |\n'
+        '+------+----+\n'
+        '/˙˙˙˙˙˙|˙˙˙˙\\\n'
+        '| 1    | x  |\n'
+        '|      | yz |\n'
+        '\\......|..../\n'
+        '| None | 2  |\n'
+        '+------+----+')
+
+  def test_WrittenTableMatchesArtisticTable(self):
+    rows = [(i, 'v%d' % i) for i in range(5)]
+    output = io.StringIO()
+    sqlite3_logica.WriteArtisticTable(['a', 'b'], iter(rows), output)
+    self.assertEqual(output.getvalue(),
+                     sqlite3_logica.ArtisticTable(['a', 'b'], rows) + '\n')
+
+  def test_WrittenTableIsLimited(self):
+    rows = [(i, 'w' * 10 * i) for i in range(1, 6)]
+    output = io.StringIO()
+    sqlite3_logica.WriteArtisticTable(['a', 'b'], iter(rows), output,
+                                      max_rows=2, sample_size=3,
+                                      max_cell_width=15)
+    self.assertEqual(output.getvalue(),
+                     '+---+-----------------+\n'
+                     '| a | b               |\n'
+                     '+---+-----------------+\n'
+                     '| 1 | wwwwwwwwww      |\n'
+                     '| 2 | wwwwwwwwwwwwww… |\n'
+                     '+---+-----------------+\n'
+                     '... 3 more rows\n')
+
+
+
+class ContentHashTest(unittest.TestCase):
+  def ContentHash(self, rows):
+    connection = sqlite3_logica.SqliteConnect()
+    connection.execute('CREATE TABLE t (a, b)')
+    connection.executemany('INSERT INTO t VALUES (?, ?)', rows)
+    [(content_hash,)] = connection.execute(
+        'SELECT ContentHash(JSON_ARRAY(a, b)) FROM t').fetchall()
+    return content_hash
+
+  def test_HashDoesNotDependOnOrderOfRows(self):
+    rows = [(i, 'v%d' % i) for i in range(10)]
+    self.assertEqual(self.ContentHash(rows), self.ContentHash(rows[::-1]))
+    self.assertEqual(len(self.ContentHash(rows)), 64)
+
+  def test_HashDependsOnContent(self):
+    rows = [(1, 'x'), (2, 'y')]
+    self.assertNotEqual(self.ContentHash(rows),
+                        self.ContentHash([(1, 'y'), (2, 'x')]))
+    self.assertNotEqual(self.ContentHash(rows),
+                        self.ContentHash(rows + [(1, 'x')]))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,163 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Transitive dependencies of predicates.
+
+Predicates and the predicates that they use form a graph. The graph is
+condensed into a DAG of strongly connected components and reachability is
+computed bottom-up over the DAG. Sets of reachable predicates are kept as
+bitsets (python integers), so that reachability of a component is a union
+of reachability of the components that it calls.
+
+When predicates get defined, only closures of the predicates that depend on
+them are recomputed.
+"""
+
+
+class DependencyGraph(object):
+  """Closure of direct dependencies of predicates.
+
+  Attributes:
+    direct_args_of: Dictionary mapping defined predicates to the sets of
+      predicates that they use directly. It's owned by the caller, who calls
+      Update after changing it.
+    args_of: Dictionary mapping predicates to the sets of predicates that
+      they use directly or indirectly. A predicate is in its own set iff
+      it's recursive. Predicates that are used, but not defined, map to
+      empty sets.
+  """
+
+  def __init__(self, direct_args_of):
+    self.direct_args_of = direct_args_of
+    self.args_of = {}
+    # Predicate -> its bit index and bit index -> predicate.
+    self.index = {}
+    self.names = []
+    # Defined predicate -> bitset of predicates it reaches.
+    self.reach = {}
+    # Listing defined predicates first and in a deterministic order, as
+    # recursion analysis follows the order of args_of.
+    for p in sorted(direct_args_of):
+      self.args_of[p] = set()
+    self.Update(sorted(direct_args_of))
+
+  def Bit(self, predicate):
+    if predicate not in self.index:
+      self.index[predicate] = len(self.names)
+      self.names.append(predicate)
+    return 1 << self.index[predicate]
+
+  def Names(self, bits):
+    """Returns the set of predicates of the bitset."""
+    result = set()
+    binary = format(bits, 'b')[::-1]
+    i = binary.find('1')
+    while i != -1:
+      result.add(self.names[i])
+      i = binary.find('1', i + 1)
+    return result
+
+  def Update(self, changed_predicates):
+    """Recomputes closures after definitions of predicates changed.
+
+    Args:
+      changed_predicates: Predicates that got (re)defined. Closures of these
+        predicates, of predicates that depend on them and of defined
+        predicates that have no closure yet are recomputed.
+    """
+    changed_bits = 0
+    for p in changed_predicates:
+      changed_bits |= self.Bit(p)
+    stale = [p for p in changed_predicates if p in self.direct_args_of]
+    stale_set = set(stale)
+    for p in self.direct_args_of:
+      if p not in stale_set and (p not in self.reach or
+                                 self.reach[p] & changed_bits):
+        stale.append(p)
+        stale_set.add(p)
+    for p in stale_set:
+      self.reach.pop(p, None)
+    for component in self.StaleComponents(stale, stale_set):
+      self.ComputeComponent(component)
+
+  def StaleComponents(self, stale, stale_set):
+    """Yields strongly connected components of stale predicates.
+
+    This is iterative Tarjan's algorithm over the subgraph of stale
+    predicates. Components are yielded after all the components they call.
+    """
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    for root in stale:
+      if root in index:
+        continue
+      index[root] = lowlink[root] = len(index)
+      stack.append(root)
+      on_stack.add(root)
+      work = [(root, iter(self.direct_args_of[root]))]
+      while work:
+        v, successors = work[-1]
+        for w in successors:
+          if w not in stale_set:
+            continue
+          if w not in index:
+            index[w] = lowlink[w] = len(index)
+            stack.append(w)
+            on_stack.add(w)
+            work.append((w, iter(self.direct_args_of[w])))
+            break
+          if w in on_stack:
+            lowlink[v] = min(lowlink[v], index[w])
+        else:
+          work.pop()
+          if work:
+            u = work[-1][0]
+            lowlink[u] = min(lowlink[u], lowlink[v])
+          if lowlink[v] == index[v]:
+            component = []
+            while True:
+              w = stack.pop()
+              on_stack.remove(w)
+              component.append(w)
+              if w == v:
+                break
+            yield component
+
+  def ComputeComponent(self, component):
+    """Computes closure of a component, whose callees are computed."""
+    members = set(component)
+    member_bits = 0
+    for p in component:
+      member_bits |= self.Bit(p)
+    reach = 0
+    recursive = len(component) > 1
+    for p in component:
+      for a in self.direct_args_of[p]:
+        if a in members:
+          recursive = True
+        else:
+          reach |= self.Bit(a) | self.reach.get(a, 0)
+    if recursive:
+      reach |= member_bits
+    args = self.Names(reach)
+    for p in component:
+      self.reach[p] = reach
+      self.args_of[p] = set(args)
+    for a in args:
+      if a not in self.args_of:
+        self.args_of[a] = set()
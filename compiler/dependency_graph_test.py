@@ -0,0 +1,52 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unitests for dependency_graph.py."""
+
+import unittest
+
+from compiler import dependency_graph
+
+
+class DependencyGraphTest(unittest.TestCase):
+  def test_Closure(self):
+    graph = dependency_graph.DependencyGraph({
+        'A': {'B', 'T'},
+        'B': {'C'},
+        'C': {'B', 'D'},
+        'D': set()})
+    self.assertEqual(graph.args_of['A'], {'B', 'C', 'D', 'T'})
+    self.assertEqual(graph.args_of['B'], {'B', 'C', 'D'})
+    self.assertEqual(graph.args_of['C'], {'B', 'C', 'D'})
+    self.assertEqual(graph.args_of['D'], set())
+    self.assertEqual(graph.args_of['T'], set())
+    self.assertEqual(list(graph.args_of)[:4], ['A', 'B', 'C', 'D'])
+
+  def test_UpdateAfterDefinition(self):
+    direct_args_of = {'A': {'M'}, 'B': {'T'}}
+    graph = dependency_graph.DependencyGraph(direct_args_of)
+    b_args = graph.args_of['B']
+    direct_args_of['M'] = {'M_f1'}
+    direct_args_of['M_f1'] = {'A', 'S'}
+    graph.Update(['M'])
+    self.assertEqual(graph.args_of['A'], {'A', 'M', 'M_f1', 'S'})
+    self.assertEqual(graph.args_of['M_f1'], {'A', 'M', 'M_f1', 'S'})
+    # Predicates that do not use M are not recomputed.
+    self.assertIs(graph.args_of['B'], b_args)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -183,3 +183,60 @@ def GetFlatIterativeRecursionFunctor(depth, cover, direct_args_of,
 
   program = '\n'.join(result_rules)
   return program
+
+
+def GetSemiNaiveRecursionFunctor(depth, predicate, arguments):
+  """Doing linear recursion semi-naively.
+
+  Each step applies the rules to the facts that were derived on the previous
+  step only (delta), keeps the facts that were not known and appends them to
+  the table of all facts. Iteration stops when delta is empty.
+
+  Example.
+  # Original:
+  @Recursive(P, ∞, semi_naive: true);
+  P(x, y) distinct :- E(x, y);
+  P(x, y) distinct :- P(x, z), E(z, y);
+
+  # Recursion unfolding functors:
+  P_snd0 := P_ROne(P_RZero: nil);
+  @Ground(P_snd0);
+  P_snf0(c0, c1) :- P_snd0(c0, c1);
+  @Ground(P_snf0);
+  P_sns1 := P_ROne(P_RZero: P_snd0);
+  P_snd1(c0, c1) distinct :- P_sns1(c0, c1), ~P_snf0(c0, c1);
+  @Ground(P_snd1);
+  P_snf1(c0, c1) :- P_snd1(c0, c1);
+  @Ground(P_snf1, P_snf0, overwrite: false);
+  P_sns2 := P_ROne(P_RZero: P_snd1);
+  P_snd2(c0, c1) distinct :- P_sns2(c0, c1), ~P_snf1(c0, c1);
+  @Ground(P_snd2, P_snd0);
+  P_snf2(c0, c1) :- P_snd2(c0, c1);
+  @Ground(P_snf2, P_snf0, overwrite: false);
+  P(c0, c1) distinct :- P_snf2(c0, c1);
+  @Iteration(P, predicates: [P_snd1, P_snf1, P_snd2, P_snf2],
+             repetitions: 500000000, stop_when_empty: [P_snd1, P_snd2]);
+  """
+  p = predicate
+  a = '(%s)' % arguments
+  result_rules = [
+    f'{p}_snd0 := {p}_ROne({p}_RZero: nil);',
+    f'@Ground({p}_snd0);',
+    f'{p}_snf0{a} :- {p}_snd0{a};',
+    f'@Ground({p}_snf0);']
+  for i in [1, 2]:
+    delta_table = f', {p}_snd0' if i == 2 else ''
+    result_rules += [
+      f'{p}_sns{i} := {p}_ROne({p}_RZero: {p}_snd{i - 1});',
+      f'{p}_snd{i}{a} distinct :- {p}_sns{i}{a}, ~{p}_snf{i - 1}{a};',
+      f'@Ground({p}_snd{i}{delta_table});',
+      f'{p}_snf{i}{a} :- {p}_snd{i}{a};',
+      f'@Ground({p}_snf{i}, {p}_snf0, overwrite: false);']
+  result_rules.append(f'{p}{a} distinct :- {p}_snf2{a};')
+  # Each repetition takes two steps.
+  repetitions = max((depth + 1) // 2, 1)
+  result_rules.append(
+    f'@Iteration({p}, predicates: [{p}_snd1, {p}_snf1, {p}_snd2, {p}_snf2], '
+    f'repetitions: {repetitions}, stop_when_empty: [{p}_snd1, {p}_snd2]);')
+  program = '\n'.join(result_rules)
+  return program
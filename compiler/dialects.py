@@ -16,8 +16,6 @@
 
 """SQL dialects."""
 
-import copy
-
 if '.' not in __package__:
   from compiler.dialect_libraries import bq_library
   from compiler.dialect_libraries import psql_library
@@ -28,6 +26,7 @@ if '.' not in __package__:
   from compiler.dialect_libraries import duckdb_library
   from compiler.dialect_libraries import mssql_library
   from compiler.dialect_libraries import clickhouse_library
+  from parser_py import syntax_tree
 else:
   from ..compiler.dialect_libraries import bq_library
   from ..compiler.dialect_libraries import psql_library
@@ -38,6 +37,7 @@ else:
   from ..compiler.dialect_libraries import duckdb_library
   from ..compiler.dialect_libraries import mssql_library
   from ..compiler.dialect_libraries import clickhouse_library
+  from ..parser_py import syntax_tree
 def Get(engine):
   return DIALECTS[engine]()
 
@@ -107,6 +107,22 @@ class Dialect(object):
     """
     return table_name
 
+  def TableFingerprintSql(self, table_name, columns):
+    """Returns SQL computing row count and content hash of a table.
+
+    The query returns a single row with row_count and content_hash. The hash
+    does not depend on the order of rows, so that fingerprints of two
+    computations of a table are equal iff the tables are (up to collisions).
+
+    Args:
+      table_name: Table to fingerprint.
+      columns: Columns of the table, or None if they are unknown.
+
+    Returns:
+      SQL string, or None if the dialect can not fingerprint the table.
+    """
+    return None
+
 class BigQueryDialect(Dialect):
   """BigQuery SQL dialect."""
 
@@ -142,6 +158,11 @@ class BigQueryDialect(Dialect):
   def PredicateLiteral(self, predicate_name):
     return 'STRUCT("%s" AS predicate_name)' % predicate_name
 
+  def TableFingerprintSql(self, table_name, columns):
+    return ('SELECT COUNT(*) AS row_count, '
+            'BIT_XOR(FARM_FINGERPRINT(TO_JSON_STRING(t))) AS content_hash '
+            'FROM %s AS t' % table_name)
+
   
 class SqLiteDialect(Dialect):
   """SqLite SQL dialect."""
@@ -201,6 +222,15 @@ class SqLiteDialect(Dialect):
   def GroupBySpecBy(self):
     return 'expr'
 
+  def TableFingerprintSql(self, table_name, columns):
+    if not columns:
+      return None
+    # ContentHash is an aggregate registered by sqlite3_logica, summing
+    # SHA-256 hashes of the rows.
+    return ('SELECT COUNT(*) AS row_count, '
+            'ContentHash(JSON_ARRAY(%s)) AS content_hash '
+            'FROM %s' % (', '.join(columns), table_name))
+
 class PostgreSQL(Dialect):
   """PostgreSQL SQL dialect."""
 
@@ -254,6 +284,15 @@ class PostgreSQL(Dialect):
   def IsPostgreSQLish(self):
     return True
 
+  def TableFingerprintSql(self, table_name, columns):
+    # First 64 bits of SHA-256 of each row, summed as NUMERIC, which does
+    # not overflow.
+    return ('SELECT COUNT(*) AS row_count, '
+            'SUM((\'x\' || SUBSTR(ENCODE(SHA256(CONVERT_TO(t::TEXT, '
+            '\'UTF8\')), \'hex\'), 1, 16))::BIT(64)::BIGINT::NUMERIC) '
+            'AS content_hash '
+            'FROM %s AS t' % table_name)
+
 
 class Trino(Dialect):
   """Trino analytic engine dialect."""
@@ -294,6 +333,13 @@ class Trino(Dialect):
   def DecorateCombineRule(self, rule, var):
     return rule
 
+  def TableFingerprintSql(self, table_name, columns):
+    if not columns:
+      return None
+    return ('SELECT COUNT(*) AS row_count, '
+            'CHECKSUM(ROW(%s)) AS content_hash '
+            'FROM %s' % (', '.join(columns), table_name))
+
 
 class Presto(Dialect):
 
@@ -332,12 +378,19 @@ class Presto(Dialect):
   def DecorateCombineRule(self, rule, var):
     return rule
 
+  def TableFingerprintSql(self, table_name, columns):
+    if not columns:
+      return None
+    return ('SELECT COUNT(*) AS row_count, '
+            'CHECKSUM(ROW(%s)) AS content_hash '
+            'FROM %s' % (', '.join(columns), table_name))
+
 def DecorateCombineRule(rule, var):
   """Resolving ambiguity of aggregation scope."""
   # Entangling result of aggregation with a variable that comes from a list
   # unnested inside a combine expression, to make it clear that aggregation
   # must be done in the combine. 
-  rule = copy.deepcopy(rule)
+  rule = syntax_tree.CopyTree(rule)
 
   rule['head']['record']['field_value'][0]['value'][
     'aggregation']['expression']['call'][
@@ -452,6 +505,11 @@ class Databricks(Dialect):
     def DecorateCombineRule(self, rule, var):
         return rule
 
+    def TableFingerprintSql(self, table_name, columns):
+        return ('SELECT COUNT(*) AS row_count, '
+                'SUM(HASH(*)) AS content_hash '
+                'FROM %s' % table_name)
+
 class DuckDB(Dialect):
     """DuckDB dialect"""
 
@@ -511,6 +569,11 @@ class DuckDB(Dialect):
     def IsPostgreSQLish(self):
       return True
 
+    def TableFingerprintSql(self, table_name, columns):
+      return ('SELECT COUNT(*) AS row_count, '
+              'SUM(HASH(t)::HUGEINT) AS content_hash '
+              'FROM %s AS t' % table_name)
+
 
 class MSSQL(Dialect):
     """Microsoft SQL Server (T-SQL) dialect"""
@@ -637,6 +700,17 @@ class MSSQL(Dialect):
     def DecorateCombineRule(self, rule, var):
       return DecorateCombineRule(rule, var)
 
+    def TableFingerprintSql(self, table_name, columns):
+      # Rows are serialized to JSON, which covers all column types, and the
+      # first 64 bits of their SHA-256 are summed as DECIMAL, which does not
+      # overflow. Aggregates can't contain subqueries, hence the APPLY.
+      return ('SELECT COUNT(*) AS row_count, '
+              'SUM(CAST(CAST(SUBSTRING(HASHBYTES(\'SHA2_256\', r.row_json), '
+              '1, 8) AS BIGINT) AS DECIMAL(38, 0))) AS content_hash '
+              'FROM %s AS t CROSS APPLY (SELECT (SELECT t.* FOR JSON PATH, '
+              'WITHOUT_ARRAY_WRAPPER, INCLUDE_NULL_VALUES) AS row_json) AS r' %
+              self.QuoteTableIdentifier(table_name))
+
     def RecursiveCte(self, cte_name, anchor_query, recursive_query, select_query):
       """Generate a recursive CTE for T-SQL.
 
@@ -733,6 +807,11 @@ class ClickHouse(Dialect):
     def DecorateCombineRule(self, rule, var):
       return DecorateCombineRule(rule, var)
 
+    def TableFingerprintSql(self, table_name, columns):
+      return ('SELECT count() AS row_count, '
+              'sum(cityHash64(*)) AS content_hash '
+              'FROM %s' % table_name)
+
 
 DIALECTS = {
     'bigquery': BigQueryDialect,
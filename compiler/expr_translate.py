@@ -16,18 +16,18 @@
 
 """Compiler of a Logica expression to SQL."""
 
-import copy
-
 import json
 
 if '.' not in __package__:
   from common import color
   from common.data import processed_functions
   from compiler import dialects
+  from parser_py import syntax_tree
 else:
   from ..common import color
   from ..common.data import processed_functions
   from ..compiler import dialects
+  from ..parser_py import syntax_tree
 
 
 class QL(object):
@@ -97,6 +97,8 @@ class QL(object):
   }
   BULK_FUNCTIONS = None
   BULK_FUNCTIONS_ARITY_RANGE = None
+  # Built-in functions and infix operators per dialect.
+  DIALECT_TABLES = {}
 
   # When adding any analytic functions please check that ConvertAnalytic
   # function handles them correctly.
@@ -141,13 +143,10 @@ class QL(object):
     self.InstallBulkFunctionsOfStandardSQL()
     self.bulk_functions = self.BULK_FUNCTIONS
     self.bulk_function_arity_range = self.BULK_FUNCTIONS_ARITY_RANGE
-    self.built_in_functions = copy.deepcopy(self.bulk_functions)
-    self.built_in_functions.update(self.BUILT_IN_FUNCTIONS)
-    self.built_in_functions.update(self.dialect.BuiltInFunctions())
-    self.built_in_infix_operators = copy.deepcopy(
-        self.BUILT_IN_INFIX_OPERATORS)
-    self.built_in_infix_operators.update(self.dialect.InfixOperators())
-    self.CleanOperatorsAndFunctions()
+    functions, infix_operators = self.DialectFunctionsAndOperators(
+        self.dialect)
+    self.built_in_functions = dict(functions)
+    self.built_in_infix_operators = dict(infix_operators)
     self.exception_maker = exception_maker
     self.debug_undefined_variables = False
     # We set convert_to_json to convert arguments of annotations to Python
@@ -157,15 +156,24 @@ class QL(object):
     self.flag_values = flag_values
     self.custom_udfs = custom_udfs or {}
 
-  def CleanOperatorsAndFunctions(self):
-    def CleanDictionary(d):
-      keys = list(d.keys())
-      for k in keys:
-        if d[k] is None:
-          del d[k]
-    for d in [self.built_in_infix_operators,
-              self.built_in_functions]:
-      CleanDictionary(d)
+  @classmethod
+  def DialectFunctionsAndOperators(cls, dialect):
+    """Returns built-in functions and infix operators of the dialect.
+
+    The tables are built once per dialect class, translators copy them.
+    """
+    key = (cls, type(dialect))
+    if key not in cls.DIALECT_TABLES:
+      functions = dict(cls.BULK_FUNCTIONS)
+      functions.update(cls.BUILT_IN_FUNCTIONS)
+      functions.update(dialect.BuiltInFunctions())
+      infix_operators = dict(cls.BUILT_IN_INFIX_OPERATORS)
+      infix_operators.update(dialect.InfixOperators())
+      # Dialects remove unsupported functions by mapping them to None.
+      cls.DIALECT_TABLES[key] = (
+          {k: v for k, v in functions.items() if v is not None},
+          {k: v for k, v in infix_operators.items() if v is not None})
+    return cls.DIALECT_TABLES[key]
 
   @classmethod
   def BasisFunctions(cls):
@@ -472,7 +480,7 @@ class QL(object):
       return None
     new_if_thens = []
     for if_then in implication['if_then']:
-      new_if_then = copy.deepcopy(if_then)
+      new_if_then = syntax_tree.CopyTree(if_then)
       consequence = GetValueOfField(
           if_then['consequence']['record']['field_value'], subscript)
       new_if_then['consequence'] = consequence
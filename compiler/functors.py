@@ -29,28 +29,22 @@ introduce more abstact functors. E.g.: Apply(F, G) := F(G);
 This could potentially be useful for limited recursion.
 """
 
-import collections
-import copy
 import sys
 
 if '.' not in __package__:
   from common import color
+  from common import profiling
+  from compiler import dependency_graph
   from compiler.dialect_libraries import recursion_library
   from parser_py import parse
+  from parser_py import syntax_tree
 else:
   from ..common import color
+  from ..common import profiling
+  from ..compiler import dependency_graph
   from ..compiler.dialect_libraries import recursion_library
   from ..parser_py import parse
-
-import datetime
-
-class Timer:
-  def __init__(self, name):
-    self.name = name
-    self.time = datetime.datetime.now()
-
-  def Stop(self):
-    print('%s / micros elapsed:' % self.name, (datetime.datetime.now() - self.time).microseconds)
+  from ..parser_py import syntax_tree
 
 
 class FunctorError(Exception):
@@ -99,27 +93,18 @@ class Functors(object):
 
   def __init__(self, rules):
     self.rules = rules
-    self.extended_rules = copy.deepcopy(rules)
+    self.extended_rules = syntax_tree.CopyTree(rules)
     self.rules_of = parse.DefinedPredicatesRules(rules)
     self.predicates = set(self.rules_of)
-    self.direct_args_of = self.BuildDirectArgsOf()
-    self.args_of = {}
+    with profiling.Phase('functor dependencies'):
+      self.direct_args_of = self.BuildDirectArgsOf()
+      self.dependencies = dependency_graph.DependencyGraph(
+          self.direct_args_of)
+    self.args_of = self.dependencies.args_of
     self.creation_count = 0
     self.cached_calls = {}
     self.constant_literal_function = {}
 
-    try:
-      # This import takes about 500ms.
-      import numpy
-      numpy_is_here = True
-    except:
-      numpy_is_here = False
-    if numpy_is_here:
-      # This is faster sometimes.
-      self.NumpyBuildArgsOf()
-    for p in self.predicates:
-      self.ArgsOf(p)
-
   def GetConstantFunction(self, value):
     if result := self.constant_literal_function.get(value):
       return result
@@ -127,10 +112,6 @@ class Functors(object):
       'LogicaCompilerConstant%d' % len(self.constant_literal_function))
     return self.constant_literal_function[value]
 
-  def CopyOfArgs(self):
-    """Copying args is separated for profiling."""
-    return {k: v for k, v in list(self.args_of.items())}
-
   def UpdateStructure(self, new_predicate):
     """Updates rules_of and args_of maps after extebded_rules update."""
     self.rules_of = parse.DefinedPredicatesRules(self.extended_rules)
@@ -142,13 +123,8 @@ class Functors(object):
       if p not in self.direct_args_of:
         self.direct_args_of[p] = self.BuildDirectArgsOfPredicate(p)
 
-    # Resetting args_of, to process the new predicates that were added.
-    copied_args_of = self.CopyOfArgs()
-    for predicate, args in copied_args_of.items():
-      if new_predicate in args or new_predicate == predicate:
-        del self.args_of[predicate]
-    for p in self.predicates:
-      self.ArgsOf(p)
+    # Recomputing args_of of the new predicates and of their users.
+    self.dependencies.Update([new_predicate])
     # Uncomment for debuggin:
 
     # print('------------ Args Of:')
@@ -210,81 +186,18 @@ class Functors(object):
       direct_args_of[functor] = self.BuildDirectArgsOfPredicate(functor)
     return direct_args_of
 
-  def NumpyBuildArgsOf(self):
-    import numpy
-    interesting_predicates = set(self.direct_args_of)
-    directly_called_by = numpy.zeros(
-      (len(interesting_predicates),
-       len(interesting_predicates)))
-    interesting_predicates_list = list(sorted(interesting_predicates))
-    ipi = {  # Interesting predicate index.
-      p: i for i, p in enumerate(interesting_predicates_list)}
-    for p, args in self.direct_args_of.items():
-      for a in args:
-        if a in interesting_predicates:
-          directly_called_by[ipi[a], ipi[p]] = 1
-    a = directly_called_by
-    while True:
-      aa = (((a @ a) + a) > 0) * 1
-      if (a == aa).all():
-        break
-      a = aa
-    for i, p in enumerate(interesting_predicates_list):
-      self.args_of[p] = set(self.direct_args_of[p])
-      for j, v in enumerate(a[:, i]):
-        if v:
-          q = interesting_predicates_list[j]
-          self.args_of[p].add(q)
-          self.args_of[p] |= self.direct_args_of[q]
-
   def ArgsOf(self, functor):
-    """Arguments of functor. Retrieving from cache, or computing."""
-      
-    if functor not in self.args_of:
-      built_args = self.BuildArgs(functor)
-      # Args could be incomplete due to recursive calls.
-      # Checking for that.
-      building_me = 'building_' + functor
-      if building_me in built_args:
-        built_args = built_args - {building_me}
-      if any(a.startswith('building_') for a in built_args):
-        return (a for a in built_args if not a.startswith('building_'))
-      self.args_of[functor] = built_args
-
-    return self.args_of[functor]
-
-  def BuildArgs(self, functor):
-    """Returning all arguments of a functor."""
-    if functor not in self.direct_args_of:
-      # Assuming this is built-in or table.
-      return set()
-
-    self.args_of[functor] = {'building_' + functor}
-
-    result = set()
-    queue = collections.deque(self.direct_args_of[functor])
-    while queue:
-      e = queue.popleft()
-      result.add(e)
-      args_of_e = self.ArgsOf(e)
-      if isinstance(args_of_e, set):
-        arg_type = 'final'
-      else:
-        arg_type = 'preliminary'
-
-      for a in args_of_e:
-        if a not in result:
-          if arg_type == 'preliminary':
-            queue.append(a)
-          else:
-            result.add(a)
-
-    del self.args_of[functor]
+    """Arguments of functor, i.e. predicates it uses directly or not."""
+    return self.args_of.get(functor, set())
 
-    return result
+  def AllRulesOf(self, functor, copy_rules=True):
+    """Returning all rules relevant to a predicate.
 
-  def AllRulesOf(self, functor):
-    """Returning all rules relevant to a predicate."""
+    Args:
+      functor: Predicate name.
+      copy_rules: Whether to return copies of the rules, rather than the
+        rules themselves.
+    """
     result = []
     if functor not in self.rules_of:
       return result
@@ -295,7 +208,9 @@ class Functors(object):
                            functor)
       if f in self.rules_of:
         result.extend(self.rules_of[f])
-    return copy.deepcopy(result)
+    if not copy_rules:
+      return result
+    return syntax_tree.CopyTree(result)
 
   def Make(self, predicate, instruction):
     """Make a new predicate according to instruction."""
@@ -316,13 +231,15 @@ class Functors(object):
             (self.args_of[applicant] & needs_building) or
             (set(args_map.values()) & needs_building)):
           continue
-        self.Make(new_predicate, instruction)
+        with profiling.Phase('make %s' % new_predicate):
+          self.Make(new_predicate, instruction)
         something_built = True
         needs_building.remove(name)
       if needs_building and not something_built:
         raise FunctorError('Could not resolve Make order.',
                            str(needs_building))
-    surviving_rules = self.RemoveRulesProvenToBeNil(self.extended_rules)
+    with profiling.Phase('nil elimination'):
+      surviving_rules = self.RemoveRulesProvenToBeNil(self.extended_rules)
 
     for value, function in self.constant_literal_function.items():
       if isinstance(value, int):
@@ -374,7 +291,7 @@ class Functors(object):
         if rule['head']['record']['field_value'][0]['value']['expression'][
             'literal']['the_predicate']['predicate_name'] in predicates:
           result.append(rule)
-    return copy.deepcopy(result)
+    return syntax_tree.CopyTree(result)
 
   def CallKey(self, functor, args_map):
     """A string representing a call of a functor with arguments."""
@@ -394,7 +311,8 @@ class Functors(object):
           'have.' % (applicant, color.Warn(','.join(bad_args))),
           name)
     self.creation_count += 1
-    rules = self.AllRulesOf(applicant)
+    # Only rules that get rewritten are copied, below.
+    rules = self.AllRulesOf(applicant, copy_rules=False)
     args = set(args_map)
     rules = [r for r in rules
              if ((args & self.args_of[r['head']['predicate_name']]) or
@@ -405,7 +323,7 @@ class Functors(object):
           name)
     # This eventually maps all args to substiturions, as well as all predictes
     # which use one of the args into a newly created predicate names.
-    extended_args_map = copy.deepcopy(args_map)
+    extended_args_map = dict(args_map)
     rules_to_update = []
     cache_update = {}
     predicates_to_annotate = set()
@@ -431,7 +349,7 @@ class Functors(object):
           rules_to_update.append(r)
           predicates_to_annotate.add(rule_predicate_name)
 
-    rules = rules_to_update
+    rules = syntax_tree.CopyTree(rules_to_update)
     self.cached_calls.update(cache_update)
     # Collect annotations of all involved predicates.
     # Newly created predicates inherit annotations of predicates from which
@@ -453,8 +371,13 @@ class Functors(object):
     self.extended_rules.extend(rules)
     self.UpdateStructure(name)
     
-  def UnfoldRecursivePredicateFlatFashion(self, cover, depth, rules,
-                                          iterative, ignition_steps, stop):
+  def RenameCoverForFlatUnfolding(self, cover, rules):
+    """Renames rules of the cover into _ROne functors of _RZero arguments.
+
+    Returns:
+      Cover without auxiliary predicates and direct dependencies of its
+      predicates within it.
+    """
     visible = lambda p: '_MultBodyAggAux' not in p
     simplified_cover = {c for c in cover if visible(c)}
     direct_args_of = {c: [] for c in cover if visible(c)}
@@ -486,7 +409,12 @@ class Functors(object):
             r['head']['predicate_name'] != '@Make'):
         for c in cover:
           Walk(r, ReplacePredicate(c, c + '_ROne'))
+    return simplified_cover, direct_args_of
 
+  def UnfoldRecursivePredicateFlatFashion(self, cover, depth, rules,
+                                          iterative, ignition_steps, stop):
+    simplified_cover, direct_args_of = self.RenameCoverForFlatUnfolding(
+      cover, rules)
     if iterative:
       lib = recursion_library.GetFlatIterativeRecursionFunctor(
         depth, simplified_cover, direct_args_of,
@@ -495,10 +423,61 @@ class Functors(object):
       lib = recursion_library.GetFlatRecursionFunctor(
         depth, simplified_cover, direct_args_of)
 
-    lib_rules = parse.ParseFile(lib)['rule']
+    lib_rules = parse.ParseLibrary(lib)
     rules.extend(lib_rules)
 
 
+  def SemiNaiveArguments(self, predicate, cover, rules):
+    """Returns arguments of the predicate for semi-naive unfolding.
+
+    Semi-naive evaluation applies to a single distinct predicate with
+    linear rules, i.e. rules that use the recursive component at most once.
+    """
+    def SemiNaiveError(reason):
+      return FunctorError(
+        color.Format(
+          'Recursive predicate {warning}{p}{end} can not be computed '
+          'semi-naively: {reason}.',
+          {'p': predicate, 'reason': reason}), predicate)
+    visible = [c for c in cover if '_MultBodyAggAux' not in c]
+    if visible != [predicate]:
+      raise SemiNaiveError(
+        'it is mutually recursive with ' +
+        ', '.join(sorted(set(visible) - {predicate})))
+    fields = None
+    for r in rules:
+      if r['head']['predicate_name'] not in cover:
+        continue
+      uses = []
+      def CountUse(x):
+        if isinstance(x, dict) and x.get('predicate_name') in cover:
+          uses.append(x['predicate_name'])
+        return []
+      WalkWithTaboo(r.get('body', {}), CountUse, taboo=['satellites'])
+      if len(uses) > 1:
+        raise SemiNaiveError('its rules must be linear, i.e. use the '
+                             'predicate at most once')
+      if r['head']['predicate_name'] == predicate:
+        if 'distinct_denoted' not in r:
+          raise SemiNaiveError('it must be distinct')
+        field_values = r['head']['record']['field_value']
+        if any('aggregation' in fv['value'] for fv in field_values):
+          raise SemiNaiveError('it must not aggregate')
+        fields = [fv['field'] for fv in field_values]
+    if fields is None or 'logica_value' in fields:
+      raise SemiNaiveError('it must be a relation')
+    positional = ['c%d' % f for f in fields if isinstance(f, int)]
+    named = ['%s:' % f for f in fields if isinstance(f, str)]
+    return ', '.join(positional + named)
+
+  def UnfoldRecursivePredicateSemiNaive(self, predicate, cover, depth, rules):
+    """Unfolds recursive predicate for semi-naive iteration."""
+    arguments = self.SemiNaiveArguments(predicate, cover, rules)
+    self.RenameCoverForFlatUnfolding(cover, rules)
+    lib = recursion_library.GetSemiNaiveRecursionFunctor(
+      depth, predicate, arguments)
+    rules.extend(parse.ParseLibrary(lib))
+
   def UnfoldRecursivePredicate(self, predicate, cover, depth, rules):   
     """Unfolds recurive predicate.""" 
     new_predicate_name = predicate + '_recursive'
@@ -542,11 +521,11 @@ class Functors(object):
 
     lib = recursion_library.GetRecursionFunctor(depth)
     lib = lib.replace('P', predicate)
-    lib_rules = parse.ParseFile(lib)['rule']
+    lib_rules = parse.ParseLibrary(lib)
     rules.extend(lib_rules)
     for c in cover - {predicate}:
       rename_lib = recursion_library.GetRenamingFunctor(c, predicate)
-      rename_lib_rules = parse.ParseFile(rename_lib)['rule']
+      rename_lib_rules = parse.ParseLibrary(rename_lib)
       rules.extend(rename_lib_rules)
 
   def GetStop(self, depth_map, p):
@@ -569,7 +548,7 @@ class Functors(object):
     skip_unfold_predicates = skip_unfold_predicates or set()
     should_recurse, my_cover = self.RecursiveAnalysis(
       depth_map, default_iterative, default_depth)
-    new_rules = copy.deepcopy(self.rules)
+    new_rules = syntax_tree.CopyTree(self.rules)
     for p, style in should_recurse.items():
       if p in skip_unfold_predicates:
         # Skip unfolding - this predicate will use native recursive CTE
@@ -577,6 +556,15 @@ class Functors(object):
       depth = depth_map.get(p, {}).get('1', default_depth)
       if style == 'vertical':
         self.UnfoldRecursivePredicate(p, my_cover[p], depth, new_rules)
+      elif style == 'semi_naive':
+        if self.GetStop(depth_map, p):
+          raise FunctorError(
+            color.Format(
+              'Recursive predicate {warning}{p}{end} is computed '
+              'semi-naively, which stops when no new facts are derived. '
+              'It can not use a stop signal.', {'p': p}), p)
+        self.UnfoldRecursivePredicateSemiNaive(p, my_cover[p], depth,
+                                               new_rules)
       elif style == 'horizontal' or style == 'iterative_horizontal':
         # Old ad-hoc formula:
         # ignition = len(my_cover[p]) * 3 + 4
@@ -716,7 +704,9 @@ class Functors(object):
         depth_map[p]['1'] = 1000000000
       # Iterate if explicitly requested or unspecified
       # and number of steps is greater than 20.
-      if (depth_map.get(p, {}).get('iterative', default_iterative) or
+      if depth_map.get(p, {}).get('semi_naive', False):
+        should_recurse[p] = 'semi_naive'
+      elif (depth_map.get(p, {}).get('iterative', default_iterative) or
           depth_map.get(p, {}).get('iterative', True) == True and
           depth_map.get(p, {}).get('1', default_depth) > 20):
         should_recurse[p] = 'iterative_horizontal'
@@ -17,16 +17,17 @@
 """Compiler of a single Logica rule to SQL."""
 
 import collections
-import copy
 import string
 import sys
 
 if '.' not in __package__:
   from common import color
   from compiler import expr_translate
+  from parser_py import syntax_tree
 else:
   from ..common import color
   from ..compiler import expr_translate
+  from ..parser_py import syntax_tree
 
 xrange = range
 
@@ -72,7 +73,7 @@ def HeadToSelect(head):
     k = field_value['field']
     v = field_value['value']
     if 'aggregation' in v:
-      select[k] = copy.deepcopy(v['aggregation']['expression'])
+      select[k] = syntax_tree.CopyTree(v['aggregation']['expression'])
       aggregated_vars.append(k)
     else:
       assert 'expression' in v, 'Bad select value: %s' % str(v)
@@ -144,15 +145,19 @@ class NamesAllocator(object):
     self.aux_var_num += 1
     return v
 
-  def AllocateTable(self, hint_for_user=None):
-    """Allocating a table name."""
+  @classmethod
+  def TableSuffix(cls, hint_for_user):
+    """Part of the table name that comes from the hint."""
     allowed_chars = set(string.ascii_letters + string.digits + '_./')
     if hint_for_user and len(hint_for_user) < 100:
-      suffix = ''.join(
+      return ''.join(
           ('_' if c in ['.', '/'] else c)
           for c in hint_for_user if c in allowed_chars)
-    else:
-      suffix = ''
+    return ''
+
+  def AllocateTable(self, hint_for_user=None):
+    """Allocating a table name."""
+    suffix = self.TableSuffix(hint_for_user)
     if (suffix and
         suffix not in self.allocated_tables and
         not suffix[0].isdigit()):
@@ -766,7 +771,7 @@ def InlinePredicateValuesRecursively(r, names_allocator, conjuncts):
       if not names_allocator.FunctionExists(r['call']['predicate_name']):
         aux_var = names_allocator.AllocateVar('inline')
         r_predicate = {}
-        r_predicate['predicate'] = copy.deepcopy(r['call'])
+        r_predicate['predicate'] = syntax_tree.CopyTree(r['call'])
         r_predicate['predicate']['record']['field_value'].append({
             'field': 'logica_value',
             'value': {'expression': {
@@ -851,7 +856,7 @@ def DisambiguateCombineVariables(rule, names_allocator):
 
 def ExtractRuleStructure(rule, names_allocator=None, external_vocabulary=None):
   """Extracts RuleStructure from rule."""
-  rule = copy.deepcopy(rule)
+  rule = syntax_tree.CopyTree(rule)
   # Not disambiguating if this rule is extracting structure of the combine
   # itself, as variables of this combine were already disambiguated from
   # parent rule.
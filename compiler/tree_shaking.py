@@ -0,0 +1,113 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Removing rules that requested predicates do not depend on.
+
+A program, its imports and the library of the dialect usually define many
+more predicates than a query needs. Rules of predicates that are not
+reachable from the requested ones are dropped before recursion unfolding,
+functors, type inference and UDFs, which all work on the whole program.
+
+A predicate reaches the predicates mentioned anywhere in its rules, which
+covers calls, functions (UDFs) and satellites. Annotations of a reached
+predicate are kept and reach the predicates they mention, e.g. applicant and
+arguments of @Make, satellites and stop predicate of @Recursive. @Iteration
+is kept when any of its predicates is reached and then reaches all of them,
+as iterations built by recursion unfolding are named after a predicate
+that may itself be unreachable.
+Annotations that configure the whole program are always kept.
+
+Set LOGICA_TREE_SHAKING environment variable to 'off' to keep all rules.
+"""
+
+import os
+
+# Annotations that are not about a predicate.
+PROGRAM_ANNOTATIONS = {'@Engine', '@DefineFlag', '@ResetFlagValue',
+                       '@Dataset', '@AttachDatabase', '@Flag'}
+
+
+def Enabled():
+  return os.environ.get('LOGICA_TREE_SHAKING', '') != 'off'
+
+
+def MentionedPredicates(x):
+  """Returns names of predicates mentioned in a syntax tree."""
+  result = set()
+  stack = [x]
+  while stack:
+    x = stack.pop()
+    if isinstance(x, dict):
+      if isinstance(x.get('predicate_name'), str):
+        result.add(x['predicate_name'])
+      stack.extend(x.values())
+    elif isinstance(x, list):
+      stack.extend(x)
+  return result
+
+
+def AnnotationSubject(rule):
+  """Returns predicate that the annotation is about, or None."""
+  field_values = rule['head']['record'].get('field_value', [])
+  if not field_values:
+    return None
+  expression = field_values[0]['value'].get('expression', {})
+  the_predicate = expression.get('literal', {}).get('the_predicate')
+  if the_predicate:
+    return the_predicate['predicate_name']
+  return None
+
+
+def ReachableRules(rules, predicates):
+  """Returns rules that the predicates depend on, in the original order.
+
+  Args:
+    rules: A list of parsed rules, including annotations.
+    predicates: Names of requested predicates.
+  """
+  rules_of = {}
+  annotations_of = {}
+  kept = set()
+  for i, rule in enumerate(rules):
+    p = rule['head']['predicate_name']
+    if p in PROGRAM_ANNOTATIONS:
+      kept.add(i)
+    elif p.startswith('@'):
+      subject = AnnotationSubject(rule)
+      if p == '@Iteration' or not subject:
+        subjects = MentionedPredicates(rule['head'])
+      else:
+        subjects = [subject]
+      for s in subjects:
+        annotations_of.setdefault(s, []).append(i)
+    else:
+      rules_of.setdefault(p, []).append(i)
+
+  reached = set()
+  queue = list(predicates)
+  while queue:
+    p = queue.pop()
+    if p in reached:
+      continue
+    reached.add(p)
+    # Recursion unfolding uses StopP as a stop predicate of P.
+    if 'Stop' + p in rules_of:
+      queue.append('Stop' + p)
+    for i in rules_of.get(p, []) + annotations_of.get(p, []):
+      if i not in kept:
+        kept.add(i)
+        queue.extend(MentionedPredicates(rules[i]) - reached)
+  return [r for i, r in enumerate(rules) if i in kept]
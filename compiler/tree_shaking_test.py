@@ -0,0 +1,61 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unitests for tree_shaking.py."""
+
+import unittest
+
+from compiler import tree_shaking
+from parser_py import parse
+
+
+def Heads(rules):
+  return [r['head']['predicate_name'] for r in rules]
+
+
+class TreeShakingTest(unittest.TestCase):
+  def test_KeepsRulesAndAnnotationsOfReachablePredicates(self):
+    rules = parse.ParseFile("""
+      @Engine("sqlite");
+      @OrderBy(Q, "x");
+      @OrderBy(Unused, "x");
+      A(x:) :- x in Range(3);
+      B(x:) :- x in Range(5);
+      Q(x:) :- A(x:), x < F(x);
+      F(x) = x + 1;
+      Unused(x:) :- B(x:);
+    """)['rule']
+    self.assertEqual(Heads(tree_shaking.ReachableRules(rules, ['Q'])),
+                     ['@Engine', '@OrderBy', 'A', 'Q', 'F'])
+
+  def test_MakeAndIterationReachTheirPredicates(self):
+    rules = parse.ParseFile("""
+      G(x:) :- Arg(x:);
+      B(x:) :- x in Range(5);
+      F := G(Arg: B);
+      @Iteration(Loop, predicates: [P, R], repetitions: 3);
+      P(x:) :- R(x:);
+      R(x:) :- x in Range(2);
+      Test(x:) :- F(x:), P(x:);
+    """)['rule']
+    self.assertEqual(
+        sorted(Heads(tree_shaking.ReachableRules(rules, ['Test']))),
+        ['@Iteration', '@Make', 'B', 'G', 'P', 'R', 'Test'])
+    self.assertEqual(Heads(tree_shaking.ReachableRules(rules, ['B'])), ['B'])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -18,7 +18,6 @@
 """Compiler of predicates from Logica program to SQL."""
 
 import collections
-import copy
 import re
 import sys
 import traceback
@@ -29,19 +28,27 @@ import json
 
 if '.' not in __package__:
   from common import color
+  from common import profiling
   from compiler import dialects
   from compiler import expr_translate
   from compiler import functors
   from compiler import rule_translate
+  from compiler import tree_shaking
+  from parser_py import import_cache
   from parser_py import parse
+  from parser_py import syntax_tree
   from type_inference.research import infer
 else:
   from ..common import color
+  from ..common import profiling
   from ..compiler import dialects
   from ..compiler import expr_translate
   from ..compiler import functors
   from ..compiler import rule_translate
+  from ..compiler import tree_shaking
+  from ..parser_py import import_cache
   from ..parser_py import parse
+  from ..parser_py import syntax_tree
   from ..type_inference.research import infer
 
 PredicateInfo = collections.namedtuple('PredicateInfo',
@@ -96,10 +103,48 @@ class Logica(object):
     self.iterations = None
     # Track native recursive CTE being compiled (for proper self-references)
     self.native_cte_being_compiled = None
+    # Journals of recompilations of WITH tables, see
+    # SubqueryTranslator.RecompileWithedTable.
+    self.recompilation_memo = {}
+    self.recompilation_journals = []
+    self.compilations_avoided = 0
+    # Definitions of WITH tables shared by executions of a batch, see
+    # SubqueryTranslator.DefineWithedTable.
+    self.definition_memo = None
 
   def AddDefine(self, define):
     self.defines.append(define)
 
+  def JournalOperation(self, operation, argument):
+    """Records a side effect in journals of ongoing recompilations."""
+    for journal in self.recompilation_journals:
+      journal.operations.append((operation, argument))
+      if operation == 'define':
+        journal.defined.add(argument[0])
+
+  def JournalRecompilationCheck(self, table, was_done):
+    for journal in self.recompilation_journals:
+      journal.done_for_parent.setdefault(table, was_done)
+
+  def JournalAllocationCheck(self, suffix, was_allocated):
+    for journal in self.recompilation_journals:
+      journal.suffix_allocated.setdefault(suffix, was_allocated)
+
+  def JournalDefinitionCheck(self, table, table_name):
+    for journal in self.recompilation_journals:
+      if table not in journal.defined:
+        journal.defined_before.setdefault(table, table_name)
+
+  def InvalidateJournals(self, except_definitions=False):
+    """Ongoing recompilations changed the execution and can't be replayed.
+
+    Definitions of WITH tables are journaled by definition journals, so
+    these stay valid if except_definitions is set.
+    """
+    for journal in self.recompilation_journals:
+      if not (except_definitions and isinstance(journal, DefinitionJournal)):
+        journal.valid = False
+
   def PredicateSpecificPreamble(self, predicate_name):
     needed_udfs = list(sorted([
         self.custom_udf_definitions[f]
@@ -139,6 +184,94 @@ class Logica(object):
     return self.annotations.With(predicate_name)
 
 
+class RecompilationJournal(object):
+  """Side effects of recompiling an already defined WITH table.
+
+  Such recompilation is needed only for its side effects on the execution:
+  names allocated, dependency edges and WITH dependencies added for the
+  parent and types required. Journal records them relative to the parent,
+  so that they can be replayed for another parent instead of recompiling.
+  """
+
+  def __init__(self):
+    self.operations = []
+    # Maps table to whether it was already recompiled for the parent when
+    # recompilation was considered for the first time.
+    self.done_for_parent = {}
+    # Maps tables that were used already defined to their names.
+    self.defined_before = {}
+    # Tables that were defined while recording.
+    self.defined = set()
+    # Maps table name suffixes that were requested from the allocator to
+    # whether they were already allocated.
+    self.suffix_allocated = {}
+    self.valid = True
+
+  def ReplayableFor(self, done_for_parent):
+    return all((table in done_for_parent) == was_done
+               for table, was_done in self.done_for_parent.items())
+
+  def NumCompilations(self):
+    return 1 + sum(1 for operation, _ in self.operations
+                   if operation == 'done')
+
+
+class DefinitionJournal(RecompilationJournal):
+  """Side effects of defining a WITH table, including its SQL.
+
+  Recorded while compiling a batch of predicates, so that the definition
+  is replayed in executions of the following predicates of the batch
+  instead of compiling the table and its WITH dependencies again. Replay
+  requires the allocator to give the same names as it did for recording,
+  so the SQL is identical to compiling the predicate on its own.
+  """
+
+  def __init__(self, allocator):
+    super(DefinitionJournal, self).__init__()
+    self.allocator_state = AllocatorState(allocator)
+
+  def ReplayableIn(self, execution, done_for_parent, allocator):
+    defined_tables = execution.table_to_defined_table_map
+    return (AllocatorState(allocator) == self.allocator_state and
+            all((suffix in allocator.allocated_tables) == was_allocated
+                for suffix, was_allocated in self.suffix_allocated.items()) and
+            self.ReplayableFor(done_for_parent) and
+            all(defined_tables.get(table) == table_name
+                for table, table_name in self.defined_before.items()) and
+            not any(table in defined_tables for table in self.defined))
+
+  def NumCompilations(self):
+    return sum(1 for operation, _ in self.operations
+               if operation in ('define', 'done'))
+
+
+def AllocatorState(allocator):
+  """Counters that names given by the allocator depend on."""
+  return (allocator.aux_var_num, allocator.table_num)
+
+
+class RecordingAllocator(object):
+  """Names allocator recording allocations in journals of the execution."""
+
+  def __init__(self, allocator, execution):
+    self.allocator = allocator
+    self.execution = execution
+
+  def AllocateVar(self, hint=None):
+    self.execution.JournalOperation('var', hint)
+    return self.allocator.AllocateVar(hint)
+
+  def AllocateTable(self, hint_for_user=None):
+    self.execution.JournalOperation('table', hint_for_user)
+    suffix = self.allocator.TableSuffix(hint_for_user)
+    self.execution.JournalAllocationCheck(
+        suffix, suffix in self.allocator.allocated_tables)
+    return self.allocator.AllocateTable(hint_for_user=hint_for_user)
+
+  def __getattr__(self, name):
+    return getattr(self.allocator, name)
+
+
 def Indent2(s):
   return '\n'.join('  ' + l for l in s.split('\n'))
 
@@ -300,9 +433,19 @@ class Annotations(object):
           self.annotations['@Iteration'][iteration_name]['__rule_text']
         )
       predicates = [p['predicate_name'] for p in args['predicates']]
+      # Iteration stops when any of these tables turns out empty.
+      stop_when_empty = {}
+      for p in args.get('stop_when_empty', []):
+        ground = self.Ground(p['predicate_name'])
+        if not ground:
+          raise rule_translate.RuleCompileException(
+            'Iteration can only stop on emptiness of a grounded predicate.',
+            self.annotations['@Iteration'][iteration_name]['__rule_text'])
+        stop_when_empty[p['predicate_name']] = ground.table_name
       result[iteration_name] = {'predicates': predicates,
                                 'repetitions': args['repetitions'],
-                                'stop_signal': args.get('stop_signal')}
+                                'stop_signal': args.get('stop_signal'),
+                                'stop_when_empty': stop_when_empty}
     return result
 
   def LimitOf(self, predicate_name):
@@ -567,7 +710,8 @@ class LogicaProgram(object):
   Can produce SQL for predicates.
   """
 
-  def __init__(self, rules, table_aliases=None, user_flags=None):
+  def __init__(self, rules, table_aliases=None, user_flags=None,
+               profiler=None, required_predicates=None):
     """Initializes the program.
 
     Args:
@@ -575,9 +719,31 @@ class LogicaProgram(object):
       table_aliases: A map from an undefined Logica predicate name to a
         BigQuery table name. This table will be used in place of predicate.
       user_flags: Dictionary of user specified flags.
+      profiler: profiling.Profiler to record phases of building the program
+        and of compiling its predicates.
+      required_predicates: Names of predicates that will be compiled. If
+        given, rules that these predicates do not depend on are dropped
+        before building the program. Then types are inferred and checked
+        only for the remaining predicates.
     """
+    self.profiler = profiler
+    if not tree_shaking.Enabled():
+      required_predicates = None
+    self.required_predicates = (
+        None if required_predicates is None else set(required_predicates))
+    with self.Profiling():
+      self.Build(rules, table_aliases, user_flags)
+
+  def Profiling(self):
+    """Context activating profiler of the program, if it has one."""
+    return profiling.Activated(self.profiler)
+
+  def Build(self, rules, table_aliases, user_flags):
+    """Unfolds recursion, runs functors, infers types and builds UDFs."""
     self.raw_rules = rules  # For Clingo.
-    rules = self.UnfoldRecursion(rules)
+    rules = self.ShakeRules(rules)
+    with profiling.Phase('recursion unfolding'):
+      rules = self.UnfoldRecursion(rules)
 
     # TODO: Should allocator be a member of Logica?
     self.preparsed_rules = rules
@@ -587,7 +753,8 @@ class LogicaProgram(object):
     self.table_aliases = table_aliases or {}
     self.execution = None
     self.user_flags = user_flags or {}
-    self.annotations = Annotations(rules, self.user_flags)
+    with profiling.Phase('annotations'):
+      self.annotations = Annotations(rules, self.user_flags)
     self.flag_values = self.annotations.flag_values
     # Dictionary custom_udfs maps function name to a format string to use
     # in queries.
@@ -605,12 +772,17 @@ class LogicaProgram(object):
     self.functors = None
 
     # Extending rules with functors.
-    extended_rules = self.RunMakes(rules)  # Populates self.functors.
+    with profiling.Phase('make'):
+      extended_rules = self.RunMakes(rules)  # Populates self.functors.
 
     # Extending rules with the library of the dialect.
-    library_rules = parse.ParseFile(
-        dialects.Get(self.annotations.Engine()).LibraryProgram())['rule']
+    with profiling.Phase('dialect library'):
+      library_rules = parse.ParseLibrary(
+          dialects.Get(self.annotations.Engine()).LibraryProgram())
     extended_rules.extend(library_rules)
+    # Functors and the library brought in new rules, most of them are
+    # not needed.
+    extended_rules = self.ShakeRules(extended_rules)
 
     for rule in extended_rules:
       predicate_name = rule['head']['predicate_name']
@@ -619,7 +791,8 @@ class LogicaProgram(object):
     self.CheckDistinctConsistency()
     # We need to recompute annotations, because 'Make' created more rules and
     # annotations.
-    self.annotations = Annotations(extended_rules, self.user_flags)
+    with profiling.Phase('annotations'):
+      self.annotations = Annotations(extended_rules, self.user_flags)
 
     # Infering types if requested.
     self.typing_preamble = ''
@@ -627,13 +800,28 @@ class LogicaProgram(object):
     self.predicate_signatures = {}
     self.typing_engine = None
     if self.annotations.ShouldTypecheck():
-      self.typing_preamble = self.RunTypechecker()
+      with profiling.Phase('type inference'):
+        self.typing_preamble = self.RunTypechecker()
+    # Compilation of a predicate may require more types, remembering the
+    # program-level ones to compile predicates of a batch independently.
+    self.program_typing_state = (dict(self.required_type_definitions),
+                                 self.typing_preamble)
+    # Definitions of WITH tables shared by predicates compiled in a batch.
+    self.definition_memo = None
 
     # Build udfs, populating custom_udfs and custom_udf_definitions.
-    self.BuildUdfs()
+    with profiling.Phase('udfs'):
+      self.BuildUdfs()
     # Function compilation may have added irrelevant defines:
     self.execution = None
 
+  def ShakeRules(self, rules):
+    """Drops rules that required predicates do not depend on."""
+    if self.required_predicates is None:
+      return rules
+    with profiling.Phase('tree shaking'):
+      return tree_shaking.ReachableRules(rules, self.required_predicates)
+
   def CheckDistinctConsistency(self):
     is_distinct = {}
     for p, r in self.rules:
@@ -677,11 +865,15 @@ class LogicaProgram(object):
           r['body'] = {'conjunction': {'conjunct': []}}
         r['body']['conjunction']['satellites'] = [{'predicate_name': master[p]}]
 
-  def AddAutoStop(self, depth_map):
+  def AddAutoStop(self, depth_map, defined_predicates):
+    # Without a stop predicate unbounded recursion runs until it reaches
+    # a fixpoint.
     for k in depth_map:
       if ('1' in depth_map[k] and
           depth_map[k]['1'] == -1 and
-          'stop' not in depth_map[k]):
+          'stop' not in depth_map[k] and
+          'Stop' + k in defined_predicates and
+          not depth_map[k].get('semi_naive', False)):
         depth_map[k]['stop'] = {'predicate_name': 'Stop' + k}
 
   def UnfoldRecursion(self, rules):
@@ -703,7 +895,8 @@ class LogicaProgram(object):
           if recursive_cte.IsRecursivePredicate(predicate_name, rules_of):
             self.native_recursive_predicates.add(predicate_name)
 
-    self.AddAutoStop(depth_map)
+    self.AddAutoStop(depth_map,
+                     {r['head']['predicate_name'] for r in rules})
     self.InscribeOrbits(rules, depth_map)
     f = functors.Functors(rules)
     # Annotations are not ready at this point.
@@ -774,7 +967,8 @@ class LogicaProgram(object):
     """
     rules = [r for _, r in self.rules]
     typing_engine = infer.TypesInferenceEngine(
-        rules, dialect=self.annotations.Engine())
+        rules, dialect=self.annotations.Engine(),
+        signature_cache=import_cache.GetSignatureCache())
     typing_engine.InferTypes()
     self.typing_engine = typing_engine
     type_error_checker = infer.TypeErrorChecker(rules)
@@ -849,6 +1043,10 @@ class LogicaProgram(object):
 
   def PredicateSql(self, name, allocator=None, external_vocabulary=None):
     """Producing SQL for a predicate."""
+    with profiling.Phase('sql %s' % name):
+      return self.CompilePredicateSql(name, allocator, external_vocabulary)
+
+  def CompilePredicateSql(self, name, allocator, external_vocabulary):
     # Check if this should be compiled as a native recursive CTE
     if hasattr(self, 'native_recursive_predicates') and name in self.native_recursive_predicates:
       return self._CompileNativeRecursiveCte(name, allocator, external_vocabulary)
@@ -930,6 +1128,7 @@ class LogicaProgram(object):
     # Set the native CTE name so TranslateTable knows to return just the name
     # for recursive self-references
     self.execution.native_cte_being_compiled = name
+    self.execution.InvalidateJournals()
 
     try:
       # Compile base case rules (anchor query)
@@ -1083,7 +1282,8 @@ class LogicaProgram(object):
 
     vocabulary = {v: v for v in variables}
     s.external_vocabulary = vocabulary
-    self.RunInjections(s, allocator)
+    with profiling.Phase('injection'):
+      self.RunInjections(s, allocator)
     s.ElliminateInternalVariables(assert_full_ellimination=True)
     s.UnificationsToConstraints()
     sql = s.AsSql(subquery_encoder=self.MakeSubqueryTranslator(allocator))
@@ -1158,6 +1358,7 @@ class LogicaProgram(object):
     self.execution.dependencies_of = self.functors.args_of
     self.execution.dialect = dialects.Get(self.annotations.Engine())
     self.execution.iterations = self.annotations.Iterations()
+    self.execution.definition_memo = self.definition_memo
   
   def UpdateExecutionWithTyping(self):
     if self.execution.dialect.IsPostgreSQLish():
@@ -1182,8 +1383,56 @@ class LogicaProgram(object):
             # do not add any dependency edge.
             translator.TranslateTable(d, None, edge_needed=False)
 
+  def PredicateColumns(self, predicate_name):
+    """Returns columns of the predicate table, or None if unknown."""
+    for rule in self.GetPredicateRules(predicate_name):
+      fields = [fv['field'] for fv in rule['head']['record']['field_value']]
+      if '*' in fields:
+        return None
+      if not fields:
+        return ['atom']
+      return [rule_translate.LogicaFieldToSqlField(f) for f in fields]
+    return None
+
+  def PredicateColumnTypes(self, predicate_name):
+    """Returns inferred types of columns of the predicate, or None."""
+    if predicate_name not in self.predicate_signatures:
+      return None
+    return infer.ColumnTypes(self.predicate_signatures[predicate_name])
+
+  def FingerprintIterations(self):
+    """Adds SQL fingerprinting tables of iterations, to detect fixpoint.
+
+    Iterations that stop on emptiness of a table detect convergence
+    by themselves and are not fingerprinted.
+    """
+    for iteration in self.execution.iterations.values():
+      if iteration['stop_when_empty']:
+        continue
+      fingerprint_sql = {}
+      for p in iteration['predicates']:
+        ground = self.annotations.Ground(p)
+        if not ground:
+          continue
+        sql = self.execution.dialect.TableFingerprintSql(
+          ground.table_name, self.PredicateColumns(p))
+        if sql:
+          fingerprint_sql[p] = sql
+      iteration['fingerprint_sql'] = fingerprint_sql
+
   def FormattedPredicateSql(self, name, allocator=None):
     """Printing top-level formatted SQL statement with defines and exports."""
+    with self.Profiling(), profiling.Phase('formatted sql %s' % name):
+      return self.CompileFormattedPredicateSql(name, allocator)
+
+  def CompileFormattedPredicateSql(self, name, allocator):
+    if (self.required_predicates is not None and
+        name not in self.required_predicates):
+      raise rule_translate.RuleCompileException(
+          color.Format(
+              'Predicate {warning}{name}{end} is not among required '
+              'predicates that the program was built for.',
+              dict(name=name)), name)
     self.InitializeExecution(name)
     if self.flag_values and False:  # TODO: Control flag printing.
       flags_str_lines = ['# Logica flags:']
@@ -1197,8 +1446,10 @@ class LogicaProgram(object):
     else:
       sql = self.PredicateSql(name, allocator)
     self.PerformIterationClosure(allocator)
+    self.FingerprintIterations()
 
-    self.UpdateExecutionWithTyping()
+    with profiling.Phase('execution typing'):
+      self.UpdateExecutionWithTyping()
 
     assert self.execution.workflow_predicates_stack == [name], (
         'Logica internal error: unexpected workflow stack: %s' %
@@ -1246,6 +1497,38 @@ class LogicaProgram(object):
     else:
       return formatted_sql
 
+  def ResetTypingState(self):
+    """Forgets types that were required by previously compiled predicates."""
+    definitions, typing_preamble = self.program_typing_state
+    self.required_type_definitions = dict(definitions)
+    self.typing_preamble = typing_preamble
+
+  def FormattedPredicatesSql(self, names):
+    """Formatted SQL of several predicates of the program.
+
+    Recursion unfolding, functors, type inference and UDFs are done once
+    when the program is built. A WITH table compiled for one predicate is
+    reused by the following ones, when names allocated for it are the same,
+    so WITH dependencies common to the predicates are compiled once. SQL of
+    each predicate is identical to the SQL of FormattedPredicateSql.
+
+    Args:
+      names: List of predicate names to compile.
+
+    Returns:
+      OrderedDict mapping predicate name to a pair (formatted_sql, execution).
+    """
+    result = collections.OrderedDict()
+    self.definition_memo = collections.defaultdict(list)
+    try:
+      for name in names:
+        self.ResetTypingState()
+        formatted_sql = self.FormattedPredicateSql(name)
+        result[name] = (formatted_sql, self.execution)
+    finally:
+      self.definition_memo = None
+    return result
+
   def UseFlagsAsParameters(self, sql):
     """Running flag substitution in a loop to the fixed point."""
     # We do it in a loop to deal with flags that refer to other flags.
@@ -1342,6 +1625,17 @@ class LogicaProgram(object):
         break
       s.tables = new_tables
 
+  def RequireTypeDefinitions(self, definitions):
+    # Preamble is rebuilt only when definitions change, as most rules use
+    # types that are already defined.
+    if any(self.required_type_definitions.get(k) != v
+           for k, v in definitions.items()):
+      self.required_type_definitions.update(definitions)
+      self.typing_preamble = infer.BuildPreamble(
+          self.required_type_definitions, dialect=self.annotations.Engine())
+    if self.execution:
+      self.execution.JournalOperation('types', dict(definitions))
+
   def SingleRuleSql(self, rule,
                     allocator=None, external_vocabulary=None,
                     is_combine=False, must_not_be_nil=False):
@@ -1356,21 +1650,21 @@ class LogicaProgram(object):
     # TODO(2023 July): Was this always redundant?
     # s.ElliminateInternalVariables(assert_full_ellimination=False)
 
-    self.RunInjections(s, allocator)
+    with profiling.Phase('injection'):
+      self.RunInjections(s, allocator)
     s.ElliminateInternalVariables(assert_full_ellimination=True)
     s.UnificationsToConstraints()
 
     if self.annotations.ShouldTypecheck():
-      type_inference = infer.TypeInferenceForStructure(
-          s, self.predicate_signatures, dialect=self.annotations.Engine())
-      type_inference.PerformInference()
-      error_checker = infer.TypeErrorChecker([type_inference.quazy_rule])
-      error_checker.CheckForError('raise')
+      with profiling.Phase('structure typing'):
+        type_inference = infer.TypeInferenceForStructure(
+            s, self.predicate_signatures, dialect=self.annotations.Engine())
+        type_inference.PerformInference()
+        error_checker = infer.TypeErrorChecker([type_inference.quazy_rule])
+        error_checker.CheckForError('raise')
       # New types may arrive here when we have an injetible predicate with variables
       # which specific record type depends on the inputs. 
-      self.required_type_definitions.update(type_inference.collector.definitions)
-      self.typing_preamble = infer.BuildPreamble(self.required_type_definitions,
-                                                 dialect=self.annotations.Engine())
+      self.RequireTypeDefinitions(type_inference.collector.definitions)
 
     if 'nil' in s.tables.values():
       if must_not_be_nil:
@@ -1438,8 +1732,12 @@ class SubqueryTranslator(object):
       self.execution.dependency_edges.append((
           table,
           self.execution.workflow_predicates_stack[-1]))
+      self.execution.JournalOperation('edge', table)
     if table in self.execution.table_to_defined_table_map:
-      return self.execution.table_to_defined_table_map[table]
+      table_name = self.execution.table_to_defined_table_map[table]
+      self.execution.JournalDefinitionCheck(table, table_name)
+      return table_name
+    self.execution.InvalidateJournals()
     table_name = ground.table_name
         #self.allocator.AllocateTable(hint_for_user=table)
     self.execution.table_to_defined_table_map[table] = table_name
@@ -1458,19 +1756,25 @@ class SubqueryTranslator(object):
 
       dependency_sql = self.program.UseFlagsAsParameters(dependency_sql)
       self.execution.workflow_predicates_stack.pop()
-      maybe_drop_table = (
-          'DROP TABLE IF EXISTS %s%s;\n' % ((
-              ground.table_name if ground.overwrite else '',
-              self.execution.dialect.MaybeCascadingDeletionWord())))
       maybe_copy = ''
       if ground.copy_to_file:
         maybe_copy = f'COPY {ground.table_name} TO \'{ground.copy_to_file}\';\n'
-      export_statement = (
-          maybe_drop_table +
-          'CREATE TABLE {name} AS {dependency_sql}'.format(
-              name=ground.table_name,
-              dependency_sql=FormatSql(dependency_sql)) +
-          maybe_copy)
+      if ground.overwrite:
+        export_statement = (
+            'DROP TABLE IF EXISTS %s%s;\n' % (
+                ground.table_name,
+                self.execution.dialect.MaybeCascadingDeletionWord()) +
+            'CREATE TABLE {name} AS {dependency_sql}'.format(
+                name=ground.table_name,
+                dependency_sql=FormatSql(dependency_sql)) +
+            maybe_copy)
+      else:
+        # Appending to the table, which must already exist.
+        export_statement = (
+            'INSERT INTO {name} {dependency_sql}'.format(
+                name=ground.table_name,
+                dependency_sql=FormatSql(dependency_sql)) +
+            maybe_copy)
 
       export_statement = self.program.UseFlagsAsParameters(export_statement)
       # It's cheap to store a string multiple times in Python, as it's stored
@@ -1486,20 +1790,19 @@ class SubqueryTranslator(object):
     """Translates table that should be defined in a WITH clause."""
     parent_table = self.execution.workflow_predicates_stack[-1]
     if table not in self.execution.table_to_defined_table_map:
-      table_name = self.allocator.AllocateTable(hint_for_user=table)
-      self.execution.table_to_defined_table_map[table] = table_name
-      # We don't pass external vocabulary; named predicates should not have
-      # free terms.
-      implementation = self.program.PredicateSql(table, self.allocator)
-      self.execution.table_to_with_sql_map[table_name] = implementation
+      self.DefineWithedTable(table)
     else:
       # Calling predicate SQL to add the required ground dependencies.
-      if table not in self.execution.with_compilation_done_for_parent[
-          parent_table]:
-        # Swap these lines to compile a recursive with.
-        _ = self.program.PredicateSql(table, self.allocator)
-        self.execution.with_compilation_done_for_parent[
-            parent_table].add(table)
+      done_for_parent = self.execution.with_compilation_done_for_parent[
+          parent_table]
+      self.execution.JournalDefinitionCheck(
+          table, self.execution.table_to_defined_table_map[table])
+      self.execution.JournalRecompilationCheck(table,
+                                               table in done_for_parent)
+      if table not in done_for_parent:
+        self.RecompileWithedTable(table)
+        done_for_parent.add(table)
+        self.execution.JournalOperation('done', table)
 
     # Adding dependencies at the end means we add the deepest dependencies
     # first, which ensures our WITH clause is ordered correctly.
@@ -1508,8 +1811,121 @@ class SubqueryTranslator(object):
     # previously.
     if table not in self.execution.table_to_with_dependencies[parent_table]:
       self.execution.table_to_with_dependencies[parent_table].append(table)
+    self.execution.JournalOperation('with_dependency', table)
     return self.execution.table_to_defined_table_map[table]
 
+  def DefineWithedTable(self, table):
+    """Defines WITH table that is not yet defined in the execution.
+
+    When predicates are compiled in a batch the definition is journaled,
+    and replayed when the table is needed by another predicate of the batch
+    in the same state of the execution and of the allocator.
+    """
+    parent_table = self.execution.workflow_predicates_stack[-1]
+    self.execution.InvalidateJournals(except_definitions=True)
+    memo = self.execution.definition_memo
+    if memo is None:
+      self.CompileWithedTableDefinition(table, self.allocator)
+      return
+    key = (table, self.execution.native_cte_being_compiled)
+    done_for_parent = self.execution.with_compilation_done_for_parent[
+        parent_table]
+    for journal in memo[key]:
+      if journal.ReplayableIn(self.execution, done_for_parent,
+                              self.allocator):
+        self.ReplayJournal(journal)
+        self.execution.compilations_avoided += journal.NumCompilations()
+        return
+
+    allocator = self.allocator
+    if not isinstance(allocator, RecordingAllocator):
+      allocator = RecordingAllocator(allocator, self.execution)
+    journal = DefinitionJournal(allocator)
+    self.execution.recompilation_journals.append(journal)
+    try:
+      self.CompileWithedTableDefinition(table, allocator)
+    finally:
+      self.execution.recompilation_journals.pop()
+    if journal.valid:
+      memo[key].append(journal)
+
+  def CompileWithedTableDefinition(self, table, allocator):
+    table_name = allocator.AllocateTable(hint_for_user=table)
+    self.execution.table_to_defined_table_map[table] = table_name
+    # We don't pass external vocabulary; named predicates should not have
+    # free terms.
+    implementation = self.program.PredicateSql(table, allocator)
+    self.execution.table_to_with_sql_map[table_name] = implementation
+    self.execution.JournalOperation('define',
+                                    (table, table_name, implementation))
+
+  def RecompileWithedTable(self, table):
+    """Recompiles already defined WITH table for the current parent.
+
+    The resulting SQL is not used, recompilation is done for its side effects.
+    They are journaled on the first recompilation of the table and replayed
+    for the following parents, which leaves execution and allocator in the
+    same state as recompilation would.
+    """
+    parent_table = self.execution.workflow_predicates_stack[-1]
+    key = (table, self.execution.native_cte_being_compiled)
+    journal = self.execution.recompilation_memo.get(key)
+    if journal and journal.ReplayableFor(
+        self.execution.with_compilation_done_for_parent[parent_table]):
+      self.ReplayJournal(journal)
+      self.execution.compilations_avoided += journal.NumCompilations()
+      return
+
+    journal = RecompilationJournal()
+    allocator = self.allocator
+    if not isinstance(allocator, RecordingAllocator):
+      allocator = RecordingAllocator(allocator, self.execution)
+    self.execution.recompilation_journals.append(journal)
+    try:
+      # Swap these lines to compile a recursive with.
+      _ = self.program.PredicateSql(table, allocator)
+    finally:
+      self.execution.recompilation_journals.pop()
+    if journal.valid and key not in self.execution.recompilation_memo:
+      self.execution.recompilation_memo[key] = journal
+
+  def ReplayJournal(self, journal):
+    """Applies journaled side effects to the current parent."""
+    parent_table = self.execution.workflow_predicates_stack[-1]
+    for table, was_done in journal.done_for_parent.items():
+      self.execution.JournalRecompilationCheck(table, was_done)
+    for table, table_name in journal.defined_before.items():
+      self.execution.JournalDefinitionCheck(table, table_name)
+    for operation, argument in journal.operations:
+      # Allocations are journaled by the allocator, if needed.
+      if operation == 'var':
+        self.allocator.AllocateVar(argument)
+        continue
+      if operation == 'table':
+        self.allocator.AllocateTable(hint_for_user=argument)
+        continue
+      if operation == 'edge':
+        self.execution.dependency_edges.append((argument, parent_table))
+      elif operation == 'data_edge':
+        self.execution.data_dependency_edges.append((argument, parent_table))
+      elif operation == 'with_dependency':
+        dependencies = self.execution.table_to_with_dependencies[parent_table]
+        if argument not in dependencies:
+          dependencies.append(argument)
+      elif operation == 'done':
+        self.execution.with_compilation_done_for_parent[parent_table].add(
+            argument)
+      elif operation == 'define':
+        table, table_name, implementation = argument
+        self.execution.table_to_defined_table_map[table] = table_name
+        self.execution.table_to_with_sql_map[table_name] = implementation
+      elif operation == 'types':
+        self.program.RequireTypeDefinitions(argument)
+        continue  # Journaled by RequireTypeDefinitions.
+      else:
+        assert False, 'Unknown journal operation: %s' % operation
+      self.execution.JournalOperation(operation, argument)
+
   @classmethod
   def UnquoteParenthesised(cls, table):
     """Enable direct usage of SQL strings as table names."""
@@ -1541,6 +1957,7 @@ class SubqueryTranslator(object):
     self.execution.data_dependency_edges.append((
       table,
       self.execution.workflow_predicates_stack[-1]))
+    self.execution.JournalOperation('data_edge', table)
     # Apply dialect-specific quoting to external table names
     table = self.UnquoteParenthesised(table)
     return self.execution.dialect.QuoteTableIdentifier(table)
@@ -1574,7 +1991,7 @@ def RaiseCompilerError(message, context):
 
 
 def FieldValuesAsList(field_values):
-  field_values = copy.deepcopy(field_values)
+  field_values = syntax_tree.CopyTree(field_values)
   if '__rule_text' in field_values:
     del field_values['__rule_text']
   field_values_list = []
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unitests for universe.py."""
+
+import unittest
+
+from common import sqlite3_logica
+from compiler import universe
+from parser_py import parse
+
+
+PROGRAM = """
+@Engine("sqlite");
+@With(A);
+A(x:) :- x in Range(3);
+@With(B);
+B(x:) :- A(x:), x > 0;
+@Ground(G);
+G(x:) :- B(x:);
+P(x:) :- B(x:);
+Q(y: x + 1) :- B(x:), G(x:);
+R(z: 2 * x) :- A(x:);
+S(z: 3 * x) :- A(x:);
+"""
+
+
+def Run(execution):
+  return sqlite3_logica.SqliteStream(
+      [execution.preamble] + execution.defines_and_exports +
+      [execution.main_predicate_sql]).Fetchall()
+
+
+class UniverseTest(unittest.TestCase):
+  def test_BatchReusesDefinitionsOfWithTables(self):
+    rules = parse.ParseFile(PROGRAM)['rule']
+    names = ['P', 'Q', 'R', 'S']
+    batch = universe.LogicaProgram(rules).FormattedPredicatesSql(names)
+    for name in names:
+      program = universe.LogicaProgram(rules)
+      program.FormattedPredicateSql(name)
+      self.assertEqual(sorted(Run(batch[name][1])),
+                       sorted(Run(program.execution)))
+    self.assertEqual(batch['P'][1].compilations_avoided, 0)
+    self.assertGreater(batch['Q'][1].compilations_avoided, 0)
+    self.assertGreater(batch['S'][1].compilations_avoided, 0)
+
+  def test_BatchSqlIsSqlOfEachPredicate(self):
+    rules = parse.ParseFile(PROGRAM)['rule']
+    names = ['P', 'Q', 'R', 'S', 'P']
+    batch = universe.LogicaProgram(rules).FormattedPredicatesSql(names)
+    for name in names:
+      self.assertEqual(
+          batch[name][0],
+          universe.LogicaProgram(rules).FormattedPredicateSql(name))
+
+if __name__ == '__main__':
+  unittest.main()
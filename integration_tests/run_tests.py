@@ -120,6 +120,8 @@ def RunAll(test_presto=False, test_trino=False, test_clingo=True, test_mssql=Fal
   RunTest("psqld_empty_list_type_test")
 
   RunTest("sqlite_deep_recursion_test", use_concertina=True)
+  RunTest("sqlite_semi_naive_test", use_concertina=True)
+  RunTest("sqlite_fixpoint_test", use_concertina=True)
   RunTest("sqlite_nil_test")
   RunTest("sqlite_flat_recursion_test")
   RunTest("sqlite_winmove_test")
@@ -153,6 +155,12 @@ def RunAll(test_presto=False, test_trino=False, test_clingo=True, test_mssql=Fal
   RunTest("duckdb_stop_test",
           src="duckdb_stop_test.l",
           use_concertina=True)
+  RunTest("duckdb_semi_naive_test",
+          src="psql_semi_naive_test.l",
+          duckify_psql=True, use_concertina=True)
+  RunTest("duckdb_fixpoint_test",
+          src="psql_fixpoint_test.l",
+          duckify_psql=True, use_concertina=True)
   RunTest("duckdb_purchase_test",
           src="psql_purchase_test.l",
           duckify_psql=True, use_concertina=True)
@@ -196,6 +204,8 @@ def RunAll(test_presto=False, test_trino=False, test_clingo=True, test_mssql=Fal
   RunTest("psql_structs_ground_test")
   RunTest("psql_simple_structs_test")
   RunTest("psql_recursion_test")
+  RunTest("psql_semi_naive_test", use_concertina=True)
+  RunTest("psql_fixpoint_test", use_concertina=True)
   RunTest("psql_test")
   RunTest("psql_arg_min_test")
   RunTest("psql_arg_min_max_k_test")
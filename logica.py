@@ -42,9 +42,12 @@ import sys
 # script.
 if __name__ == '__main__' and not __package__:
   from common import color
+  from common import compile_cache
   from common import sqlite3_logica
   from common import clingo_logica
   from common import duckdb_logica
+  from common import profiling
+  from common import result_stream
   from compiler import functors
   from compiler import rule_translate
   from compiler import universe
@@ -54,9 +57,12 @@ if __name__ == '__main__' and not __package__:
   from tools import proposition_repl
 else:
   from .common import color
+  from .common import compile_cache
   from .common import sqlite3_logica
   from .common import clingo_logica
   from .common import duckdb_logica
+  from .common import profiling
+  from .common import result_stream
   from .compiler import functors
   from .compiler import rule_translate
   from .compiler import universe
@@ -124,7 +130,80 @@ def GetTrinoParameters(a):
   return boolean_params + params
 
 
+def SplitScriptAndQuery(formatted_sql, execution):
+  """Splits SQL of a predicate into statements to run and final query.
+
+  Returns None if the query is not the tail of the SQL.
+  """
+  query_sql = universe.FormatSql(execution.main_predicate_sql)
+  if not formatted_sql.endswith(query_sql):
+    return None
+  return formatted_sql[:-len(query_sql)], execution.main_predicate_sql
+
+
+def MaxRowsToPrint():
+  """Returns limit of rows printed by run command, from LOGICA_MAX_ROWS."""
+  max_rows = os.environ.get('LOGICA_MAX_ROWS')
+  return int(max_rows) if max_rows else None
+
+
+def PrintResultStream(stream, command):
+  """Prints result of run command, writing it out as it's being read."""
+  try:
+    if command == 'run':
+      sqlite3_logica.WriteArtisticTable(stream.header, stream.Rows(),
+                                        sys.stdout, max_rows=MaxRowsToPrint())
+    elif command == 'run_to_csv':
+      result_stream.WriteCsv(stream, sys.stdout)
+    elif command == 'run_to_jsonl':
+      result_stream.WriteJsonLines(stream, sys.stdout)
+    else:
+      assert False, 'Unknown run command: %s' % command
+  except BrokenPipeError:
+    stream.Close()
+
+
+def ExtractProfileFlag(argv):
+  """Removes --profile flag from the arguments.
+
+  Returns:
+    Arguments without the flag, and None if profiling was not requested,
+    empty string for a table of phases or file name for a Chrome trace.
+  """
+  profile = None
+  rest = []
+  for a in argv:
+    if a == '--profile':
+      profile = ''
+    elif a.startswith('--profile='):
+      profile = a.split('=', 1)[1]
+    else:
+      rest.append(a)
+  return rest, profile
+
+
+def WriteProfile(profiler, profile):
+  if profile:
+    with open(profile, 'w') as w:
+      json.dump(profiler.ChromeTrace(), w)
+    print('Chrome trace of compilation is written to %s.' % profile,
+          file=sys.stderr)
+  else:
+    print(sqlite3_logica.ArtisticTable(*profiler.Summary()), file=sys.stderr)
+
+
 def main(argv):
+  argv, profile = ExtractProfileFlag(argv)
+  if profile is None:
+    return RunCommand(argv)
+  profiler = profiling.Profiler()
+  with profiler.Active():
+    result = RunCommand(argv)
+  WriteProfile(profiler, profile)
+  return result
+
+
+def RunCommand(argv):
   if len(argv) <= 1 or argv[1] == 'help':
     print('Usage:')
     print('  logica <l file> <command> <predicate name> [flags]')
@@ -132,6 +211,11 @@ def main(argv):
     print('    print: prints the StandardSQL query for the predicate.')
     print('    run: runs the StandardSQL query on BigQuery with pretty output.')
     print('    run_to_csv: runs the query on BigQuery with csv output.')
+    print('    run_to_jsonl: runs the query with output of a JSON object per '
+          'row, on engines with a Python driver.')
+    print('  Flag --profile prints time and allocations of compilation '
+          'phases,')
+    print('  --profile=<file> writes them as Chrome trace JSON.')
 
     print('')
     print('')
@@ -157,7 +241,8 @@ def main(argv):
 
   command = argv[2]
 
-  commands = ['parse', 'print', 'run', 'run_to_csv', 'run_in_terminal',
+  commands = ['parse', 'print', 'run', 'run_to_csv', 'run_to_jsonl',
+              'run_in_terminal',
               'infer_types', 'show_signatures', 'build_schema',
               'propositional_playground', 'print_clingo', 'run_clingo']
 
@@ -191,9 +276,36 @@ def main(argv):
 
   program_text = open(filename, encoding='utf-8').read().replace('\r\n', '\n').replace('\r', '\n')
 
+  cache = compile_cache.GetDefaultCache() if command == 'print' else None
+  if cache:
+    # Compiled predicates are looked up by the raw program text and flags,
+    # so the program is parsed only if some predicate is not in the cache.
+    flag_args = argv[4:]
+    try:
+      compiled_predicates = cache.CompileCommandLine(
+          program_text, predicates.split(','), flag_args,
+          lambda rules: ReadUserFlags(rules, flag_args),
+          import_root=GetImportRoot())
+    except rule_translate.RuleCompileException as rule_compilation_exception:
+      rule_compilation_exception.ShowMessage()
+      sys.exit(1)
+    except functors.FunctorError as functor_exception:
+      functor_exception.ShowMessage()
+      sys.exit(1)
+    except infer.TypeErrorCaughtException as type_error_exception:
+      type_error_exception.ShowMessage()
+      sys.exit(1)
+    except parse.ParsingException as parsing_exception:
+      parsing_exception.ShowMessage()
+      sys.exit(1)
+    for compiled in compiled_predicates.values():
+      print(compiled.formatted_sql)
+    return
+
   try:
-    parsed_rules = parse.ParseFile(program_text,
-                                   import_root=GetImportRoot())['rule']
+    with profiling.Phase('parse'):
+      parsed_rules = parse.ParseFile(program_text,
+                                     import_root=GetImportRoot())['rule']
   except parse.ParsingException as parsing_exception:
     parsing_exception.ShowMessage()
     sys.exit(1)
@@ -252,33 +364,50 @@ def main(argv):
             clingo_logica.Klingon(parsed_rules, predicates_list))))
     return 0
 
-  for predicate in predicates_list:
-    try:
-      logic_program = universe.LogicaProgram(
-          parsed_rules, user_flags=user_flags)
-      formatted_sql = logic_program.FormattedPredicateSql(predicate)
-      preamble = logic_program.execution.preamble
-      defines_and_exports = logic_program.execution.defines_and_exports
-      main_predicate_sql = logic_program.execution.main_predicate_sql
-    except rule_translate.RuleCompileException as rule_compilation_exception:
-      rule_compilation_exception.ShowMessage()
-      sys.exit(1)
-    except functors.FunctorError as functor_exception:
-      functor_exception.ShowMessage()
-      sys.exit(1)
-    except infer.TypeErrorCaughtException as type_error_exception:
-      type_error_exception.ShowMessage()
-      sys.exit(1)
-    except parse.ParsingException as parsing_exception:
-      parsing_exception.ShowMessage()
-      sys.exit(1)
+  # The program is built once and shared by all requested predicates.
+  try:
+    logic_program = universe.LogicaProgram(
+        parsed_rules, user_flags=user_flags,
+        required_predicates=predicates_list)
+    compiled_predicates = logic_program.FormattedPredicatesSql(
+        predicates_list)
+  except rule_translate.RuleCompileException as rule_compilation_exception:
+    rule_compilation_exception.ShowMessage()
+    sys.exit(1)
+  except functors.FunctorError as functor_exception:
+    functor_exception.ShowMessage()
+    sys.exit(1)
+  except infer.TypeErrorCaughtException as type_error_exception:
+    type_error_exception.ShowMessage()
+    sys.exit(1)
+  except parse.ParsingException as parsing_exception:
+    parsing_exception.ShowMessage()
+    sys.exit(1)
+
+  for predicate, (formatted_sql, execution) in compiled_predicates.items():
+    preamble = execution.preamble
+    defines_and_exports = execution.defines_and_exports
+    main_predicate_sql = execution.main_predicate_sql
 
     if command == 'print':
       print(formatted_sql)
 
     engine = logic_program.annotations.Engine()
 
-    if command == 'run' or command == 'run_to_csv':
+    if command in ('run', 'run_to_csv', 'run_to_jsonl'):
+      # Output of engines with Python drivers is streamed and printed right
+      # away, then o is None.
+      o = None
+      # Types inferred for the columns tell drivers how to digest them.
+      column_types = logic_program.PredicateColumnTypes(predicate)
+      streamed_engine = (
+          engine in ('sqlite', 'duckdb', 'clickhouse') or
+          (engine == 'psql' and os.environ.get('LOGICA_PSQL_CONNECTION')) or
+          (engine == 'mssql' and os.environ.get('LOGICA_MSSQL_CONNECTION')))
+      if command == 'run_to_jsonl' and not streamed_engine:
+        print('Command run_to_jsonl is not supported for engine %s.' % engine,
+              file=sys.stderr)
+        return 1
       # We should split and move this logic to dialects.
       if engine == 'bigquery':
         output_format = 'csv' if command == 'run_to_csv' else 'pretty'
@@ -289,32 +418,30 @@ def main(argv):
         o, _ = p.communicate(formatted_sql.encode())
       elif engine == 'sqlite':
         # TODO: Make multi-statement scripts work.
-        format = ('artistictable' if command == 'run' else 'csv')
         statements_to_execute = (
           [preamble] + defines_and_exports + [main_predicate_sql])
-        o = sqlite3_logica.RunSqlScript(statements_to_execute,
-                                        format).encode()
+        PrintResultStream(sqlite3_logica.SqliteStream(statements_to_execute),
+                          command)
       elif engine == 'duckdb':
         connection = duckdb_logica.GetConnection(logic_program)
-        cur = connection.sql(formatted_sql)
-        formatter = (sqlite3_logica.ArtisticTable
-                     if command == 'run'
-                     else sqlite3_logica.Csv)
-        o = formatter(cur.columns,
-                      cur.fetchall()).encode()
+        PrintResultStream(
+            duckdb_logica.DuckdbStream(formatted_sql, connection), command)
       elif engine == 'psql':
         connection_str = os.environ.get('LOGICA_PSQL_CONNECTION')
         if connection_str:
-          connection_str = os.environ.get('LOGICA_PSQL_CONNECTION')
-          import psycopg2
           from common import psql_logica
-          connection = psycopg2.connect(connection_str)
-          cursor = psql_logica.PostgresExecute(formatted_sql, connection)
-          rows = [list(map(psql_logica.DigestPsqlType, row))
-              
-                  for row in cursor.fetchall()]
-          o = sqlite3_logica.ArtisticTable([d[0] for d in cursor.description],
-                                           rows).encode()
+          with psql_logica.ConnectionPool().Connection() as connection:
+            script_and_query = SplitScriptAndQuery(formatted_sql, execution)
+            if script_and_query:
+              script, query = script_and_query
+              stream = psql_logica.PostgresStream(
+                  query, connection, script=script,
+                  column_types=column_types)
+            else:
+              stream = psql_logica.CursorStream(
+                  psql_logica.PostgresExecute(formatted_sql, connection),
+                  column_types=column_types)
+            PrintResultStream(stream, command)
         else:
           p = subprocess.Popen(['psql', '--quiet'] +
                               (['--csv'] if command == 'run_to_csv' else []),
@@ -348,12 +475,11 @@ def main(argv):
         connection_str = os.environ.get('LOGICA_MSSQL_CONNECTION')
         if connection_str:
           from common import mssql_logica
-          connection = mssql_logica.ConnectToMSSQL('environment')
-          cursor = mssql_logica.MSSQLExecute(formatted_sql, connection)
-          rows = [list(map(mssql_logica.DigestMSSQLType, row))
-                  for row in cursor.fetchall()]
-          o = sqlite3_logica.ArtisticTable([d[0] for d in cursor.description],
-                                           rows).encode()
+          with mssql_logica.ConnectionPool().Connection() as connection:
+            PrintResultStream(
+                mssql_logica.MSSQLStream(formatted_sql, connection,
+                                         column_types=column_types),
+                command)
         else:
           # Try using sqlcmd command-line tool
           p = subprocess.Popen(['sqlcmd', '-Q', formatted_sql],
@@ -363,20 +489,20 @@ def main(argv):
         from common import clickhouse_logica
         connection_str = os.environ.get('LOGICA_CLICKHOUSE_CONNECTION')
         if connection_str:
-          connection = clickhouse_logica.ConnectToClickHouse('environment')
+          pool = clickhouse_logica.ConnectionPool('environment')
         else:
           # Get parameters from @Engine annotation
           a = logic_program.annotations.annotations.get('@Engine', {}).get('clickhouse', {})
-          connection = clickhouse_logica.ConnectToClickHouse('annotation', annotation_params=a)
-        cursor = clickhouse_logica.ClickHouseExecute(formatted_sql, connection)
-        rows = [list(map(clickhouse_logica.DigestClickHouseType, row))
-                for row in cursor.fetchall()]
-        o = sqlite3_logica.ArtisticTable([d[0] for d in cursor.description],
-                                         rows).encode()
+          pool = clickhouse_logica.ConnectionPool('annotation', annotation_params=a)
+        with pool.Connection() as connection:
+          PrintResultStream(
+              clickhouse_logica.ClickHouseStream(formatted_sql, connection),
+              command)
       else:
         assert False, 'Unknown engine: %s' % engine
       try:
-          print(o.decode(), flush=True)
+          if o is not None:
+            print(o.decode(), flush=True)
       except BrokenPipeError:
           pass
 
@@ -0,0 +1,227 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Process-wide cache of parsed imported files and libraries.
+
+Parsing statements of a file is a pure function of the file content (and of
+the enabled syntax features), so parse results of imported files and of
+generated library programs (e.g. dialect libraries) are shared across
+compilations in the process. Results are cached as they are before
+predicates get file prefixes, since prefixes depend on the importer.
+
+Files are identified by path, modification time and size, and entries by
+content hash, so that a changed file is always parsed again.
+
+The in-memory tier is always on. Set LOGICA_IMPORT_CACHE environment
+variable to a directory path to also keep parsed files on disk, or to 'off'
+to disable the cache.
+
+Signatures inferred for components of predicates, e.g. of imported modules,
+are kept in a separate cache configured by the same variable, see
+GetSignatureCache.
+"""
+
+import collections
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+
+if '.' not in __package__:
+  from parser_py import syntax_tree
+else:
+  from ..parser_py import syntax_tree
+
+# Bump when the layout of cached entries changes.
+CACHE_FORMAT_VERSION = 1
+
+
+def ReadLogicaFile(file_path):
+  with open(file_path, encoding='utf-8') as f:
+    return f.read().replace('\r\n', '\n').replace('\r', '\n')
+
+
+_PARSER_FINGERPRINT = None
+
+
+def ParserFingerprint():
+  """Hash of the parser sources, so that upgrades invalidate disk entries."""
+  global _PARSER_FINGERPRINT
+  if _PARSER_FINGERPRINT is None:
+    parser_directory = os.path.dirname(os.path.abspath(__file__))
+    h = hashlib.sha256(str(CACHE_FORMAT_VERSION).encode())
+    for filename in sorted(os.listdir(parser_directory)):
+      if filename.endswith('.py'):
+        with open(os.path.join(parser_directory, filename), 'rb') as f:
+          h.update(filename.encode() + b'\0' + f.read())
+    _PARSER_FINGERPRINT = h.hexdigest()
+  return _PARSER_FINGERPRINT
+
+
+class ImportCache(object):
+  """Two-tier cache of parsed statements of imported files and libraries.
+
+  Lookup returns a copy of the entry and Store keeps a copy of it, so
+  callers are free to modify the rules.
+  """
+
+  def __init__(self, max_entries=512, directory=None):
+    self.max_entries = max_entries
+    self.directory = directory
+    self.entries = collections.OrderedDict()
+    # File path -> ((mtime, size, syntax), key).
+    self.file_keys = {}
+    self.lock = threading.Lock()
+    self.hits = 0
+    self.disk_hits = 0
+    self.misses = 0
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+
+  def FileKey(self, file_path, syntax=''):
+    """Returns key of the file, reading it only if it was modified."""
+    file_path = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    signature = (stat.st_mtime_ns, stat.st_size, syntax)
+    with self.lock:
+      known = self.file_keys.get(file_path)
+    if known and known[0] == signature:
+      return known[1]
+    key = self.TextKey(ReadLogicaFile(file_path), syntax=syntax)
+    with self.lock:
+      self.file_keys[file_path] = (signature, key)
+    return key
+
+  def TextKey(self, content, syntax=''):
+    """Returns key of the program text."""
+    return hashlib.sha256(
+        (ParserFingerprint() + '\0' + syntax + '\0' + content).encode()
+    ).hexdigest()
+
+  def Lookup(self, key):
+    with self.lock:
+      if key in self.entries:
+        self.entries.move_to_end(key)
+        self.hits += 1
+        entry = self.entries[key]
+      else:
+        entry = None
+    if entry is None:
+      entry = self.ReadFromDisk(key)
+      with self.lock:
+        if entry is not None:
+          self.disk_hits += 1
+          self.RememberInMemory(key, entry)
+        else:
+          self.misses += 1
+    return syntax_tree.CopyTree(entry)
+
+  def Store(self, key, entry):
+    entry = syntax_tree.CopyTree(entry)
+    with self.lock:
+      self.RememberInMemory(key, entry)
+    self.WriteToDisk(key, entry)
+
+  def RememberInMemory(self, key, entry):
+    self.entries[key] = entry
+    self.entries.move_to_end(key)
+    while len(self.entries) > self.max_entries:
+      self.entries.popitem(last=False)
+
+  def DiskPath(self, key):
+    return os.path.join(self.directory, key[:2], key + '.pickle')
+
+  def ReadFromDisk(self, key):
+    if not self.directory:
+      return None
+    try:
+      with open(self.DiskPath(key), 'rb') as f:
+        return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError,
+            ImportError):
+      return None
+
+  def WriteToDisk(self, key, entry):
+    if not self.directory:
+      return
+    path = self.DiskPath(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        pickle.dump(entry, f)
+      os.replace(tmp_path, path)
+    except OSError:
+      if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+  def Stats(self):
+    with self.lock:
+      return {'hits': self.hits,
+              'disk_hits': self.disk_hits,
+              'misses': self.misses,
+              'entries': len(self.entries)}
+
+  def Clear(self):
+    with self.lock:
+      self.entries.clear()
+      self.file_keys.clear()
+      self.hits = self.disk_hits = self.misses = 0
+
+
+_DEFAULT_CACHE = None
+_DEFAULT_CACHE_SETTING = None
+_DEFAULT_CACHE_LOCK = threading.Lock()
+
+
+def GetDefaultCache():
+  """Returns process-wide cache configured by LOGICA_IMPORT_CACHE or None."""
+  global _DEFAULT_CACHE, _DEFAULT_CACHE_SETTING
+  setting = os.environ.get('LOGICA_IMPORT_CACHE', '')
+  if setting == 'off':
+    return None
+  with _DEFAULT_CACHE_LOCK:
+    if _DEFAULT_CACHE is None or _DEFAULT_CACHE_SETTING != setting:
+      _DEFAULT_CACHE = ImportCache(directory=setting or None)
+      _DEFAULT_CACHE_SETTING = setting
+  return _DEFAULT_CACHE
+
+
+_SIGNATURE_CACHE = None
+_SIGNATURE_CACHE_SETTING = None
+
+# Components are smaller and more numerous than files.
+SIGNATURE_CACHE_MAX_ENTRIES = 20000
+
+
+def GetSignatureCache():
+  """Returns process-wide cache of inferred types or None.
+
+  It's configured by LOGICA_IMPORT_CACHE like the cache of parsed files,
+  with disk entries in the 'signatures' subdirectory.
+  """
+  global _SIGNATURE_CACHE, _SIGNATURE_CACHE_SETTING
+  setting = os.environ.get('LOGICA_IMPORT_CACHE', '')
+  if setting == 'off':
+    return None
+  with _DEFAULT_CACHE_LOCK:
+    if _SIGNATURE_CACHE is None or _SIGNATURE_CACHE_SETTING != setting:
+      _SIGNATURE_CACHE = ImportCache(
+          max_entries=SIGNATURE_CACHE_MAX_ENTRIES,
+          directory=os.path.join(setting, 'signatures') if setting else None)
+      _SIGNATURE_CACHE_SETTING = setting
+  return _SIGNATURE_CACHE
@@ -0,0 +1,78 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unitests for import_cache.py."""
+
+import os
+import tempfile
+import unittest
+
+from parser_py import import_cache
+from parser_py import parse
+
+
+PROGRAM = 'import lib.family.Parent;\nP(x:) :- Parent(parent: x);'
+
+
+class ImportCacheTest(unittest.TestCase):
+  def setUp(self):
+    self.root = tempfile.TemporaryDirectory()
+    os.makedirs(os.path.join(self.root.name, 'lib'))
+    self.library = os.path.join(self.root.name, 'lib', 'family.l')
+    self.WriteLibrary('Parent(parent: "A", child: "B");')
+    import_cache.GetDefaultCache().Clear()
+
+  def tearDown(self):
+    self.root.cleanup()
+
+  def WriteLibrary(self, content):
+    with open(self.library, 'w') as f:
+      f.write(content)
+
+  def Parse(self):
+    return parse.ParseFile(PROGRAM, import_root=self.root.name)['rule']
+
+  def test_CachedImportParsesIdentically(self):
+    first = self.Parse()
+    second = self.Parse()
+    self.assertEqual(first, second)
+    self.assertEqual(import_cache.GetDefaultCache().Stats()['hits'], 1)
+    # Renaming by the importer did not modify the cached rules.
+    self.assertEqual(
+        second[1]['head']['predicate_name'], 'Family_Parent')
+
+  def test_ModifiedImportIsParsedAgain(self):
+    self.Parse()
+    self.WriteLibrary('Parent(parent: "X", child: "Y", extra: 1);')
+    rules = self.Parse()
+    self.assertIn('extra', str(rules))
+    self.assertEqual(import_cache.GetDefaultCache().Stats()['misses'], 2)
+
+  def test_DiskTier(self):
+    with tempfile.TemporaryDirectory() as directory:
+      cache = import_cache.ImportCache(directory=directory)
+      key = cache.FileKey(self.library)
+      cache.Store(key, parse.ParseStatements(
+          import_cache.ReadLogicaFile(self.library), {}, ['lib.family'],
+          self.root.name))
+      restored = import_cache.ImportCache(directory=directory).Lookup(key)
+      rules, imported_predicates = restored
+      self.assertEqual(rules[0]['head']['predicate_name'], 'Parent')
+      self.assertEqual(imported_predicates, [])
+
+
+if __name__ == '__main__':
+  unittest.main()
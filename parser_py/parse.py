@@ -22,17 +22,24 @@ from __future__ import print_function
 
 import ast
 import codecs
-import copy
+import contextlib
 import os
 import re
 import string
 import sys
+import threading
 from typing import Dict, Iterator, List, Optional, Tuple
 
 if '.' not in __package__:
   from common import color
+  from common import profiling
+  from parser_py import import_cache
+  from parser_py import syntax_tree
 else:
   from ..common import color
+  from ..common import profiling
+  from ..parser_py import import_cache
+  from ..parser_py import syntax_tree
 
 CLOSE_TO_OPEN = {
     ')': '(',
@@ -71,7 +78,7 @@ class HeritageAwareString(str):
     return self.GetSlice(start, stop)
 
   def GetSlice(self, start, stop) -> 'HeritageAwareString':
-    substring = HeritageAwareString(str(self)[start:stop])
+    substring = HeritageAwareString(str.__getitem__(self, slice(start, stop)))
     if stop > len(self):
       stop = len(self)
     if stop < 0:
@@ -81,6 +88,14 @@ class HeritageAwareString(str):
     substring.heritage = self.heritage
     return substring
 
+  def __copy__(self):
+    return self
+
+  def __deepcopy__(self, unused_memo):
+    # Heritage aware strings are never modified after they are sliced, so
+    # copies of syntax trees can share them.
+    return self
+
   def Pieces(self):
     return (self.heritage[:self.start],
             self.heritage[self.start:self.stop],
@@ -142,7 +157,7 @@ def FunctorSyntaxErrorMessage():
       'predicate names.')
 
 
-def Traverse(s):
+def TraverseText(s):
   """Traversing the string, yielding indices with the state of parentheses.
 
   Args:
@@ -249,20 +264,141 @@ def Traverse(s):
     yield (idx, state, 'OK')
 
 
+class TraversalTable(object):
+  """Traversal of a whole source buffer, computed in a single pass.
+
+  Substrings of the buffer are HeritageAwareStrings that refer to it by
+  heritage and integer span (start, stop). Instead of traversing every
+  substring character by character the parser looks up states of its span
+  in the table of the buffer.
+
+  Table is only usable if the buffer traverses cleanly, i.e. each character
+  is yielded once with 'OK' status, which is the case for comment-free
+  statements that reach the parsing functions.
+  """
+
+  def __init__(self, text):
+    self.state_after = [''] * len(text)
+    self.state_before = [None] * len(text)
+    self.depth = [0] * len(text)
+    self.clean = True
+    state = ''
+    expected_idx = 0
+    for idx, next_state, status in TraverseText(text):
+      if status != 'OK' or idx != expected_idx:
+        self.clean = False
+        return
+      self.state_before[idx] = state
+      self.state_after[idx] = next_state
+      self.depth[idx] = len(next_state)
+      state = next_state
+      expected_idx += 1
+    if expected_idx != len(text):
+      self.clean = False
+      return
+    # Substring can't start at the middle of a """ token, nor at a " that
+    # would be read as a part of one.
+    idx = text.find('""')
+    while idx != -1:
+      self.state_before[idx + 1] = None
+      idx = text.find('""', idx + 1)
+
+
+# Tables of buffers that are being parsed, keyed by the buffer, see
+# TraversalTablesScope.
+TRAVERSAL_TABLES = threading.local()
+
+
+@contextlib.contextmanager
+def TraversalTablesScope():
+  """Keeps traversal tables of buffers parsed within the scope.
+
+  Tables are dropped when the scope is left, so they live only as long as
+  parsing of a file.
+  """
+  outer_tables = getattr(TRAVERSAL_TABLES, 'tables', None)
+  TRAVERSAL_TABLES.tables = {}
+  try:
+    yield
+  finally:
+    TRAVERSAL_TABLES.tables = outer_tables
+
+
+def GetTraversalTable(text):
+  """Returns table of the buffer, or None if not in a TraversalTablesScope."""
+  tables = getattr(TRAVERSAL_TABLES, 'tables', None)
+  if tables is None:
+    return None
+  table = tables.get(text)
+  if table is None:
+    table = TraversalTable(text)
+    tables[text] = table
+  return table
+
+
+def TraversalSpan(s):
+  """Returns (table, start, stop, depth) to traverse s via table, or None.
+
+  Traversing a substring via the table of the buffer is equivalent to
+  traversing the substring itself if the substring starts outside of
+  strings and comments. Then state of the substring is state of the buffer
+  with the opened parenthesis prefix removed and the substring has an
+  unmatched parenthesis where depth of the buffer drops below the prefix.
+  """
+  if not isinstance(s, HeritageAwareString) or not s:
+    return None
+  start, stop, text = s.start, s.stop, s.heritage
+  if (start < 0 or stop > len(text) or stop - start != len(s) or
+      not text.startswith(s, start)):
+    return None
+  table = GetTraversalTable(text)
+  if table is None or not table.clean:
+    return None
+  prefix = table.state_before[start]
+  if prefix is None or prefix.strip('([{'):
+    return None
+  # A """ token that the buffer reads across the end of the substring.
+  if stop < len(text) and text[stop] == '"' and text[stop - 1] == '"':
+    return None
+  return table, start, stop, len(prefix)
+
+
+def Traverse(s):
+  """Traversing the string, see TraverseText for the yielded values."""
+  span = TraversalSpan(s)
+  if span is None:
+    yield from TraverseText(str(s))
+    return
+  table, start, stop, depth = span
+  state_after = table.state_after
+  for idx in range(start, stop):
+    state = state_after[idx]
+    if len(state) < depth:
+      yield (idx - start, None, 'Unmatched')
+      return
+    yield (idx - start, state[depth:], 'OK')
+
+
 def RemoveComments(s):
   chars = []
-  for idx, unused_state, status in Traverse(s):
+  text = str(s)
+  for idx, unused_state, status in TraverseText(text):
     if status == 'Unmatched':
       raise ParsingException('Parenthesis matches nothing.', s[idx:idx+1])
     elif status == 'EOL in string':
       raise ParsingException('End of line in string.', s[idx:idx])
     assert status == 'OK'
-    chars.append(s[idx])
+    chars.append(text[idx])
   return ''.join(chars)
 
 
 def IsWhole(s):
   """String is 'whole' if all parenthesis match."""
+  span = TraversalSpan(s)
+  if span is not None:
+    table, start, stop, depth = span
+    return (min(table.depth[start:stop]) >= depth and
+            table.depth[stop - 1] == depth)
   status = 'OK'
   state = ''
   for (_, state, status) in Traverse(s):
@@ -287,7 +423,7 @@ def Strip(s):
   """Removing outer parenthesis and spaces."""
   while True:
     s = StripSpaces(s)
-    if (len(s) >= 2 and s[0] == '(' and s[-1] == ')' and
+    if (len(s) >= 2 and s.startswith('(') and s.endswith(')') and
         IsWhole(s[1:-1])):
       s = s[1:-1]
     else:
@@ -295,13 +431,10 @@ def Strip(s):
 
 
 def StripSpaces(s):
-  left_idx = 0
-  right_idx = len(s) - 1
-  while left_idx < len(s) and s[left_idx].isspace():
-    left_idx += 1
-  while right_idx > left_idx and s[right_idx].isspace():
-    right_idx -= 1
-  return s[left_idx:right_idx + 1]
+  left_idx = len(s) - len(str.lstrip(s))
+  if left_idx == len(s):
+    return s[left_idx:left_idx]
+  return s[left_idx:len(str.rstrip(s))]
 
 
 def SplitRaw(s, separator):
@@ -318,9 +451,43 @@ def SplitRaw(s, separator):
   Raises:
     ParsingException: When parenthesis don't match.
   """
+  span = TraversalSpan(s)
+  if span is None:
+    return SplitRawByTraversal(s, separator)
+  table, start, stop, depth = span
+  depths = table.depth
+  if min(depths[start:stop]) < depth:
+    idx = next(i for i in range(start, stop) if depths[i] < depth) - start
+    raise ParsingException('Parenthesis matches nothing.', s[idx:idx+1])
+  text = s.heritage
+  parts = []
+  l = len(separator)
+  part_start = start
+  separator_alphanum = separator.isalnum()
+  idx = text.find(separator, start, stop)
+  while idx != -1:
+    # Same conditions as in SplitRawByTraversal.
+    if (depths[idx] == depth and
+        (idx + l == stop or text[idx + l] != '|') and
+        (idx == start or text[idx - 1] != '|') and
+        not (separator_alphanum and (
+            idx > start and text[idx - 1].isalnum() or
+            idx + l < stop and text[idx + l].isalnum()))):
+      parts.append(s[part_start - start:idx - start])
+      part_start = idx + l
+      idx = text.find(separator, idx + l, stop)
+    else:
+      idx = text.find(separator, idx + 1, stop)
+  parts.append(s[part_start - start:])
+  return parts
+
+
+def SplitRawByTraversal(s, separator):
+  """Implementation of SplitRaw for strings without traversal table."""
   parts = []
   l = len(separator)
-  traverse = Traverse(s)
+  text = str(s)
+  traverse = TraverseText(text)
   part_start = 0
   separator_alphanum = separator.isalnum()
   for idx, state, status in traverse:
@@ -329,14 +496,14 @@ def SplitRaw(s, separator):
       raise ParsingException('Parenthesis matches nothing.', s[idx:idx+1])
     # TODO: This a terrible hack to avoid parsing || as two |. Maybe
     # we should tokenize at some point.
-    if not state and s[idx:(idx + l)] == separator and (
-        len(s) == idx + l or s[idx + l] != '|') and (
-            idx == 0 or s[idx - 1] != '|'):
+    if not state and text[idx:(idx + l)] == separator and (
+        len(text) == idx + l or text[idx + l] != '|') and (
+            idx == 0 or text[idx - 1] != '|'):
       # Bail out if this is alphanum separator that's part of
       # a word.
       if separator_alphanum:
-        if (idx > 0 and s[idx - 1].isalnum() or
-            idx + l < len(s) and s[idx + l].isalnum()):
+        if (idx > 0 and text[idx - 1].isalnum() or
+            idx + l < len(text) and text[idx + l].isalnum()):
           continue
       # TODO: Treat tuples properly.
       parts.append(s[part_start:idx])
@@ -1418,14 +1585,43 @@ def ParseImport(file_import_str, parsed_imports, import_chain, import_root):
           HeritageAwareString(
               'import ' + file_import_str + '.<PREDICATE>')[7:-11])
 
-  with open(file_path, encoding='utf-8') as f:
-    file_content = f.read().replace('\r\n', '\n').replace('\r', '\n')
-  parsed_file = ParseFile(file_content, file_import_str, parsed_imports,
-                          import_chain, import_root)
+  with profiling.Phase('import %s' % file_import_str):
+    cache = import_cache.GetDefaultCache()
+    parsed_statements = None
+    if cache is not None:
+      cache_key = cache.FileKey(file_path, syntax=TOO_MUCH)
+      parsed_statements = cache.Lookup(cache_key)
+    if parsed_statements is None:
+      file_content = import_cache.ReadLogicaFile(file_path)
+      parsed_statements = ParseStatements(
+          file_content, parsed_imports, import_chain + [file_import_str],
+          import_root)
+      if cache is not None:
+        cache.Store(cache_key, parsed_statements)
+    parsed_file = ParseFile(None, file_import_str, parsed_imports,
+                            import_chain, import_root,
+                            parsed_statements=parsed_statements)
   parsed_imports[file_import_str] = parsed_file
   return parsed_file
 
 
+def ParseLibrary(s):
+  """Parses a generated library program, returns its rules.
+
+  Library programs, like libraries of SQL dialects and recursion functors,
+  are parsed once per process and then copied from the import cache.
+  """
+  cache = import_cache.GetDefaultCache()
+  if cache is None:
+    return ParseFile(s)['rule']
+  cache_key = cache.TextKey(s, syntax=TOO_MUCH)
+  parsed_statements = cache.Lookup(cache_key)
+  if parsed_statements is None:
+    parsed_statements = ParseStatements(s, {}, ['main'], '')
+    cache.Store(cache_key, parsed_statements)
+  return ParseFile(s, parsed_statements=parsed_statements)['rule']
+
+
 def DefinedPredicatesRules(rules):
   result = {}
   for r in rules:
@@ -1476,6 +1672,28 @@ def RenamePredicate(e, old_name, new_name):
   return renames_count
 
 
+def RenamePredicates(e, renames):
+  """Renames predicates in a syntax tree in a single pass.
+
+  Args:
+    e: Syntax tree.
+    renames: Dictionary mapping old predicate names to new ones.
+  """
+  if isinstance(e, dict):
+    if 'predicate_name' in e and e['predicate_name'] in renames:
+      e['predicate_name'] = renames[e['predicate_name']]
+    # Field names are treated as predicate names for functors.
+    if 'field' in e and e['field'] in renames:
+      e['field'] = renames[e['field']]
+    for v in e.values():
+      if isinstance(v, dict) or isinstance(v, list):
+        RenamePredicates(v, renames)
+  if isinstance(e, list):
+    for v in e:
+      if isinstance(v, dict) or isinstance(v, list):
+        RenamePredicates(v, renames)
+
+
 class MultiBodyAggregation(object):
   """This is a namespace for multi-body-aggregation processing functions."""
 
@@ -1483,7 +1701,7 @@ class MultiBodyAggregation(object):
   @classmethod
   def StripHeritage(cls, field_values):
     """Removing hertiage for comparison."""
-    result = copy.deepcopy(field_values)
+    result = syntax_tree.CopyTree(field_values)
     for fv in result:
       if 'aggregation' in fv['value']:
         del fv['value']['aggregation']['expression_heritage']
@@ -1492,7 +1710,7 @@ class MultiBodyAggregation(object):
   @classmethod
   def Rewrite(cls, rules):
     """Enabling multi-body-aggregation via auxiliary predicates."""
-    rules = copy.deepcopy(rules)
+    rules = syntax_tree.CopyTree(rules)
     new_rules = []
     defined_predicates_rules = DefinedPredicatesRules(rules)
     multi_body_aggregating_predicates = [
@@ -1561,7 +1779,7 @@ class MultiBodyAggregation(object):
   @classmethod
   def SplitAggregation(cls, rule):
     """Replacing aggregations with their arguments."""
-    rule = copy.deepcopy(rule)
+    rule = syntax_tree.CopyTree(rule)
     if 'distinct_denoted' not in rule:
       raise ParsingException('Inconsistency in >>distinct<< denoting for '
                              'predicate >>%s<<.' %
@@ -1662,8 +1880,8 @@ class DisjunctiveNormalForm(object):
     dnf = cls.PropositionToDNF(proposition)
     result = []
     for conjuncts in dnf:
-      new_rule = copy.deepcopy(rule)
-      new_rule['body'] = {'conjunction': {'conjunct': copy.deepcopy(conjuncts)}}
+      new_rule = syntax_tree.CopyTree(rule)
+      new_rule['body'] = {'conjunction': {'conjunct': syntax_tree.CopyTree(conjuncts)}}
       result.append(new_rule)
     return result
 
@@ -1732,7 +1950,7 @@ class AggergationsAsExpressions(object):
 
   @classmethod
   def Rewrite(cls, rules):
-    rules = copy.deepcopy(rules)
+    rules = syntax_tree.CopyTree(rules)
     cls.RewriteInternal(rules)
     return rules
 
@@ -1768,59 +1986,89 @@ def AnnotationsFromDenotations(rule):
 
 
 
+def ParseStatements(s, parsed_imports, import_chain, import_root):
+  """Parses statements of a file, parsing the files that it imports.
+
+  Args:
+    s: Logica program text.
+    parsed_imports: Imports parsed so far, extended by imports of s.
+    import_chain: Chain of file names that led to this file, including it.
+    import_root: Root(s) where imported files are looked for.
+  Returns:
+    A pair of rules, as they are before predicates get renamed by file
+    prefixes and imports, and imported predicates.
+  """
+  with TraversalTablesScope():
+    s = HeritageAwareString(RemoveComments(HeritageAwareString(s)))
+    str_statements = Split(s, ';')
+    rules = []
+    imported_predicates = []
+    for str_statement in str_statements:
+      if not str_statement:
+        continue
+      if str_statement.startswith('import '):
+        import_str = str_statement[len('import '):]
+        file_import_str, import_predicate, synonym = SplitImport(import_str)
+        ParseImport(file_import_str, parsed_imports, import_chain,
+                    import_root)
+        imported_predicates.append({
+            'file': file_import_str, 'predicate_name': import_predicate,
+            'synonym': synonym})
+        continue
+
+      rule = None
+      annotation_and_rule = ParseFunctionRule(
+          HeritageAwareString(str_statement))
+      if annotation_and_rule:
+        annotation, rule = annotation_and_rule
+        rules.append(annotation)
+      if not rule:
+        rule = ParseFunctorRule(HeritageAwareString(str_statement))
+      if not rule:
+        rule = ParseRule(HeritageAwareString(str_statement))
+        if rule:
+          rules.extend(AnnotationsFromDenotations(rule))
+
+      if rule:
+        rules.append(rule)
+    # Eliminate explicit disjunctions via DNF reduction.
+    with profiling.Phase('dnf rewrite'):
+      rules = DisjunctiveNormalForm.Rewrite(rules)
+    # Multibody aggregation uses concise aggregation structure.
+    rules = MultiBodyAggregation.Rewrite(rules)
+    # Concise structure is no longer needed, rewriting into expressions.
+    rules = AggergationsAsExpressions.Rewrite(rules)
+    return rules, imported_predicates
+
+
 def ParseFile(s, this_file_name=None, parsed_imports=None, import_chain=None,
-              import_root=None):
-  """Parsing logica.Logica."""
+              import_root=None, parsed_statements=None):
+  """Parsing logica.Logica.
+
+  If parsed_statements, as returned by ParseStatements, are given, then they
+  are used instead of parsing s.
+  """
   if (this_file_name or 'main') == 'main':
     # Enable experimental features if requested.
     EnactIncantations(s)
-  s = HeritageAwareString(RemoveComments(HeritageAwareString(s)))
   parsed_imports = parsed_imports or {}
   this_file_name = this_file_name or 'main'
   import_chain = import_chain or []
   import_chain = import_chain + [this_file_name]
   import_root = import_root or ''
-  str_statements = Split(s, ';')
-  rules = []
-  imported_predicates = []
+  if parsed_statements is None:
+    rules, imported_predicates = ParseStatements(
+        s, parsed_imports, import_chain, import_root)
+  else:
+    rules, imported_predicates = parsed_statements
+    for s in imported_predicates:
+      ParseImport(s['file'], parsed_imports, import_chain, import_root)
   predicates_created_by_import = {}
-  for str_statement in str_statements:
-    if not str_statement:
-      continue
-    if str_statement.startswith('import '):
-      import_str = str_statement[len('import '):]
-      file_import_str, import_predicate, synonym = SplitImport(import_str)
-      ParseImport(file_import_str, parsed_imports, import_chain,
-                  import_root)
-      imported_predicates.append({
-          'file': file_import_str, 'predicate_name': import_predicate,
-          'synonym': synonym})
-      if file_import_str not in predicates_created_by_import:
-        predicates_created_by_import[file_import_str] = (
-            DefinedPredicates(parsed_imports[file_import_str]['rule']) |
-            MadePredicates(parsed_imports[file_import_str]['rule']))
-      continue
-
-    rule = None
-    annotation_and_rule = ParseFunctionRule(HeritageAwareString(str_statement))
-    if annotation_and_rule:
-      annotation, rule = annotation_and_rule
-      rules.append(annotation)
-    if not rule:
-      rule = ParseFunctorRule(HeritageAwareString(str_statement))
-    if not rule:
-      rule = ParseRule(HeritageAwareString(str_statement))
-      if rule:
-        rules.extend(AnnotationsFromDenotations(rule))
-
-    if rule:
-      rules.append(rule)
-  # Eliminate explicit disjunctions via DNF reduction.
-  rules = DisjunctiveNormalForm.Rewrite(rules)
-  # Multibody aggregation uses concise aggregation structure.
-  rules = MultiBodyAggregation.Rewrite(rules)
-  # Concise structure is no longer needed, rewriting into expressions.
-  rules = AggergationsAsExpressions.Rewrite(rules)
+  for s in imported_predicates:
+    if s['file'] not in predicates_created_by_import:
+      predicates_created_by_import[s['file']] = (
+          DefinedPredicates(parsed_imports[s['file']]['rule']) |
+          MadePredicates(parsed_imports[s['file']]['rule']))
 
   # Building a unique among already parsed imports prefix.
   if this_file_name == 'main':
@@ -1845,9 +2093,10 @@ def ParseFile(s, this_file_name=None, parsed_imports=None, import_chain=None,
 
   # Renaming predicates, adding file prefix to them.
   if this_file_name != 'main':
-    for p in DefinedPredicates(rules) | MadePredicates(rules):
-      if p[0] != '@' and p != '++?':
-        RenamePredicate(rules, p, this_file_prefix + p)
+    RenamePredicates(rules, {
+        p: this_file_prefix + p
+        for p in DefinedPredicates(rules) | MadePredicates(rules)
+        if p[0] != '@' and p != '++?'})
   for s in imported_predicates:
     imported_predicate_file = s['file']
     import_prefix = parsed_imports[
@@ -1882,7 +2131,7 @@ def ParseFile(s, this_file_name=None, parsed_imports=None, import_chain=None,
   # If this is main file, then it's time to assemble all the rules together.
   if this_file_name == 'main':
     defined_predicates = DefinedPredicates(rules)
-    main_defined_predicates = copy.deepcopy(defined_predicates)
+    main_defined_predicates = set(defined_predicates)
     for i in parsed_imports.values():
       new_predicates = DefinedPredicates(i['rule'])
       if any(p[0] != '@' for p in defined_predicates & new_predicates):
@@ -0,0 +1,85 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unitests for parse.py."""
+
+import unittest
+
+from parser_py import parse
+
+
+# Buffers with strings, triple quotes, comments and unmatched brackets.
+BUFFERS = [
+    'Q(x: "a(b", y: [1, {z: 2}]) :- P(x:), x != "]";',
+    'Q(s: """a "quoted" (text""", t: "") :- T(s: """""");',
+    "Q(x: 'it''s (', y: `table[0]`) :- P(x:) # Comment (\n, y > 1;",
+    'Q(x:) :- /* skip ) here */ P(x: [1, 2)), x > 0);',
+    'Q(x: "line\nbreak") :- P(x:);',
+    'A(x:)) :- B(x: (1 + 2]);',
+]
+
+
+def Substrings(text):
+  s = parse.HeritageAwareString(text)
+  for start in range(len(text)):
+    for stop in range(start + 1, len(text) + 1):
+      yield s[start:stop]
+
+
+class ParseTest(unittest.TestCase):
+  def test_TraverseMatchesTraverseText(self):
+    for text in BUFFERS:
+      with parse.TraversalTablesScope():
+        for s in Substrings(text):
+          self.assertEqual(list(parse.Traverse(s)),
+                           list(parse.TraverseText(str(s))),
+                           'Traversing %r of %r.' % (str(s), text))
+
+  def test_IsWholeMatchesTraverseText(self):
+    for text in BUFFERS:
+      with parse.TraversalTablesScope():
+        for s in Substrings(text):
+          self.assertEqual(parse.IsWhole(s), parse.IsWhole(str(s)),
+                           'Checking %r of %r.' % (str(s), text))
+
+  def test_TablesAreKeptOnlyWithinScope(self):
+    text = BUFFERS[0]
+    self.assertIsNone(parse.GetTraversalTable(text))
+    with parse.TraversalTablesScope():
+      table = parse.GetTraversalTable(text)
+      with parse.TraversalTablesScope():
+        self.assertIsNot(parse.GetTraversalTable(text), table)
+      self.assertIs(parse.GetTraversalTable(text), table)
+    self.assertIsNone(parse.GetTraversalTable(text))
+
+  def test_ParsingExceptionHighlightsSpan(self):
+    # Pieces of the statement before, at and after the error.
+    cases = [
+        ('P(x: 1);\nQ(x:) :- P(x: y + );\nR(z: 2);',
+         ['Q(x:) :- P(x: y +', '', ' )']),
+        ('Q(x:) :- P(x: "a", y: 1 +* 2);',
+         ['Q(x:) :- P(x: "a", y: 1 +', '', '* 2)']),
+        ('Q(x: [1, 2}) :- P(x:);', ['Q(x: [1, 2', '}', ') :- P(x:);']),
+        ('Q(x:) :- P(x: """a""" ++ 1 ());',
+         ['Q(x:) :- P(x: """a""" ++ ', '1 ()', ')']),
+    ]
+    for program, pieces in cases:
+      with self.assertRaises(parse.ParsingException) as context:
+        parse.ParseFile(program)
+      self.assertEqual(list(context.exception.location.Pieces()), pieces)
+
+if __name__ == '__main__':
+  unittest.main()
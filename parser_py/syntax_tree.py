@@ -0,0 +1,68 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Utilities for syntax trees of Logica programs.
+
+Syntax trees, as produced by the parser, are nested dictionaries and lists
+with immutable leaves: strings, numbers, booleans and None.
+"""
+
+import copy
+
+IMMUTABLE_LEAF_TYPES = (str, int, float, bool, type(None))
+
+
+def CopyTree(tree, memo=None):
+  """Returns a copy of a syntax tree, sharing its immutable leaves.
+
+  This is equivalent to copy.deepcopy of the tree, including preservation
+  of subtrees that are shared within the tree, but it is many times faster
+  as it does not go through the generic copying protocol for every node.
+  Values that are not dictionaries, lists or immutable leaves are copied
+  with copy.deepcopy.
+
+  Args:
+    tree: Syntax tree, or any of its subtrees.
+    memo: Dictionary of already copied containers, keyed by their id.
+  Returns:
+    Copy of the tree.
+  """
+  if memo is None:
+    memo = {}
+  if isinstance(tree, IMMUTABLE_LEAF_TYPES):
+    return tree
+  tree_id = id(tree)
+  if tree_id in memo:
+    return memo[tree_id]
+  tree_type = type(tree)
+  if tree_type is dict:
+    result = {}
+    memo[tree_id] = result
+    for k, v in tree.items():
+      result[k] = (v if isinstance(v, IMMUTABLE_LEAF_TYPES) else
+                   CopyTree(v, memo))
+  elif tree_type is list:
+    result = []
+    memo[tree_id] = result
+    for v in tree:
+      result.append(v if isinstance(v, IMMUTABLE_LEAF_TYPES) else
+                    CopyTree(v, memo))
+  elif tree_type is tuple:
+    result = tuple(CopyTree(v, memo) for v in tree)
+    memo[tree_id] = result
+  else:
+    result = copy.deepcopy(tree, memo)
+  return result
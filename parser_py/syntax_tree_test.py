@@ -0,0 +1,47 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unitests for syntax_tree.py."""
+
+import copy
+import unittest
+
+from parser_py import parse
+from parser_py import syntax_tree
+
+
+class SyntaxTreeTest(unittest.TestCase):
+  def test_CopyTreeIsIndependentCopy(self):
+    rules = parse.ParseFile(
+        'Q(x) :- T(x), x > 1;\nR(y:, s? += x) distinct :- Q(x), y = [x];'
+    )['rule']
+    copied = syntax_tree.CopyTree(rules)
+    self.assertEqual(copied, rules)
+    self.assertEqual(copied, copy.deepcopy(rules))
+    copied[0]['head']['predicate_name'] = 'Changed'
+    self.assertEqual(rules[0]['head']['predicate_name'], 'Q')
+
+  def test_CopyTreePreservesSharing(self):
+    shared = {'literal': {'the_number': {'number': '1'}}}
+    tree = {'a': [shared, shared], 'b': (shared,)}
+    copied = syntax_tree.CopyTree(tree)
+    self.assertIsNot(copied['a'][0], shared)
+    self.assertIs(copied['a'][0], copied['a'][1])
+    self.assertIs(copied['b'][0], copied['a'][0])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -24,18 +24,52 @@ from integration_tests.import_tests import run_tests as import_tests
 from type_inference.research.integration_tests import run_tests as type_inference_tests
 
 
-if 'golden_run' in sys.argv:
-  logica_test.TestManager.SetGoldenRun(True)
+USAGE = ('Usage: python3 run_all_tests.py [golden_run] [announce_tests] '
+         '[test_only=TEST,...] [-j JOBS] [report=FILE]')
 
-if 'announce_tests' in sys.argv:
-  logica_test.TestManager.SetAnnounceTests(True)
 
-for a in sys.argv:
-  if a.startswith('test_only='):
-    logica_test.TestManager.SetRunOnlyTests(a.split('=')[1].split(','))
+def Jobs(argv, i):
+  """Number of parallel jobs given by -j flag at position i, as -j 8 or -j8."""
+  jobs = argv[i][2:]
+  if not jobs and i + 1 < len(argv):
+    jobs = argv[i + 1]
+  if not jobs.isdigit() or int(jobs) < 1:
+    print('Flag -j requires a positive number of jobs, got: %s' %
+          (jobs or 'nothing'), file=sys.stderr)
+    print(USAGE, file=sys.stderr)
+    sys.exit(2)
+  return int(jobs)
 
-logica_test.PrintHeader()
 
-type_inference_tests.RunAll()
-integration_tests.RunAll()
-import_tests.RunAll()
+def main(argv):
+  """Runs the tests, see flags below."""
+  if 'golden_run' in argv:
+    logica_test.TestManager.SetGoldenRun(True)
+
+  if 'announce_tests' in argv:
+    logica_test.TestManager.SetAnnounceTests(True)
+
+  report = None
+  for i, a in enumerate(argv):
+    if a.startswith('test_only='):
+      logica_test.TestManager.SetRunOnlyTests(a.split('=')[1].split(','))
+    # Number of tests to run in parallel, as -j 8 or -j8.
+    if a.startswith('-j'):
+      logica_test.TestManager.SetParallelism(Jobs(argv, i))
+    # Timing report, JUnit XML if it ends with .xml, JSON otherwise.
+    if a.startswith('report='):
+      report = a.split('=', 1)[1]
+
+  logica_test.PrintHeader()
+
+  type_inference_tests.RunAll()
+  integration_tests.RunAll()
+  import_tests.RunAll()
+  logica_test.TestManager.RunScheduledTests()
+
+  if report:
+    logica_test.TestManager.WriteReport(report)
+
+
+if __name__ == '__main__':
+  main(sys.argv)
@@ -16,14 +16,18 @@
 
 # Utility to run pipeline in terminal with ASCII art showing progress.
 
+import copy
 import json
 import os
 import sys
 
 if not __package__ or '.' not in __package__:
   from common import concertina_lib
+  from common import connection_pool
   from compiler import universe
   from parser_py import parse
+  from common import clickhouse_logica
+  from common import mssql_logica
   from common import psql_logica
   from common import sqlite3_logica
   from common import duckdb_logica
@@ -32,8 +36,11 @@ if not __package__ or '.' not in __package__:
   from type_inference.research import infer
 else:
   from ..common import concertina_lib
+  from ..common import connection_pool
   from ..compiler import universe
   from ..parser_py import parse
+  from ..common import clickhouse_logica
+  from ..common import mssql_logica
   from ..common import psql_logica
   from ..common import sqlite3_logica
   from ..common import duckdb_logica
@@ -45,7 +52,8 @@ else:
 class SqlRunner(object):
   def __init__(self, engine, logic_program=None):
     self.engine = engine
-    assert engine in ['sqlite', 'bigquery', 'psql', 'duckdb']
+    assert engine in ['sqlite', 'bigquery', 'psql', 'duckdb', 'mssql',
+                      'clickhouse']
     if engine == 'sqlite':
       self.connection = sqlite3_logica.SqliteConnect()
     else:
@@ -60,12 +68,58 @@ class SqlRunner(object):
     else:
       credentials, project = None, None
     if engine == 'psql':
-      self.connection = psql_logica.ConnectToPostgres('environment')
+      self.connection_pool = psql_logica.ConnectionPool('environment')
+    elif engine == 'mssql':
+      self.connection_pool = mssql_logica.ConnectionPool('environment')
+    elif engine == 'clickhouse':
+      if os.environ.get('LOGICA_CLICKHOUSE_CONNECTION'):
+        self.connection_pool = clickhouse_logica.ConnectionPool('environment')
+      else:
+        a = logic_program.annotations.annotations.get(
+            '@Engine', {}).get('clickhouse', {})
+        self.connection_pool = clickhouse_logica.ConnectionPool(
+            'annotation', annotation_params=a)
+    else:
+      self.connection_pool = None
+    if self.connection_pool:
+      # Runner holds a connection from the pool until it's closed, so that
+      # the preamble it runs applies to all of its queries.
+      self.connection = self.connection_pool.Borrow()
     if engine == 'duckdb':
       self.connection = duckdb_logica.GetConnection(logic_program)
     self.bq_credentials = credentials
     self.bq_project = project
   
+  def WorkerRunner(self):
+    """Returns runner with own connection to the database, for a worker.
+
+    Returns None if the database can't be shared with other connections, or
+    if the pool has no connection left for the worker.
+    """
+    if self.engine == 'sqlite':
+      # In-memory database is private to its connection.
+      return None
+    worker_runner = copy.copy(self)
+    if self.engine == 'duckdb':
+      # Cursor of DuckDB is a new connection to the same database.
+      worker_runner.connection = self.connection.cursor()
+    if self.connection_pool:
+      # Worker holds a connection of its own for the whole run. Not waiting
+      # for one, as the connections lent out are held until the run is over.
+      try:
+        worker_runner.connection = self.connection_pool.Borrow(timeout=0)
+      except connection_pool.ConnectionPoolTimeout:
+        return None
+    return worker_runner
+
+  def Close(self):
+    """Gives the connection of the runner back to the pool."""
+    if self.connection_pool and self.connection is not None:
+      self.connection_pool.Return(
+          self.connection,
+          broken=not self.connection_pool.IsHealthy(self.connection))
+      self.connection = None
+
   # TODO: Sqlite runner should not be accepting an engine.
   def __call__(self, sql, engine, is_final):
     return RunSQL(sql, engine, self.connection, is_final,
@@ -85,12 +139,26 @@ def RunSQL(sql, engine, connection=None, is_final=False,
     return list(df.columns), [list(r) for _, r in df.iterrows()]
   elif engine == 'psql':
     if is_final:
-      cursor = psql_logica.PostgresExecute(sql, connection)
-      rows = [list(map(psql_logica.DigestPsqlType, row))
-              for row in cursor.fetchall()]
-      return [d[0] for d in cursor.description], rows
+      stream = psql_logica.CursorStream(
+          psql_logica.PostgresExecute(sql, connection))
+      return stream.header, stream.Fetchall()
     else:
       psql_logica.PostgresExecute(sql, connection)
+  elif engine == 'mssql':
+    if is_final:
+      stream = mssql_logica.CursorStream(
+          mssql_logica.MSSQLExecute(sql, connection))
+      return stream.header, stream.Fetchall()
+    else:
+      mssql_logica.MSSQLExecute(sql, connection).close()
+  elif engine == 'clickhouse':
+    # ClickHouse runs one statement at a time.
+    statements = [s for s in parse.SplitRaw(sql, ';') if s.strip()]
+    for statement in statements[:-1] if is_final else statements:
+      clickhouse_logica.ClickHouseExecute(statement, connection)
+    if is_final:
+      stream = clickhouse_logica.ClickHouseStream(statements[-1], connection)
+      return stream.header, stream.Fetchall()
   elif engine == 'sqlite':
     try:
       if is_final:
@@ -119,8 +187,14 @@ def RunSQL(sql, engine, connection=None, is_final=False,
                     'for now.')
 
 
+def MaxParallelism():
+  """Number of predicates to run at once, from LOGICA_MAX_PARALLELISM."""
+  return int(os.environ.get('LOGICA_MAX_PARALLELISM') or 1)
+
+
 def Run(filename, predicate_name,
-        output_format='artistic_table', display_mode='terminal'):
+        output_format='artistic_table', display_mode='terminal',
+        max_parallelism=None):
   try:
     rules = parse.ParseFile(open(filename, encoding='utf-8').read().replace('\r\n', '\n').replace('\r', '\n'))['rule']
   except parse.ParsingException as parsing_exception:
@@ -129,15 +203,21 @@ def Run(filename, predicate_name,
 
 
   try:
-    program = universe.LogicaProgram(rules)
+    program = universe.LogicaProgram(rules,
+                                     required_predicates=[predicate_name])
     engine = program.annotations.Engine()
 
     # This is needed to build the program execution.
     unused_sql = program.FormattedPredicateSql(predicate_name)
 
-    (header, rows) = concertina_lib.ExecuteLogicaProgram(
-        [program.execution], SqlRunner(engine, logic_program=program), engine,
-        display_mode=display_mode)[predicate_name]
+    sql_runner = SqlRunner(engine, logic_program=program)
+    try:
+      (header, rows) = concertina_lib.ExecuteLogicaProgram(
+          [program.execution], sql_runner, engine,
+          display_mode=display_mode,
+          max_parallelism=max_parallelism or MaxParallelism())[predicate_name]
+    finally:
+      sql_runner.Close()
   except rule_translate.RuleCompileException as rule_compilation_exception:
     rule_compilation_exception.ShowMessage()
     sys.exit(1)
@@ -158,7 +238,8 @@ def Run(filename, predicate_name,
 
 
 def RunMany(filename, predicate_names,
-            output_format='artistic_table', display_mode='terminal'):
+            output_format='artistic_table', display_mode='terminal',
+            max_parallelism=None):
   try:
     rules = parse.ParseFile(open(filename, encoding='utf-8').read().replace('\r\n', '\n').replace('\r', '\n'))['rule']
   except parse.ParsingException as parsing_exception:
@@ -166,7 +247,8 @@ def RunMany(filename, predicate_names,
     sys.exit(1)
 
   try:
-    program = universe.LogicaProgram(rules)
+    program = universe.LogicaProgram(rules,
+                                     required_predicates=predicate_names)
     engine = program.annotations.Engine()
 
     executions = []
@@ -175,9 +257,14 @@ def RunMany(filename, predicate_names,
       unused_sql = program.FormattedPredicateSql(predicate_name)
       executions.append(program.execution)
 
-    results = concertina_lib.ExecuteLogicaProgram(
-        executions, SqlRunner(engine, logic_program=program), engine,
-        display_mode=display_mode)
+    sql_runner = SqlRunner(engine, logic_program=program)
+    try:
+      results = concertina_lib.ExecuteLogicaProgram(
+          executions, sql_runner, engine,
+          display_mode=display_mode,
+          max_parallelism=max_parallelism or MaxParallelism())
+    finally:
+      sql_runner.Close()
   except rule_translate.RuleCompileException as rule_compilation_exception:
     rule_compilation_exception.ShowMessage()
     sys.exit(1)
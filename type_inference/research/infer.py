@@ -15,7 +15,10 @@
 # limitations under the License.
 
 import hashlib
+import heapq
 import json
+import os
+import pickle
 import sys
 
 if '.' not in __package__:
@@ -30,6 +33,9 @@ else:
   except:
     from common import color
 
+# Bump when the layout of cached signatures changes.
+SIGNATURE_CACHE_FORMAT_VERSION = 1
+
 
 class ContextualizedError:
   def __init__(self):
@@ -122,16 +128,6 @@ def Walk(node, act):
         Walk(node[k], act)
 
 
-def ActMindingPodLiterals(node):
-  for e in ExpressionsIterator(node):
-    if 'literal' in e:
-      if 'the_number' in e['literal']:
-        reference_algebra.Unify(e['type']['the_type'], reference_algebra.TypeReference('Num'))
-      if 'the_string' in e['literal']:
-        reference_algebra.Unify(e['type']['the_type'], reference_algebra.TypeReference('Str'))
-      if 'the_bool' in e['literal']:
-        reference_algebra.Unify(e['type']['the_type'], reference_algebra.TypeReference('Bool'))
-
 def ActClearingTypes(node):
   if 'type' in node:
     del node['type']
@@ -150,7 +146,18 @@ def ActRecallingTypes(node):
     )
 
 class TypesInferenceEngine:
-  def __init__(self, parsed_rules, dialect):
+  """Infers types of rules, component by component in dependency order.
+
+  Rules of a strongly connected component of predicates are inferred
+  together, after the components that they call. Types of a component
+  depend only on its rules and on signatures of the predicates it calls,
+  so if signature_cache is given, signatures and types of expressions of
+  components are stored in it keyed by a hash of their rules and of the
+  keys of the components they call. A component found in the cache, e.g.
+  one from an imported module or the dialect library, is not inferred
+  again.
+  """
+  def __init__(self, parsed_rules, dialect, signature_cache=None):
     self.parsed_rules = parsed_rules
     self.predicate_argumets_types = {}
     self.dependencies = BuildDependencies(self.parsed_rules)
@@ -160,9 +167,13 @@ class TypesInferenceEngine:
     self.typing_preamble = None
     self.collector = None
     self.dialect = dialect
+    self.signature_cache = signature_cache
+    # Predicate -> cache key of its component.
+    self.component_key = {}
 
-  def CollectTypes(self):
-    collector = TypeCollector(self.parsed_rules, self.dialect)
+  def CollectTypes(self, typed_nodes=None):
+    collector = TypeCollector(self.parsed_rules, self.dialect,
+                              typed_nodes=typed_nodes)
     collector.CollectTypes()
     self.typing_preamble = collector.typing_preamble
     self.collector = collector
@@ -199,17 +210,83 @@ class TypesInferenceEngine:
         value_type)
 
 
-  def InferTypes(self):
+  def Components(self):
+    """Returns lists of rules of components, callees first."""
+    rules_of = {}
     for rule in self.parsed_rules:
-      if rule['head']['predicate_name'][0] == '@':
-        continue
-      t = TypeInferenceForRule(rule, self.predicate_signature)
-      t.PerformInference()
-      self.UpdateTypes(rule)
+      p = rule['head']['predicate_name']
+      if p[0] != '@':
+        rules_of.setdefault(p, []).append(rule)
+    components = ComponentsInDependencyOrder(list(rules_of),
+                                             self.dependencies)
+    return [[r for p in component for r in rules_of[p]]
+            for component in components]
+
+  def ComponentKey(self, rules):
+    """Hash of rules of a component and of the components it calls."""
+    predicates = {r['head']['predicate_name'] for r in rules}
+    callees = sorted(set(
+        d for p in predicates for d in self.dependencies[p]) - predicates)
+    callee_keys = [(d, self.component_key.get(d,
+                                              d in self.predicate_signature))
+                   for d in callees]
+    h = hashlib.sha256(InferenceFingerprint().encode())
+    h.update(json.dumps([rules, callee_keys], default=str).encode())
+    return h.hexdigest()
+
+  def InferComponent(self, rules):
+    """Infers types of rules of the component, returns their typed nodes."""
+    key = None
+    if self.signature_cache is not None:
+      key = self.ComponentKey(rules)
+    cached = key and self.signature_cache.Lookup(key)
+    if cached:
+      cached = pickle.loads(cached)
+      typed_nodes = [TypedNodes(rule) for rule in rules]
+    else:
+      inferences = []
+      for rule in rules:
+        t = TypeInferenceForRule(rule, self.predicate_signature)
+        t.PerformInference()
+        self.UpdateTypes(rule)
+        inferences.append(t)
+      typed_nodes = [[node for node in t.index.typed] for t in inferences]
+    predicates = []
+    for rule in rules:
+      if rule['head']['predicate_name'] not in predicates:
+        predicates.append(rule['head']['predicate_name'])
+
+    if cached:
+      for p in predicates:
+        self.predicate_signature[p] = cached['signatures'][p]
+      for nodes, types in zip(typed_nodes, cached['types']):
+        for node, t in zip(nodes, types):
+          node['type'] = t
+    else:
+      for t in inferences:
+        t.ConcretizeTypes()
+      if key:
+        entry = {
+            'signatures': {p: self.predicate_signature[p]
+                           for p in predicates},
+            'types': [[node['type'] for node in nodes]
+                      for nodes in typed_nodes]}
+        # Pickled entries are compact and are copied when unpickled.
+        self.signature_cache.Store(
+            key, pickle.dumps(entry, pickle.HIGHEST_PROTOCOL))
+    for p in predicates:
+      self.component_key[p] = key
+    return typed_nodes
 
-    for rule in self.parsed_rules:
-      Walk(rule, ConcretizeTypes)
-    self.CollectTypes()
+  def InferTypes(self):
+    typed_nodes_of = {}
+    for rules in self.Components():
+      for rule, typed_nodes in zip(rules, self.InferComponent(rules)):
+        typed_nodes_of[id(rule)] = typed_nodes
+    # Types are collected in the order of rules, as before components.
+    self.CollectTypes(
+        [node for rule in self.parsed_rules
+         for node in typed_nodes_of.get(id(rule), [])])
 
   def ShowPredicateTypes(self):
     result_lines = []
@@ -240,6 +317,116 @@ def BuildDependencies(rules):
     result[p] = list(set(sorted(set(ds) - set([p]))) | set(result.get(p, [])))
   return result
 
+def ComponentsInDependencyOrder(predicates, dependencies):
+  """Returns strongly connected components of predicates, callees first.
+
+  Components that do not depend on each other are ordered by the position
+  of their first predicate in the given list.
+  """
+  position = {p: i for i, p in enumerate(predicates)}
+  def Callees(p):
+    return [d for d in dependencies.get(p, []) if d in position]
+  # Iterative Tarjan's algorithm.
+  index = {}
+  lowlink = {}
+  stack = []
+  on_stack = set()
+  component_of = {}
+  components = []
+  for root in predicates:
+    if root in index:
+      continue
+    index[root] = lowlink[root] = len(index)
+    stack.append(root)
+    on_stack.add(root)
+    work = [(root, iter(Callees(root)))]
+    while work:
+      v, callees = work[-1]
+      for w in callees:
+        if w not in index:
+          index[w] = lowlink[w] = len(index)
+          stack.append(w)
+          on_stack.add(w)
+          work.append((w, iter(Callees(w))))
+          break
+        if w in on_stack:
+          lowlink[v] = min(lowlink[v], index[w])
+      else:
+        work.pop()
+        if work:
+          u = work[-1][0]
+          lowlink[u] = min(lowlink[u], lowlink[v])
+        if lowlink[v] == index[v]:
+          component = []
+          while True:
+            w = stack.pop()
+            on_stack.remove(w)
+            component_of[w] = len(components)
+            component.append(w)
+            if w == v:
+              break
+          components.append(sorted(component, key=position.get))
+  # Topological order of components, preferring earlier positions.
+  callers_of = [set() for _ in components]
+  pending_callees = [0] * len(components)
+  for i, component in enumerate(components):
+    callees = {component_of[d] for p in component for d in Callees(p)} - {i}
+    pending_callees[i] = len(callees)
+    for c in callees:
+      callers_of[c].add(i)
+  ready = [(position[c[0]], i) for i, c in enumerate(components)
+           if not pending_callees[i]]
+  heapq.heapify(ready)
+  result = []
+  while ready:
+    _, i = heapq.heappop(ready)
+    result.append(components[i])
+    for caller in callers_of[i]:
+      pending_callees[caller] -= 1
+      if not pending_callees[caller]:
+        heapq.heappush(ready, (position[components[caller][0]], caller))
+  return result
+
+
+def TypedNodes(rule):
+  """Returns nodes that InitTypes gives types to, in the order of its index.
+
+  The nodes are found without giving them types, so that types restored
+  from the signature cache can be put on them.
+  """
+  result = []
+  expressions = set()
+  stack = [rule]
+  while stack:
+    node = stack.pop()
+    if isinstance(node, list):
+      stack.extend(reversed(node))
+    elif isinstance(node, dict):
+      for e in ExpressionsIterator(node):
+        expressions.add(id(e))
+      if 'variable' in node or id(node) in expressions:
+        result.append(node)
+      stack.extend(reversed([v for k, v in node.items() if k != 'type']))
+  return result
+
+
+_INFERENCE_FINGERPRINT = None
+
+
+def InferenceFingerprint():
+  """Hash of type inference sources, so that upgrades invalidate caches."""
+  global _INFERENCE_FINGERPRINT
+  if _INFERENCE_FINGERPRINT is None:
+    directory = os.path.dirname(os.path.abspath(__file__))
+    h = hashlib.sha256(str(SIGNATURE_CACHE_FORMAT_VERSION).encode())
+    for filename in sorted(os.listdir(directory)):
+      if filename.endswith('.py'):
+        with open(os.path.join(directory, filename), 'rb') as f:
+          h.update(filename.encode() + b'\0' + f.read())
+    _INFERENCE_FINGERPRINT = h.hexdigest()
+  return _INFERENCE_FINGERPRINT
+
+
 def BuildComplexities(dependencies):
   result = {}
   def GetComplexity(p):
@@ -254,6 +441,74 @@ def BuildComplexities(dependencies):
   return result
 
 
+class RuleIndex:
+  """Typed expressions of a rule by kind, in the order of Walk.
+
+  The index is built in the same traversal that initializes types of
+  expressions, so inference acts on these lists instead of walking the
+  rule once per kind of expression.
+  """
+  def __init__(self):
+    # All nodes with a type.
+    self.typed = []
+    # Pairs of literal expression and its type.
+    self.pod_literals = []
+    # Triples of predicate name, its field values and expression of the
+    # call, which is None for predicates in the body and in the head.
+    self.calls = []
+    self.typing_predicate_literals = []
+    self.record_literals = []
+    self.unifications = []
+    self.subscriptions = []
+    self.list_literals = []
+    self.inclusions = []
+    self.combines = []
+    self.implications = []
+
+  def Add(self, node):
+    """Indexes node, whose expressions have types already."""
+    if 'type' in node:
+      self.typed.append(node)
+      literal = node.get('literal')
+      if literal is not None:
+        if ('the_predicate' in literal and
+            literal['the_predicate']['predicate_name'] in
+            ('Str', 'Num', 'Bool', 'Time')):
+          self.typing_predicate_literals.append(node)
+        if 'the_list' in literal:
+          self.list_literals.append(node)
+      if 'record' in node:
+        self.record_literals.append(node)
+    if 'subscript' in node and 'record' in node['subscript']:
+      self.subscriptions.append(node)
+    if 'combine' in node:
+      self.combines.append(node)
+    if 'implication' in node:
+      self.implications.append(node)
+    for e in ExpressionsIterator(node):
+      if 'literal' in e:
+        if 'the_number' in e['literal']:
+          self.pod_literals.append((e, 'Num'))
+        if 'the_string' in e['literal']:
+          self.pod_literals.append((e, 'Str'))
+        if 'the_bool' in e['literal']:
+          self.pod_literals.append((e, 'Bool'))
+    for e in ExpressionsIterator(node):
+      if 'call' in e:
+        self.calls.append((e['call']['predicate_name'],
+                           e['call']['record']['field_value'], e))
+    if 'predicate' in node:
+      self.calls.append((node['predicate']['predicate_name'],
+                         node['predicate']['record']['field_value'], None))
+    if 'head' in node:
+      self.calls.append((node['head']['predicate_name'],
+                         node['head']['record']['field_value'], None))
+    if 'unification' in node:
+      self.unifications.append(node)
+    if 'inclusion' in node:
+      self.inclusions.append(node)
+
+
 class TypeInferenceForRule:
   def __init__(self, rule, types_of_builtins):
     self.rule = rule
@@ -261,6 +516,7 @@ class TypeInferenceForRule:
     self.type_id_counter = 0
     self.found_error = None
     self.types_of_builtins = types_of_builtins
+    self.index = None
 
   def PerformInference(self):
     self.InitTypes()
@@ -273,132 +529,123 @@ class TypeInferenceForRule:
     self.type_id_counter += 1
     return result
 
-  def ActInitializingTypes(self, node):
-    for e in ExpressionsIterator(node):
-      if 'variable' not in e:  # Variables are convered separately.
-        e['type'] = {
-          'the_type': reference_algebra.TypeReference('Any'), 
-          'type_id': self.GetTypeId()}
-
   def InitTypes(self):
+    """Gives types to expressions and indexes them in one traversal."""
     WalkInitializingVariables(self.rule, self.GetTypeId)
-    Walk(self.rule, self.ActInitializingTypes)
+    self.index = RuleIndex()
+    # Same order as Walk, parents get visited before their expressions.
+    stack = [self.rule]
+    while stack:
+      node = stack.pop()
+      if isinstance(node, list):
+        stack.extend(reversed(node))
+      elif isinstance(node, dict):
+        for e in ExpressionsIterator(node):
+          if 'variable' not in e:  # Variables are convered separately.
+            e['type'] = {
+              'the_type': reference_algebra.TypeReference('Any'),
+              'type_id': self.GetTypeId()}
+        self.index.Add(node)
+        stack.extend(reversed([v for k, v in node.items() if k != 'type']))
 
   def MindPodLiterals(self):
-    Walk(self.rule, ActMindingPodLiterals)
-
-  def ActMindingBuiltinFieldTypes(self, node):
-    def InstillTypes(predicate_name,
-                     field_value, signature, output_value):
-      copier = reference_algebra.TypeStructureCopier()
-      copy = copier.CopyConcreteOrReferenceType
-      if output_value:
-        output_value_type = output_value['type']['the_type']
-        if 'logica_value' in signature:
-          reference_algebra.Unify(
-            output_value_type,
-            copy(signature['logica_value']))
-        else:
-          error_message = (
-            ContextualizedError.BuildNiceMessage(
-              output_value['expression_heritage'].Display(),
-              'Predicate %s is not a function, but was called as such.' %
-                color.Format('{warning}%s{end}') % predicate_name,
-            )
+    for e, pod_type in self.index.pod_literals:
+      reference_algebra.Unify(e['type']['the_type'],
+                              reference_algebra.TypeReference(pod_type))
+
+  def InstillTypes(self, predicate_name, field_value, signature, output_value):
+    copier = reference_algebra.TypeStructureCopier()
+    copy = copier.CopyConcreteOrReferenceType
+    if output_value:
+      output_value_type = output_value['type']['the_type']
+      if 'logica_value' in signature:
+        reference_algebra.Unify(
+          output_value_type,
+          copy(signature['logica_value']))
+      else:
+        error_message = (
+          ContextualizedError.BuildNiceMessage(
+            output_value['expression_heritage'].Display(),
+            'Predicate %s is not a function, but was called as such.' %
+              color.Format('{warning}%s{end}') % predicate_name,
           )
-          error = reference_algebra.BadType(
-            ('VERBATIM:' + error_message,
-            output_value_type.target))
-          output_value_type.target = reference_algebra.TypeReference.To(error)
+        )
+        error = reference_algebra.BadType(
+          ('VERBATIM:' + error_message,
+          output_value_type.target))
+        output_value_type.target = reference_algebra.TypeReference.To(error)
 
-      for fv in field_value:
-        field_name = fv['field']
-        if (field_name not in signature and
-            isinstance(field_name, int) and
-            'col%d' % field_name in signature):
-          field_name = 'col%d' % field_name
-        if field_name in signature:
-          reference_algebra.Unify(
-            fv['value']['expression']['type']['the_type'],
-            copy(signature[field_name]))
-        elif field_name == '*':
-          args = copy(reference_algebra.ClosedRecord(signature))
-          reference_algebra.Unify(
-            fv['value']['expression']['type']['the_type'],
-            reference_algebra.TypeReference.To(args))
-        elif '*' in signature:
-          args = copy(signature['*'])
-          reference_algebra.UnifyRecordField(
-            args, field_name,
-            fv['value']['expression']['type']['the_type'])
-          if isinstance(args.Target(), reference_algebra.BadType):
-            error_message = (
-              ContextualizedError.BuildNiceMessage(
-                fv['value']['expression']['expression_heritage'].Display(),
-                'Predicate %s does not have argument %s, but it was addressed.' %
-                  (color.Format('{warning}%s{end}') % predicate_name,
-                  color.Format('{warning}%s{end}') % fv['field'])
-              )
-            )
-            error = reference_algebra.BadType(
-              ('VERBATIM:' + error_message,
-              fv['value']['expression']['type']['the_type'].target))
-            fv['value']['expression']['type']['the_type'].target = (
-              reference_algebra.TypeReference.To(error))        
-        else:
+    for fv in field_value:
+      field_name = fv['field']
+      if (field_name not in signature and
+          isinstance(field_name, int) and
+          'col%d' % field_name in signature):
+        field_name = 'col%d' % field_name
+      if field_name in signature:
+        reference_algebra.Unify(
+          fv['value']['expression']['type']['the_type'],
+          copy(signature[field_name]))
+      elif field_name == '*':
+        args = copy(reference_algebra.ClosedRecord(signature))
+        reference_algebra.Unify(
+          fv['value']['expression']['type']['the_type'],
+          reference_algebra.TypeReference.To(args))
+      elif '*' in signature:
+        args = copy(signature['*'])
+        reference_algebra.UnifyRecordField(
+          args, field_name,
+          fv['value']['expression']['type']['the_type'])
+        if isinstance(args.Target(), reference_algebra.BadType):
           error_message = (
             ContextualizedError.BuildNiceMessage(
               fv['value']['expression']['expression_heritage'].Display(),
               'Predicate %s does not have argument %s, but it was addressed.' %
                 (color.Format('{warning}%s{end}') % predicate_name,
-                 color.Format('{warning}%s{end}') % fv['field'])
+                color.Format('{warning}%s{end}') % fv['field'])
             )
           )
           error = reference_algebra.BadType(
             ('VERBATIM:' + error_message,
             fv['value']['expression']['type']['the_type'].target))
           fv['value']['expression']['type']['the_type'].target = (
-            reference_algebra.TypeReference.To(error))
-
-    for e in ExpressionsIterator(node):
-      if 'call' in e:
-        p = e['call']['predicate_name']
-        if p in self.types_of_builtins:
-          InstillTypes(p, e['call']['record']['field_value'],
-                       self.types_of_builtins[p], e)
-
-    if 'predicate' in node:
-      p = node['predicate']['predicate_name']
-      if p in self.types_of_builtins:
-        InstillTypes(p, node['predicate']['record']['field_value'],
-                     self.types_of_builtins[p], None)
-
-    if 'head' in node:
-      p = node['head']['predicate_name']
-      if p in self.types_of_builtins:
-        InstillTypes(p, node['head']['record']['field_value'],
-                     self.types_of_builtins[p], None)
-
+            reference_algebra.TypeReference.To(error))        
+      else:
+        error_message = (
+          ContextualizedError.BuildNiceMessage(
+            fv['value']['expression']['expression_heritage'].Display(),
+            'Predicate %s does not have argument %s, but it was addressed.' %
+              (color.Format('{warning}%s{end}') % predicate_name,
+               color.Format('{warning}%s{end}') % fv['field'])
+          )
+        )
+        error = reference_algebra.BadType(
+          ('VERBATIM:' + error_message,
+          fv['value']['expression']['type']['the_type'].target))
+        fv['value']['expression']['type']['the_type'].target = (
+          reference_algebra.TypeReference.To(error))
 
   def MindBuiltinFieldTypes(self):
-    Walk(self.rule, self.ActMindingBuiltinFieldTypes)
+    for p, field_value, output_value in self.index.calls:
+      if p in self.types_of_builtins:
+        self.InstillTypes(p, field_value, self.types_of_builtins[p],
+                          output_value)
 
-  def ActUnifying(self, node):
-    if 'unification' in node:
+  def MindUnifications(self):
+    for node in self.index.unifications:
       left_type = node['unification']['left_hand_side']['type']['the_type']
       right_type = node['unification']['right_hand_side']['type']['the_type']
       reference_algebra.Unify(left_type, right_type)
 
-  def ActUnderstandingSubscription(self, node):
-    if 'subscript' in node and 'record' in node['subscript']:
+  def UnderstandSubscriptions(self):
+    for node in self.index.subscriptions:
       record_type = node['subscript']['record']['type']['the_type']
       field_type = node['type']['the_type']
       field_name = node['subscript']['subscript']['literal']['the_symbol']['symbol']
       reference_algebra.UnifyRecordField(
         record_type, field_name, field_type)
 
-  def ActMindingRecordLiterals(self, node):
-    if 'type' in node and 'record' in node:
+  def MindRecordLiterals(self):
+    for node in self.index.record_literals:
       record_type = node['type']['the_type']
       reference_algebra.Unify(
         record_type,
@@ -409,19 +656,17 @@ class TypeInferenceForRule:
         field_name = fv['field']
         reference_algebra.UnifyRecordField(
           record_type, field_name, field_type)
-        # print('>>>', node)
 
       node['type']['the_type'].CloseRecord()
 
-  def ActMindingTypingPredicateLiterals(self, node):
-    if 'type' in node and 'literal' in node and 'the_predicate' in node['literal']:
+  def MindTypingPredicateLiterals(self):
+    for node in self.index.typing_predicate_literals:
       predicate_name = node['literal']['the_predicate']['predicate_name']
-      if predicate_name in ['Str', 'Num', 'Bool', 'Time']:
-        reference_algebra.Unify(node['type']['the_type'],
-                                reference_algebra.TypeReference(predicate_name))
+      reference_algebra.Unify(node['type']['the_type'],
+                              reference_algebra.TypeReference(predicate_name))
 
-  def ActMindingListLiterals(self, node):
-    if 'type' in node and 'literal' in node and 'the_list' in node['literal']:
+  def MindListLiterals(self):
+    for node in self.index.list_literals:
       list_type = node['type']['the_type']
       for e in node['literal']['the_list']['element']:
         reference_algebra.UnifyListElement(
@@ -430,16 +675,16 @@ class TypeInferenceForRule:
         reference_algebra.UnifyListElement(
           list_type, reference_algebra.TypeReference('Any'))
 
-  def ActMindingInclusion(self, node):
-    if 'inclusion' in node:
+  def MindInclusions(self):
+    for node in self.index.inclusions:
       list_type = node['inclusion']['list']['type']['the_type']
       element_type = node['inclusion']['element']['type']['the_type']
       reference_algebra.UnifyListElement(
         list_type, element_type
       )
 
-  def ActMindingCombine(self, node):
-    if 'combine' in node:
+  def MindCombines(self):
+    for node in self.index.combines:
       field_value = node['combine']['head']['record']['field_value']
       [logica_value] = [fv['value']
                         for fv in field_value
@@ -449,8 +694,8 @@ class TypeInferenceForRule:
         logica_value['aggregation']['expression']['type']['the_type']
       )
 
-  def ActMindingImplications(self, node):
-    if 'implication' in node:
+  def MindImplications(self):
+    for node in self.index.implications:
       for if_then in node['implication']['if_then']:
         reference_algebra.Unify(
           node['type']['the_type'],
@@ -462,14 +707,18 @@ class TypeInferenceForRule:
       )
 
   def IterateInference(self):
-    Walk(self.rule, self.ActMindingTypingPredicateLiterals)
-    Walk(self.rule, self.ActMindingRecordLiterals)
-    Walk(self.rule, self.ActUnifying)
-    Walk(self.rule, self.ActUnderstandingSubscription)
-    Walk(self.rule, self.ActMindingListLiterals)
-    Walk(self.rule, self.ActMindingInclusion)
-    Walk(self.rule, self.ActMindingCombine)
-    Walk(self.rule, self.ActMindingImplications)
+    self.MindTypingPredicateLiterals()
+    self.MindRecordLiterals()
+    self.MindUnifications()
+    self.UnderstandSubscriptions()
+    self.MindListLiterals()
+    self.MindInclusions()
+    self.MindCombines()
+    self.MindImplications()
+
+  def ConcretizeTypes(self):
+    for node in self.index.typed:
+      ConcretizeTypes(node)
 
 def RenderPredicateSignature(predicate_name, signature):
   def FieldValue(f, v):
@@ -508,8 +757,9 @@ class TypeInferenceForStructure:
     inferencer.PerformInference()
     Walk(quazy_rule, ActRecallingTypes)
 
-    Walk(quazy_rule, ConcretizeTypes)
-    collector = TypeCollector([quazy_rule], self.dialect)
+    inferencer.ConcretizeTypes()
+    collector = TypeCollector([quazy_rule], self.dialect,
+                              typed_nodes=inferencer.index.typed)
     collector.CollectTypes()
     self.collector = collector
 
@@ -664,8 +914,10 @@ def RecordTypeName(type_render):
   return 'logicarecord%d' % (Fingerprint(type_render) % 1000000000)
 
 class TypeCollector:
-  def __init__(self, parsed_rules, dialect):
+  def __init__(self, parsed_rules, dialect, typed_nodes=None):
     self.parsed_rules = parsed_rules
+    # Nodes with types of the rules in the order of Walk, if known.
+    self.typed_nodes = typed_nodes
     self.type_map = {}
     self.psql_struct_type_name = {}
     self.psql_type_definition = {}
@@ -691,7 +943,11 @@ class TypeCollector:
         node['type']['element_type_name'] = self.PsqlType(e)
 
   def CollectTypes(self):
-    Walk(self.parsed_rules, self.ActPopulatingTypeMap)
+    if self.typed_nodes is None:
+      Walk(self.parsed_rules, self.ActPopulatingTypeMap)
+    else:
+      for node in self.typed_nodes:
+        self.ActPopulatingTypeMap(node)
     for t in self.type_map:
       the_type = self.type_map[t]
       if isinstance(the_type, dict):
@@ -774,4 +1030,9 @@ def ArgumentNames(signature):
       result.append('col%d' % v)
     else:
       result.append(v)
-  return result
\ No newline at end of file
+  return result
+
+def ColumnTypes(signature):
+  """Returns concrete types of columns of a predicate, keyed by column name."""
+  return {name: reference_algebra.VeryConcreteType(t)
+          for name, t in zip(ArgumentNames(signature), signature.values())}
@@ -0,0 +1,76 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unitests for infer.py."""
+
+import json
+import unittest
+
+from parser_py import import_cache
+from parser_py import parse
+from type_inference.research import infer
+
+
+PROGRAM = '''
+E(a: 1, b: 2);
+T(a:, b:) :- E(a:, b:);
+T(a:, b:) :- T(a:, b: c), E(a: c, b:);
+Q(x: a + 1, y: "a") :- T(a:);
+'''
+
+
+def Infer(program, signature_cache=None):
+  rules = parse.ParseFile(program)['rule']
+  engine = infer.TypesInferenceEngine(rules, 'psql',
+                                      signature_cache=signature_cache)
+  engine.InferTypes()
+  return rules, engine.ShowPredicateTypes()
+
+
+class InferTest(unittest.TestCase):
+  def test_ComponentsInDependencyOrder(self):
+    dependencies = {'Q': ['T'], 'T': ['E', 'S'], 'S': ['T'], 'E': []}
+    self.assertEqual(
+        infer.ComponentsInDependencyOrder(['Q', 'S', 'T', 'E'], dependencies),
+        [['E'], ['S', 'T'], ['Q']])
+
+  def test_IndependentComponentsKeepOrder(self):
+    self.assertEqual(
+        infer.ComponentsInDependencyOrder(['B', 'A', 'C'], {}),
+        [['B'], ['A'], ['C']])
+
+  def test_CachedSignaturesAreReused(self):
+    cache = import_cache.ImportCache()
+    expected_rules, expected_signatures = Infer(PROGRAM)
+    for _ in range(2):
+      rules, signatures = Infer(PROGRAM, signature_cache=cache)
+      self.assertEqual(signatures, expected_signatures)
+      self.assertEqual(json.dumps(rules, sort_keys=True, default=str),
+                       json.dumps(expected_rules, sort_keys=True, default=str))
+    self.assertEqual(cache.Stats()['hits'], 3)
+    self.assertEqual(cache.Stats()['misses'], 3)
+
+  def test_ChangedCalleeInvalidatesCallers(self):
+    cache = import_cache.ImportCache()
+    Infer(PROGRAM, signature_cache=cache)
+    _, signatures = Infer(PROGRAM.replace('b: 2', 'b: 2, c: 3'),
+                          signature_cache=cache)
+    self.assertIn('type E(a: Num, b: Num, c: Num);', signatures)
+    self.assertEqual(cache.Stats()['hits'], 0)
+
+
+if __name__ == '__main__':
+  unittest.main()
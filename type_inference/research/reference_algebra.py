@@ -83,17 +83,33 @@ class BadType(tuple):
     return str(self)
 
 class TypeReference:
+  """Type variable, a node of a disjoint-set forest.
+
+  References that are unified form a set. Target of the root of the set is
+  the type of the set, target of any other reference is its parent. Paths
+  to the root are compressed when they are walked and smaller trees are
+  linked under larger ones, so chains of unified variables stay short.
+  """
   def __init__(self, target):
     self.target = target
+    # Upper bound on the height of the tree under this reference.
+    self.rank = 0
   
   def WeMustGoDeeper(self):
     return isinstance(self.target, TypeReference)
 
+  def Find(self):
+    """Returns root of the set, pointing references on the way to it."""
+    root = self
+    while isinstance(root.target, TypeReference):
+      root = root.target
+    node = self
+    while node is not root:
+      node.target, node = root, node.target
+    return root
+
   def Target(self):
-    result = self
-    while result.WeMustGoDeeper():
-      result = result.target
-    return result.target
+    return self.Find().target
 
   def TargetTypeClassName(self):
     target = self.Target()
@@ -115,9 +131,7 @@ class TypeReference:
     return str(self)
   
   def CloseRecord(self):
-    a = self
-    while a.WeMustGoDeeper():
-      a = a.target
+    a = self.Find()
     if isinstance(a.target, BadType):
       return
     assert isinstance(a.target, dict), a.target
@@ -225,18 +239,21 @@ def Incompatible(a, b):
   return BadType((a, b))
 
 
+def Link(a, b):
+  """Joins sets of roots a and b into a set of type of b."""
+  if a.rank > b.rank:
+    # Tree of a is higher, it becomes the root and takes the type.
+    a.target, b.target = b.target, a
+  else:
+    a.target = b
+    if a.rank == b.rank:
+      b.rank += 1
+
+
 def Unify(a, b):
   """Unifies type reference a with type reference b."""
-  original_a = a
-  original_b = b
-  while a.WeMustGoDeeper():
-    a = a.target
-  while b.WeMustGoDeeper():
-    b = b.target
-  if original_a != a:
-    original_a.target = a
-  if original_b != b:
-    original_b.target = b
+  a = a.Find()
+  b = b.Find()
   if id(a) == id(b):
     return
   assert isinstance(a, TypeReference)
@@ -252,7 +269,7 @@ def Unify(a, b):
     concrete_a, concrete_b = concrete_b, concrete_a
 
   if concrete_a == 'Any':
-    a.target = b
+    Link(a, b)
     return
   
   if concrete_a == 'Singular':
@@ -262,15 +279,15 @@ def Unify(a, b):
           Incompatible(b.target, a.target))
       return
     if concrete_b == 'Sequential':
-      a.target = b
       b.target = 'Str'
+      Link(a, b)
       return
-    a.target = b
+    Link(a, b)
     return
 
   if concrete_a == 'Sequential':
     if concrete_b in ('Str', 'Sequential') or isinstance(concrete_b, list):
-      a.target = b
+      Link(a, b)
       return
     # Type error: a is incompatible with b.
     a.target, b.target = (
@@ -349,8 +366,10 @@ def UnifyFriendlyRecords(a, b, record_type):
       a.target = Incompatible(a, b)
       b.target = Incompatible(b, a)
     result[f] = x
-  a.target = TypeReference(record_type(result))
-  b.target = a.target
+  root = TypeReference(record_type(result))
+  root.rank = max(a.rank, b.rank) + 1
+  a.target = root
+  b.target = root
 
 
 def UnifyListElement(a_list, b_element):
@@ -391,6 +410,7 @@ class TypeStructureCopier:
     if id(t) not in self.id_to_reference:
       target = self.CopyConcreteOrReferenceType(t.target)
       n = TypeReference(target)
+      n.rank = t.rank
       self.id_to_reference[id(t)] = n
     return self.id_to_reference[id(t)]
 
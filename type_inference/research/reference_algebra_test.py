@@ -0,0 +1,54 @@
+#!/usr/bin/python
+#
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unitests for reference_algebra.py."""
+
+import unittest
+
+from type_inference.research import reference_algebra
+
+
+class ReferenceAlgebraTest(unittest.TestCase):
+  def test_ChainOfUnifiedVariablesStaysShallow(self):
+    refs = [reference_algebra.TypeReference('Any') for _ in range(1000)]
+    for a, b in zip(refs, refs[1:]):
+      reference_algebra.Unify(a, b)
+    reference_algebra.Unify(refs[500], reference_algebra.TypeReference('Num'))
+    self.assertEqual({reference_algebra.VeryConcreteType(r) for r in refs},
+                     {'Num'})
+    root = refs[0].Find()
+    self.assertTrue(all(r.target is root for r in refs if r is not root))
+    self.assertLessEqual(root.rank, 10)
+
+  def test_SequentialSingularBecomesStr(self):
+    a = reference_algebra.TypeReference('Singular')
+    b = reference_algebra.TypeReference('Sequential')
+    reference_algebra.Unify(a, b)
+    self.assertEqual(reference_algebra.VeryConcreteType(a), 'Str')
+    self.assertEqual(reference_algebra.VeryConcreteType(b), 'Str')
+
+  def test_IncompatibleTypes(self):
+    a = reference_algebra.TypeReference('Any')
+    b = reference_algebra.TypeReference('Num')
+    reference_algebra.Unify(a, b)
+    reference_algebra.Unify(a, reference_algebra.TypeReference('Str'))
+    self.assertEqual(reference_algebra.VeryConcreteType(b),
+                     reference_algebra.BadType(('Num', 'Str')))
+    self.assertTrue(a.IsBadType())
+
+
+if __name__ == '__main__':
+  unittest.main()